@@ -0,0 +1,136 @@
+import os
+import time
+import threading
+
+from urlparse import urlparse, parse_qs
+from SocketServer import ThreadingMixIn
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+# 1x1 transparent gif
+PIXEL = ('GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00,'
+         '\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;')
+
+# Page served when there is no recorded page with requested name
+DEFAULT_PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>Benchmark page %(name)s</title>
+</head>
+<body>
+    %(paragraphs)s
+</body>
+</html>"""
+
+# Website tag stand-in, injected by Crawler as configuration[website]['script'].
+# Adds tag script node after preload ms, tag script emits pixels.
+INJECTED_SCRIPT = """
+setTimeout(function () {
+    var script = document.createElement('script');
+    script.src = '%(base)s/%(lookup_name)s.js?layer=%(layer)s&unit=%(unit)s&ai=%(ai)s';
+    document.body.appendChild(script);
+}, %(preload)s);
+"""
+
+# Fake tag, emits effective page view pixel (990) after layer ms and end of chain pixel (985/983) after unit ms more.
+# Pixel src are relative, so server port can't match pixel selectors.
+FAKE_TAG = """
+(function () {
+    function pixel(src) {
+        var image = document.createElement('img');
+        image.src = src;
+        document.body.appendChild(image);
+    }
+    setTimeout(function () {
+        pixel('/pixel.gif?e=990');
+        setTimeout(function () {
+            pixel('/pixel.gif?e=shown&ai=%(ai)s&uid=benchmark_unit');
+        }, %(unit)s);
+    }, %(layer)s);
+})();
+"""
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """
+        Serves recorded pages (/page/<name>?delay=<ms>), fake tag (/<name>.js) and pixels (/pixel.gif).
+        Recorded pages are read from server.pages_path directory, <name>.html.
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = dict((key, values[0]) for key, values in parse_qs(url.query).items())
+        time.sleep(int(query.get('delay', 0)) / 1000.0)
+        if url.path.startswith('/page/'):
+            self.respond('text/html', self.page(url.path[len('/page/'):]))
+        elif url.path == '/pixel.gif':
+            self.respond('image/gif', PIXEL)
+        elif url.path.endswith('.js'):
+            self.respond('application/javascript', FAKE_TAG % {'layer': int(query.get('layer', 0)),
+                                                               'unit': int(query.get('unit', 0)),
+                                                               'ai': query.get('ai', '985')})
+        else:
+            self.send_error(404)
+
+    def page(self, name):
+        if self.server.pages_path:
+            path = os.path.join(self.server.pages_path, '%s.html' % (os.path.basename(name),))
+            if os.path.isfile(path):
+                with open(path) as file_handler:
+                    return file_handler.read()
+        return DEFAULT_PAGE % {'name': name,
+                               'paragraphs': '\n    '.join('<p>Paragraph %s</p>' % index for index in xrange(200))}
+
+    def respond(self, content_type, body):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FixtureServer(object):
+    """
+        Local HTTP server with recorded pages and fake tag, running in background thread
+    """
+
+    def __init__(self, pages_path=None, host='127.0.0.1', port=0):
+        self.server = ThreadingHTTPServer((host, port), FixtureHandler)
+        self.server.pages_path = pages_path
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def base_url(self):
+        return 'http://%s:%s' % self.server.server_address
+
+    def page_url(self, name, delay=0):
+        return '%s/page/%s?delay=%s' % (self.base_url, name, delay)
+
+    def tag_script(self, lookup_name, preload, layer, unit, ai='985'):
+        """
+            Script to inject instead of real website tag
+        :param lookup_name: Tag lookup name Crawler waits for
+        :param preload: Milliseconds before tag script node appears
+        :param layer: Milliseconds between tag script execution and 990 pixel
+        :param unit: Milliseconds between 990 pixel and end of chain pixel
+        :param ai: End of chain pixel, 985 (shown) or 983 (caps)
+        """
+        return INJECTED_SCRIPT % {'base': self.base_url, 'lookup_name': lookup_name, 'preload': preload,
+                                  'layer': layer, 'unit': unit, 'ai': ai}
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,168 @@
+"""
+    Benchmark of the whole crawler pipeline without MySQL, public proxies and SMTP. Websites are served by local
+    fixture server with fake tag emitting 990 and 985/983 pixels after known delays, website source and SMTP client
+    are replaced with stubs. Real chromedriver is still required.
+
+    Usage: python -m bench.run --chromedriver /path/to/chromedriver [--sites 3 --scans 5 --timing-mode observer]
+           python -m bench.run --chromedriver /path/to/chromedriver --engine cdp --chrome-bin /path/to/chrome
+"""
+import os
+import sys
+import time
+import tempfile
+
+from argparse import ArgumentParser
+
+from bench import stubs
+from tool import crawler, providers
+from bench.fixture_server import FixtureServer
+
+
+def write_config(directory, args):
+    """
+        Writes crawler configuration for benchmark run
+    :return: Path to configuration file
+    """
+    settings = {
+        'mysql': {'user': 'benchmark', 'pass': 'benchmark', 'db': 'benchmark', 'host': '127.0.0.1', 'port': '3306'},
+        'chromedriver': {'path': args.chromedriver, 'proxy_bin': '', 'max_uses': args.max_uses, 'max_idle': 4},
+        'threshold': {'slowdown': 1.1, 'preload': 1, '990': 3, 'provider_response': 5, 'failure_rate': 0.2},
+        'logging': {'path': directory, 'loglevel': args.loglevel},
+        'loading': {'timeout_page_load': 30, 'timeout_script': args.timeout_script, 'timing_mode': args.timing_mode,
+                    'engine': args.engine},
+        'results': {'filename_pattern': os.path.join(directory, 'bench_results_{0}.csv'),
+                    'receivers': 'benchmark@localhost', 'store_path': os.path.join(directory, 'scans.sqlite'),
+                    'database': 'sqlite', 'database_path': os.path.join(directory, 'results.sqlite'), 'pool_size': 1},
+        'alerts': {'gmail_user': 'benchmark@localhost', 'gmail_password': '', 'gmail_host': '127.0.0.1',
+                   'gmail_port': 25, 'realtime': 'yes', 'batch_window': 1, 'min_interval': 5},
+        'parallel': {'workers': args.workers, 'proxy_concurrency': args.workers},
+        'statistics': {'trim': 0.1, 'bootstrap_resamples': 1000, 'confidence': 0.95},
+        'adaptive': {'enabled': 'no', 'min_scans': 5, 'max_scans': args.scans, 'ci_width': 0.1},
+        'websites': {'source': 'file', 'path': '', 'snapshot_path': '', 'snapshot_ttl': 0},
+        'capture': {'har': 'no'},
+        'cdp': {'chrome_bin': args.chrome_bin, 'concurrency': args.concurrency},
+        'history': {'enabled': 'yes', 'path': os.path.join(directory, 'history.npz'), 'baseline_runs': 10,
+                    'min_runs': 3, 'alpha': 0.01, 'min_increase': 0.1},
+        'proxies': {'probe_on_start': 'no', 'probe_url': 'http://127.0.0.1/', 'probe_timeout': 5,
+                    'probe_workers': 8, 'recheck_interval': 300},
+        'metrics': {'path': os.path.join(directory, 'metrics.txt'), 'port': 0, 'interval': 5,
+                    'profile': 'yes' if args.profile else 'no', 'profile_path': directory},
+        'queue': {'path': os.path.join(directory, 'queue.sqlite'), 'lease_timeout': 300, 'max_attempts': 3,
+                  'release_backoff': 30, 'poll_interval': 1, 'run_timeout': 0}
+    }
+    path = os.path.join(directory, 'config.ini')
+    with open(path, 'w') as file_handler:
+        for section in sorted(settings):
+            file_handler.write('[%s]\n' % (section,))
+            for key in sorted(settings[section]):
+                file_handler.write('%s = %s\n' % (key, settings[section][key]))
+            file_handler.write('\n')
+    return path
+
+
+def timing_errors(results, expected):
+    """
+        Differences between measured and injected milestone times
+    :param expected: Dictionary metric -> injected delay in seconds
+    :return: Dictionary metric -> (mean error, max absolute error, failures), errors in seconds
+    """
+    errors = {}
+    for metric in expected:
+        values = []
+        failures = 0
+        for website in results:
+            for value in results[website][metric]:
+                if metric == 'unit':
+                    value = value[1]
+                if value is None:
+                    failures += 1
+                else:
+                    values.append(value - expected[metric])
+        if values:
+            errors[metric] = (sum(values) / len(values), max(abs(value) for value in values), failures)
+        else:
+            errors[metric] = (None, None, failures)
+    return errors
+
+
+def main():
+    parser = ArgumentParser(description='Benchmarks crawler pipeline against local fixture server')
+    parser.add_argument('--chromedriver', required=True, help='path to chromedriver binary')
+    parser.add_argument('--pages', help='directory with recorded pages, <name>.html')
+    parser.add_argument('--sites', type=int, default=3, help='number of websites')
+    parser.add_argument('--scans', type=int, default=5, help='scans per website and phase')
+    parser.add_argument('--page-delay', type=int, default=100, help='server delay of page response, ms')
+    parser.add_argument('--preload', type=int, default=200, help='delay before tag script node appears, ms')
+    parser.add_argument('--layer', type=int, default=300, help='delay between tag script and 990 pixel, ms')
+    parser.add_argument('--unit', type=int, default=400, help='delay between 990 and 985 pixels, ms')
+    parser.add_argument('--timing-mode', default='polling', choices=('polling', 'observer'))
+    parser.add_argument('--timeout-script', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--engine', default='selenium', choices=('selenium', 'cdp'))
+    parser.add_argument('--chrome-bin', default='google-chrome', help='path to Chrome binary for cdp engine')
+    parser.add_argument('--concurrency', type=int, default=8, help='pages open at once with cdp engine')
+    parser.add_argument('--max-uses', type=int, default=50)
+    parser.add_argument('--profile', action='store_true', help='dump cProfile of the run into output directory')
+    parser.add_argument('--loglevel', type=int, default=30)
+    args = parser.parse_args()
+
+    server = FixtureServer(args.pages).start()
+    directory = tempfile.mkdtemp(prefix='loading_time_bench_')
+    os.environ['LOADING_TIME_CONFIG'] = write_config(directory, args)
+
+    # Fixture websites are local, no public proxy is used or probed
+    crawler.Crawler.local_geos = frozenset(crawler.PROXY_COUNTRIES)
+    crawler.Crawler.website_source = stubs.StubWebsiteSource([
+        stubs.website_row(server.page_url('site%s' % index, args.page_delay),
+                          server.tag_script(crawler.LAYER_TAG_LOOKUP_NAME, args.preload, args.layer, args.unit),
+                          args.scans)
+        for index in xrange(args.sites)])
+    crawler.Crawler.notifier = providers.EmailNotifier(crawler.config, smtp_class=stubs.SMTP)
+    crawler.Crawler.alert_notifier = providers.create_alert_notifier(crawler.config, smtp_class=stubs.SMTP)
+
+    try:
+        crawler.Crawler.initialize()
+        start_run = time.time()
+        crawler.Crawler.process()
+        run_time = time.time() - start_run
+        results = crawler.Crawler.load_results()
+    finally:
+        server.stop()
+
+    scans = sum(len(results[website]['with_tag']) + len(results[website]['without_tag']) for website in results)
+    # Time browser has to spend in pages anyway: server delay for every scan plus tag chain for with tag scans
+    busy_time = (scans * args.page_delay +
+                 sum(len(results[website]['with_tag']) for website in results) *
+                 (args.preload + args.layer + args.unit)) / 1000.0
+    pool_stats = crawler.Crawler.pool_stats
+    errors = timing_errors(results, {'preload': args.preload / 1000.0,
+                                     '990': (args.preload + args.layer) / 1000.0,
+                                     'unit': (args.preload + args.layer + args.unit) / 1000.0})
+
+    report = [
+        'Benchmark results (%s websites, %s scans, %s engine, %s timing, %s workers)' % (
+            args.sites, scans, args.engine, args.timing_mode, args.workers),
+        'End-to-end run time: %.3f sec' % (run_time,),
+        'Per-scan overhead: %.3f sec' % ((run_time - busy_time) / scans if scans else 0,),
+        'Driver startup: %s launches, %.3f sec average, %s reuses' % (
+            pool_stats['launches'], pool_stats['launch_time'] / pool_stats['launches'] if pool_stats['launches'] else 0,
+            pool_stats['reuses']),
+        'Emails sent: %s (%s alert emails)' % (len(stubs.SMTP.outbox),
+                                               len([message for message in stubs.SMTP.outbox
+                                                    if 'Loading time alert' in message[2]])),
+        'Timing accuracy against injected delays (mean error / max absolute error, ms):'
+    ]
+    for metric in ('preload', '990', 'unit'):
+        mean_error, max_error, failures = errors[metric]
+        if mean_error is None:
+            report.append('    %s: no valid measurements, %s failures' % (metric, failures))
+        else:
+            report.append('    %s: %.1f / %.1f, %s failures' % (metric, mean_error * 1000, max_error * 1000,
+                                                                failures))
+    report.append('Time per crawler phase (spans / total sec):')
+    for key, (count, total) in sorted(crawler.metrics.REGISTRY.spans.items(), key=lambda item: -item[1][1]):
+        report.append('    %s: %s / %.3f' % (dict(key)['phase'], count, total))
+    sys.stdout.write('\n'.join(report) + '\n')
+
+if __name__ == '__main__':
+    main()
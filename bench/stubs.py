@@ -0,0 +1,48 @@
+class StubWebsiteSource(object):
+    """
+        Stand-in of MySQL website source, returns website rows in the shape Crawler.get_configurations reads
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def websites(self):
+        return list(self.rows)
+
+
+class SMTP(object):
+    """
+        Stand-in of smtplib.SMTP, keeps sent messages in SMTP.outbox instead of sending them
+    """
+    outbox = []
+
+    def __init__(self, host=None, port=None):
+        self.host = host
+        self.port = port
+
+    def ehlo(self):
+        pass
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def sendmail(self, from_address, to_addresses, message):
+        SMTP.outbox.append((from_address, to_addresses, message))
+
+    def close(self):
+        pass
+
+    def quit(self):
+        pass
+
+
+def website_row(website_page, script, scans_number, geo='', is_layer=True):
+    """
+        Row of websites table as returned by website source. Crawler.get_configurations subtracts 5 from
+        scans_number, so it's added here.
+    """
+    return {'website_page': website_page, 'website_tag': script, 'scans_number': scans_number + 5, 'geo': geo,
+            'is_layer': is_layer}
@@ -1,9 +1,29 @@
+from argparse import ArgumentParser
+
 from tool.crawler import Crawler
 
 
 def main():
+    parser = ArgumentParser(description='Measures page loading time with/without tag')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue the last unfinished run, skipping scans which are already stored')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--coordinator', action='store_true',
+                      help='queue scans of the run for worker nodes and merge their measures into results')
+    mode.add_argument('--worker', metavar='WORKER_ID', help='run scans leased from the queue as worker node WORKER_ID')
+    parser.add_argument('--geos', help='comma separated countries worker node leases scans of, all by default')
+    parser.add_argument('--local-geos', default='',
+                        help='comma separated countries worker node is placed in, they are scanned without proxy')
+    parser.add_argument('--exit-when-idle', action='store_true', help='stop worker node once there is nothing to lease')
+    args = parser.parse_args()
+    if args.worker:
+        Crawler.local_geos = set(filter(None, args.local_geos.split(',')))
+        Crawler.initialize(worker=True)
+        Crawler.work(args.worker, geos=args.geos.split(',') if args.geos else None,
+                     exit_when_idle=args.exit_when_idle)
+        return
     Crawler.initialize()
-    Crawler.process()
+    Crawler.process(resume=args.resume, distributed=args.coordinator)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,75 @@
+import time
+import email
+import unittest
+
+from tool import alerts
+
+
+class RecordingSMTP(object):
+    """
+        Stand-in of logged in SMTP connection, keeps sent messages
+    """
+
+    def __init__(self, outbox):
+        self.outbox = outbox
+
+    def sendmail(self, sender, receivers, message):
+        self.outbox.append(message)
+
+    def quit(self):
+        pass
+
+
+class AlertNotifierTest(unittest.TestCase):
+    def setUp(self):
+        self.outbox = []
+        self.connections = 0
+
+    def connect(self):
+        self.connections += 1
+        return RecordingSMTP(self.outbox)
+
+    def notifier(self, batch_window, min_interval):
+        notifier = alerts.AlertNotifier(self.connect, 'crawler@localhost', ['team@localhost'], batch_window,
+                                        min_interval)
+        notifier.start()
+        return notifier
+
+    def test_burst_is_one_email(self):
+        notifier = self.notifier(batch_window=0.5, min_interval=0)
+        for website in ('a', 'b', 'c'):
+            notifier.alert('%s: slowdown' % (website,))
+        notifier.stop()
+        self.assertEqual(len(self.outbox), 1)
+        self.assertIn('3 website(s)', self.outbox[0])
+        body = email.message_from_string(self.outbox[0]).get_payload(decode=True)
+        self.assertEqual(body.splitlines(), ['a: slowdown', 'b: slowdown', 'c: slowdown'])
+
+    def test_emails_are_rate_limited_and_reuse_connection(self):
+        notifier = self.notifier(batch_window=0, min_interval=0.5)
+        notifier.alert('a: slowdown')
+        time.sleep(0.2)
+        notifier.alert('b: slowdown')
+        notifier.alert('c: slowdown')
+        time.sleep(0.8)
+        notifier.stop()
+        self.assertEqual(len(self.outbox), 2)
+        self.assertIn('1 website(s)', self.outbox[0])
+        self.assertIn('2 website(s)', self.outbox[1])
+        self.assertEqual(self.connections, 1)
+
+    def test_stop_sends_queued_alerts(self):
+        notifier = self.notifier(batch_window=60, min_interval=60)
+        notifier.alert('a: slowdown')
+        notifier.stop()
+        self.assertEqual(len(self.outbox), 1)
+
+    def test_full_queue_drops_alert(self):
+        notifier = alerts.AlertNotifier(self.connect, 'crawler@localhost', ['team@localhost'], 0, 0, queue_size=1)
+        notifier.alert('a: slowdown')
+        notifier.alert('b: slowdown')
+        self.assertEqual(notifier.queue.qsize(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
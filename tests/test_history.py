@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tool import history
+
+SAMPLE_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          'loading_results_2017-05-18 13:31:06.csv')
+TIMED_OUT_WEBSITE = ('http://esportes.r7.com/futebol/suspeitas-de-corrupcao-rondam-o-estadio-itaquerao-a-nova-casa-do-'
+                     'corinthians-15052017')
+
+
+class HistoryImportTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'history.npz')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_read_csv_maps_failed_values_to_none(self):
+        measures = history.read_csv(SAMPLE_CSV)
+        self.assertEqual(len(measures), 10)
+        self.assertEqual(measures[TIMED_OUT_WEBSITE]['with_tag'], [None] * 9)
+        self.assertTrue(all(value is not None for value in measures[TIMED_OUT_WEBSITE]['without_tag']))
+        self.assertEqual(history.csv_value(''), None)
+        self.assertEqual(history.csv_value('1.5'), 1.5)
+
+    def test_import_is_idempotent(self):
+        store = history.HistoryStore(self.path)
+        self.assertEqual(history.import_csv(store, [SAMPLE_CSV]), 1)
+        values = len(store.value)
+        self.assertTrue(values)
+        # Failed (100) values aren't kept
+        self.assertFalse((store.value == history.CSV_FAILED).any())
+
+        reopened = history.HistoryStore(self.path)
+        self.assertEqual(history.import_csv(reopened, [SAMPLE_CSV]), 0)
+        self.assertEqual(len(reopened.sources), 1)
+        self.assertEqual(len(reopened.value), values)
+        self.assertEqual(len(reopened.websites), 10)
+        self.assertEqual(reopened.run_times[0], history.csv_run_time(SAMPLE_CSV))
+
+    def test_baseline_runs_are_ordered_by_time(self):
+        store = history.HistoryStore(self.path)
+        store.add_run('late', 200.0, {'site': {'with_tag': [3.0], 'without_tag': [1.0]}}, save=False)
+        store.add_run('early', 100.0, {'site': {'with_tag': [9.0], 'without_tag': [1.0]}}, save=False)
+        values, runs = store.added_latency('site', 1)
+        self.assertEqual(runs, 1)
+        self.assertEqual(list(values), [2.0])
+
+
+class RegressionTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = history.HistoryStore(os.path.join(self.directory, 'history.npz'))
+        for run in xrange(5):
+            self.store.add_run('run %s' % (run,), 1000.0 + run,
+                               {'site': {'with_tag': [1.5 + 0.01 * scan for scan in xrange(10)],
+                                         'without_tag': [1.0] * 10}}, save=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def regression(self, added_latency, min_increase):
+        return history.regression(self.store, 'site', [1.0 + added_latency + 0.01 * scan for scan in xrange(10)],
+                                  [1.0] * 10, baseline_runs=5, min_runs=3, alpha=0.01, min_increase=min_increase)
+
+    def test_real_increase_is_flagged(self):
+        result = self.regression(1.5, min_increase=0.1)
+        self.assertTrue(result['regression'])
+        self.assertLess(result['p_value'], 0.01)
+        self.assertEqual(result['baseline_runs'], 5)
+        self.assertGreater(result['current_median'], result['baseline_median'])
+
+    def test_increase_below_min_increase_is_ignored(self):
+        result = self.regression(0.55, min_increase=0.1)
+        self.assertLess(result['p_value'], 0.01)
+        self.assertFalse(result['regression'])
+
+    def test_not_enough_history(self):
+        self.assertIsNone(history.regression(self.store, 'site', [2.0], [1.0], baseline_runs=5, min_runs=6,
+                                             alpha=0.01, min_increase=0.1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from tool import result_database
+
+
+class RecordingSink(object):
+    """
+        Stand-in of csv sink, keeps stored results
+    """
+
+    def __init__(self):
+        self.stored = []
+
+    def store(self, results, scan_run_id=None):
+        self.stored.append((results, scan_run_id))
+        return 'results.csv'
+
+
+def website(position, scans=3):
+    return {'with_tag': [2.0] * scans, 'without_tag': [1.0] * (scans - 1) + [None], 'preload': [0.1] * scans,
+            '990': [0.5] * scans, 'layer': [0.3] * scans, 'unit': [('unit-1', 0.7)] * scans, 'scans_used': scans,
+            'position': position, 'average_with_tag': 2.0, 'average_without_tag': 1.0, 'slowdown': 2.0,
+            'slowdown_interval': (1.8, 2.2), 'breaches': ['slowdown']}
+
+
+class DatabaseResultSinkTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'results.sqlite')
+        self.pool = result_database.sqlite_pool(self.path)
+        self.csv_sink = RecordingSink()
+        self.sink = result_database.DatabaseResultSink(self.csv_sink, self.pool, 'sqlite', batch_size=2)
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.directory)
+
+    def query(self, statement):
+        connection = sqlite3.connect(self.path)
+        try:
+            return connection.execute(statement).fetchall()
+        finally:
+            connection.close()
+
+    def test_store_writes_runs_scans_and_aggregates(self):
+        results = {'ok': website(True), 'wrong': website((False, 'Tag is located in <head>')),
+                   'unchecked': website(False)}
+        self.assertEqual(self.sink.store(results, scan_run_id=7), 'results.csv')
+        self.assertEqual(self.csv_sink.stored, [(results, 7)])
+
+        runs = self.query('SELECT id, scan_run_id FROM loading_time_runs')
+        self.assertEqual(runs, [(1, 7)])
+        scans = self.query('SELECT website, scan_index, with_tag, unit_id, without_tag FROM loading_time_scans '
+                           'WHERE website = "ok" ORDER BY scan_index')
+        self.assertEqual(scans, [('ok', 0, 2.0, 'unit-1', 1.0), ('ok', 1, 2.0, 'unit-1', 1.0),
+                                 ('ok', 2, 2.0, 'unit-1', None)])
+        self.assertEqual(self.query('SELECT COUNT(*) FROM loading_time_scans'), [(9,)])
+        aggregates = dict((row[0], row[1:]) for row in self.query(
+            'SELECT website, scans_used, slowdown_low, slowdown_high, position_ok, breaches '
+            'FROM loading_time_results'))
+        self.assertEqual(aggregates['ok'], (3, 1.8, 2.2, 1, '["slowdown"]'))
+        self.assertEqual(aggregates['wrong'][3], 0)
+        self.assertIsNone(aggregates['unchecked'][3])
+
+    def test_pool_reuses_connection_between_runs(self):
+        connections = []
+        connect = self.pool.connect
+
+        def counting_connect():
+            connections.append(connect())
+            return connections[-1]
+        self.pool.connect = counting_connect
+        self.sink.store({'ok': website(True)}, scan_run_id=1)
+        self.sink.store({'ok': website(True)}, scan_run_id=2)
+        self.assertEqual(len(connections), 1)
+        self.assertEqual(self.query('SELECT id, scan_run_id FROM loading_time_runs'), [(1, 1), (2, 2)])
+
+    def test_failed_work_is_rolled_back(self):
+        def failing(cursor):
+            cursor.execute('INSERT INTO things VALUES (1)')
+            raise ValueError('failed')
+        self.pool.run(lambda cursor: cursor.execute('CREATE TABLE things (id INTEGER)'))
+        self.assertRaises(ValueError, self.pool.run, failing)
+        self.assertEqual(self.query('SELECT COUNT(*) FROM things'), [(0,)])
+
+
+if __name__ == '__main__':
+    unittest.main()
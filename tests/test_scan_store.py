@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tool.scan_store import ScanStore
+
+
+class ScanStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'scans.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_resumed_run_has_only_missing_scans_pending(self):
+        store = ScanStore(self.path)
+        run_id = store.start_run()
+        for scan_index in (0, 1, 3):
+            store.add_scan(run_id, 'site', 'with_tag', scan_index, {'with_tag': 2.0 + scan_index})
+        store.add_scan(run_id, 'site', 'without_tag', 0, {'without_tag': None})
+        # Crawler crashed, the run is continued by a new process
+        store.connection.close()
+
+        store = ScanStore(self.path)
+        self.assertEqual(store.start_run(resume=True), run_id)
+        self.assertEqual(store.pending_scans(run_id, 'site', 'with_tag', 5), [2, 4])
+        self.assertEqual(store.pending_scans(run_id, 'site', 'without_tag', 5), [1, 2, 3, 4])
+        self.assertEqual(store.pending_scans(run_id, 'other', 'with_tag', 2), [0, 1])
+        self.assertEqual([scan['with_tag'] for scan in store.scans(run_id, 'site', 'with_tag')], [2.0, 3.0, 5.0])
+        self.assertEqual(store.scans(run_id, 'site', 'without_tag'), [{'without_tag': None}])
+
+    def test_rescan_replaces_stored_scan(self):
+        store = ScanStore(self.path)
+        run_id = store.start_run()
+        store.add_scan(run_id, 'site', 'with_tag', 0, {'with_tag': None})
+        store.add_scan(run_id, 'site', 'with_tag', 0, {'with_tag': 2.0})
+        self.assertEqual(store.scans(run_id, 'site', 'with_tag'), [{'with_tag': 2.0}])
+
+    def test_finished_run_is_not_resumed(self):
+        store = ScanStore(self.path)
+        run_id = store.start_run()
+        store.add_scan(run_id, 'site', 'with_tag', 0, {'with_tag': 2.0})
+        store.finish_run(run_id)
+        resumed = store.start_run(resume=True)
+        self.assertNotEqual(resumed, run_id)
+        self.assertEqual(store.pending_scans(resumed, 'site', 'with_tag', 2), [0, 1])
+        self.assertEqual(store.start_run(resume=True), resumed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+
+import numpy
+
+from tool import stats
+
+THRESHOLDS = {'slowdown': 1.1, 'preload': 1, '990': 3, 'provider_response': 5, 'failure_rate': 0.2}
+
+
+def website(with_tag, without_tag):
+    """
+        Results entry of a website in the shape Crawler.load_results produces
+    """
+    scans = len(with_tag)
+    return {'with_tag': with_tag, 'without_tag': without_tag, 'preload': [0.1] * scans, 'layer': [0.5] * scans,
+            '990': [1.0] * scans, 'unit': [('unit', 0.5)] * scans}
+
+
+class SummarizeTest(unittest.TestCase):
+    def test_trimmed_mean_drops_outliers(self):
+        results = {'site': website([2.0, 2.0, 2.0, 2.0, 2.0, 2.0, 2.0, 2.0, 2.0, 50.0], [1.0] * 10)}
+        stats.summarize(results, THRESHOLDS, trim=0.1, resamples=200, seed=1)
+        entry = results['site']
+        self.assertAlmostEqual(entry['trimmed_with_tag'], 2.0)
+        self.assertAlmostEqual(entry['average_with_tag'], 6.8)
+        self.assertAlmostEqual(entry['max_with_tag'], 50.0)
+        self.assertAlmostEqual(entry['slowdown'], 2.0)
+
+    def test_failed_scans_are_counted(self):
+        results = {'site': website([2.0, None, 2.0, None], [1.0, 1.0, 1.0, 1.0])}
+        stats.summarize(results, THRESHOLDS, resamples=200, seed=1)
+        entry = results['site']
+        self.assertEqual(entry['failures_with_tag'], 2)
+        self.assertEqual(entry['failures_without_tag'], 0)
+        self.assertAlmostEqual(entry['failure_rate'], 0.25)
+        self.assertIn('failure_rate', entry['breaches'])
+
+    def test_slowdown_interval_contains_slowdown(self):
+        results = {'site': website([2.0, 2.1, 1.9, 2.2, 1.8, 2.0], [1.0, 1.1, 0.9, 1.0, 1.05, 0.95])}
+        stats.summarize(results, THRESHOLDS, resamples=500, seed=1)
+        entry = results['site']
+        low, high = entry['slowdown_interval']
+        self.assertLessEqual(low, entry['slowdown'])
+        self.assertGreaterEqual(high, entry['slowdown'])
+        self.assertIn('slowdown', entry['breaches'])
+
+    def test_timed_out_without_tag_scans_do_not_lower_slowdown(self):
+        loaded = {'site': website([2.0] * 10, [1.0] * 10)}
+        stats.summarize(loaded, THRESHOLDS, resamples=200, seed=1)
+        # Timed out scans without tag are failures (None), not samples of timeout_page_load length
+        timed_out = {'some': website([2.0] * 10, [1.0] * 7 + [None] * 3), 'all': website([2.0] * 10, [None] * 10)}
+        stats.summarize(timed_out, THRESHOLDS, resamples=200, seed=1)
+        self.assertAlmostEqual(timed_out['some']['slowdown'], loaded['site']['slowdown'])
+        self.assertEqual(timed_out['some']['slowdown_interval'], loaded['site']['slowdown_interval'])
+        self.assertIsNone(timed_out['all']['slowdown'])
+        self.assertAlmostEqual(timed_out['all']['failure_rate'], 0.5)
+        self.assertIn('failure_rate', timed_out['all']['breaches'])
+
+    def test_website_without_valid_scans(self):
+        results = {'broken': website([None, None], [None, None]), 'site': website([1.0, 1.0], [1.0, 1.0])}
+        stats.summarize(results, THRESHOLDS, resamples=100, seed=1)
+        self.assertIsNone(results['broken']['slowdown'])
+        self.assertEqual(results['broken']['slowdown_interval'], (None, None))
+        self.assertAlmostEqual(results['site']['slowdown'], 1.0)
+        self.assertEqual(results['site']['breaches'], [])
+
+    def test_chunked_bootstrap_resamples_every_row(self):
+        matrix, counts, _ = stats.to_matrix([[1.0, 2.0, 3.0, 4.0], [5.0, 6.0, None]])
+        chunk = stats.BOOTSTRAP_CHUNK
+        try:
+            stats.BOOTSTRAP_CHUNK = 8
+            chunked = stats.bootstrap_means(matrix, counts, 50, numpy.random.RandomState(3), trim=0.25)
+        finally:
+            stats.BOOTSTRAP_CHUNK = chunk
+        self.assertEqual(chunked.shape, (2, 50))
+        self.assertTrue((chunked[0] >= 1.0).all() and (chunked[0] <= 4.0).all())
+        self.assertTrue((chunked[1] >= 5.0).all() and (chunked[1] <= 6.0).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
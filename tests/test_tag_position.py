@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from tool import tag_position
+
+TAG = '<script async src="//tag.imonomy.com/script/preload.js"></script>'
+
+
+def position(html, chunk_size=None):
+    parser = tag_position.PositionParser()
+    if chunk_size:
+        for start in xrange(0, len(html), chunk_size):
+            parser.feed(html[start:start + chunk_size])
+    else:
+        parser.feed(html)
+    return parser.result()
+
+
+def body_position(depth, index, count):
+    return {'location': 'body', 'depth': depth, 'index': index, 'count': count, 'async': False, 'defer': False}
+
+
+class VerdictTest(unittest.TestCase):
+    def test_unchecked_position(self):
+        self.assertEqual(tag_position.verdict(None), (False, "Position of the tag couldn't be checked"))
+
+    def test_tag_in_head(self):
+        self.assertEqual(tag_position.verdict({'location': 'head'}), (False, "Tag is located in <head>"))
+
+    def test_nested_tag(self):
+        self.assertEqual(tag_position.verdict(body_position(2, 9, 10)),
+                         (False, "Tag is located in one of <body></body> children."))
+
+    def test_tag_early_in_body(self):
+        self.assertEqual(tag_position.verdict(body_position(1, 6, 10)),
+                         (False, "Tag isn't located in the last 30% of <body>"))
+
+    def test_tag_at_end_of_body(self):
+        self.assertIs(tag_position.verdict(body_position(1, 7, 10)), True)
+
+
+class PositionParserTest(unittest.TestCase):
+    def test_tag_in_head(self):
+        result = position('<html><head><script defer src="/preload-head.js"></script></head><body></body></html>')
+        self.assertEqual(result['location'], 'head')
+        self.assertTrue(result['defer'])
+
+    def test_tag_at_end_of_body(self):
+        result = position('<html><head></head><body><div>a</div>text<!-- c --><img src="x.png">%s</body></html>' %
+                          (TAG,))
+        self.assertEqual(result, {'location': 'body', 'depth': 1, 'index': 4, 'count': 5, 'async': True,
+                                  'defer': False})
+        self.assertIs(tag_position.verdict(result), True)
+
+    def test_unclosed_paragraphs_are_siblings(self):
+        result = position('<body><p>first<p>second</p><div>block</div>%s</body>' % (TAG,))
+        self.assertEqual((result['depth'], result['index'], result['count']), (1, 3, 4))
+        self.assertIs(tag_position.verdict(result), True)
+
+    def test_block_ends_paragraph(self):
+        result = position('<body><p>text<ul><li>item</ul>%s</body>' % (TAG,))
+        self.assertEqual((result['depth'], result['index'], result['count']), (1, 2, 3))
+
+    def test_unclosed_list_items_are_siblings(self):
+        result = position('<body><ul><li>first<li><p>second<li>%s</ul></body>' % (TAG,))
+        self.assertEqual(result['depth'], 3)
+
+    def test_nested_list_keeps_outer_item_open(self):
+        result = position('<body><ul><li>outer<ul><li>inner<li>%s</ul></ul></body>' % (TAG,))
+        self.assertEqual(result['depth'], 5)
+
+    def test_table_cells_and_implied_tbody(self):
+        result = position('<body><table><tr><td>a<td>b<tr><td>%s</table></body>' % (TAG,))
+        self.assertEqual(result['depth'], 5)
+        self.assertEqual(result['count'], 1)
+
+    def test_chunked_feed(self):
+        html = '<body>%s<p>a<p>b<ul><li>c<li>d</ul>%s</body>' % ('<div>x</div>' * 50, TAG)
+        self.assertEqual(position(html, chunk_size=7), position(html))
+        self.assertEqual(position(html)['count'], 54)
+
+
+class CheckFileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_missing_tag(self):
+        path = os.path.join(self.directory, 'page.html')
+        with open(path, 'w') as file_handler:
+            file_handler.write('<body><p>no tag</body>')
+        self.assertEqual(tag_position.check_file(path), {'location': 'missing'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from tool.work_queue import WorkQueue, DONE, FAILED, LEASED
+
+
+def items(website, count):
+    return [{'website': website, 'phase': 'with_tag', 'scan_index': index, 'configuration': {'geo': 'US'},
+             'check_position': False} for index in xrange(count)]
+
+
+class WorkQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.queue = WorkQueue(os.path.join(self.directory, 'queue.sqlite'), lease_timeout=60, max_attempts=2,
+                               release_backoff=60)
+
+    def tearDown(self):
+        self.queue.connection.close()
+        shutil.rmtree(self.directory)
+
+    def test_lease_and_complete(self):
+        self.queue.enqueue(1, items('site', 2))
+        first = self.queue.lease('worker-1')
+        second = self.queue.lease('worker-2')
+        self.assertEqual((first['scan_index'], second['scan_index']), (0, 1))
+        self.assertIsNone(self.queue.lease('worker-3'))
+        self.assertTrue(self.queue.complete(first, {'with_tag': 1.5}))
+        self.assertEqual(self.queue.done_items(1), [('site', 'with_tag', 0, {'with_tag': 1.5})])
+        self.assertEqual(self.queue.unfinished(1), 1)
+
+    def test_lease_filters_countries(self):
+        self.queue.enqueue(1, items('site', 1))
+        self.assertIsNone(self.queue.lease('worker-1', geos=['DE']))
+        self.assertEqual(self.queue.lease('worker-1', geos=['US'])['website'], 'site')
+
+    def test_expired_lease_is_taken_over(self):
+        self.queue.lease_timeout = -1
+        self.queue.enqueue(1, items('site', 1))
+        crashed = self.queue.lease('worker-1')
+        taken = self.queue.lease('worker-2')
+        self.assertEqual(taken['scan_index'], crashed['scan_index'])
+        self.assertFalse(self.queue.complete(crashed, {}))
+        self.assertTrue(self.queue.complete(taken, {}))
+
+    def test_released_item_waits_for_backoff(self):
+        self.queue.enqueue(1, items('site', 1))
+        self.queue.release(self.queue.lease('worker-1'))
+        self.assertIsNone(self.queue.lease('worker-1'))
+        self.queue.connection.execute('UPDATE work_items SET lease_expires = ?', (time.time() - 1,))
+        self.assertEqual(self.queue.lease('worker-2')['worker'], 'worker-2')
+
+    def test_exhausted_item_is_reaped_and_queued_again_on_resume(self):
+        self.queue.lease_timeout = -1
+        self.queue.enqueue(1, items('site', 1))
+        self.queue.lease('worker-1')
+        self.queue.lease('worker-2')
+        self.assertEqual(self.queue.counts(1), {LEASED: 1})
+        self.assertEqual(self.queue.reap(1), 1)
+        self.assertEqual(self.queue.failed_items(1), [('site', 'with_tag', 0)])
+        self.assertEqual(self.queue.unfinished(1), 0)
+        self.queue.enqueue(1, items('site', 1))
+        self.assertEqual(self.queue.unfinished(1), 1)
+        self.assertIsNotNone(self.queue.lease('worker-3'))
+
+    def test_give_up(self):
+        self.queue.enqueue(1, items('site', 3))
+        self.queue.complete(self.queue.lease('worker-1'), {})
+        self.queue.lease('worker-1')
+        self.assertEqual(self.queue.give_up(1), 2)
+        self.assertEqual(self.queue.counts(1), {DONE: 1, FAILED: 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+"""
+    Real-time threshold alerts. Every website is checked as soon as its scans are done and its breaches are queued to
+    background notifier, which batches them into one email, keeps SMTP connection open between emails and rate limits
+    them. Scanning never waits for SMTP: a full queue drops the alert instead.
+"""
+import time
+import Queue
+import socket
+import smtplib
+import threading
+
+from datetime import datetime
+from logging import getLogger
+from email.mime.text import MIMEText
+
+import metrics
+
+log = getLogger('crawler')
+
+# Sentinel, which tells notifier thread to send what's queued and exit
+STOP = object()
+
+
+def describe_breaches(website, entry, thresholds):
+    """
+        One line description of threshold breaches of website
+    :param entry: Results entry of website (see stats.summarize)
+    :param thresholds: Dictionary of slowdown, preload, 990, provider_response and failure_rate thresholds
+    """
+    descriptions = []
+    for breach in entry['breaches']:
+        if breach == 'slowdown':
+            descriptions.append('slowdown %.1f%% (threshold %.1f%%)' % (entry['slowdown'] * 100,
+                                                                        thresholds['slowdown'] * 100))
+        elif breach == 'preload':
+            descriptions.append('preload %.3f sec (threshold %s sec)' % (entry['trimmed_preload'],
+                                                                         thresholds['preload']))
+        elif breach == '990':
+            descriptions.append('990 %.3f sec (threshold %s sec)' % (entry['trimmed_990'], thresholds['990']))
+        elif breach == 'provider_response':
+            descriptions.append('provider response %.3f sec (threshold %s sec)' % (entry['trimmed_unit'],
+                                                                                   thresholds['provider_response']))
+        elif breach == 'failure_rate':
+            descriptions.append('failed page loads %.1f%% (threshold %.1f%%)' % (
+                entry['failure_rate'] * 100, thresholds['failure_rate'] * 100))
+        elif breach == 'regression':
+            descriptions.append('added latency grew from %.3f to %.3f sec (p = %.4f)' % (
+                entry['regression']['baseline_median'], entry['regression']['current_median'],
+                entry['regression']['p_value']))
+    return '%s: %s' % (website, '; '.join(descriptions))
+
+
+class AlertNotifier(object):
+    """
+        Sends queued alerts from a daemon thread. Alerts arriving within batch_window seconds of the first one go out
+        in one email, emails are at least min_interval seconds apart, so a burst of breaches is one email.
+    """
+
+    def __init__(self, connect, sender, receivers, batch_window, min_interval, queue_size=1000):
+        """
+        :param connect: Callable, which returns logged in SMTP connection
+        :param sender: From address
+        :param receivers: List of receiver addresses
+        :param batch_window: Seconds alerts are collected before email is sent
+        :param min_interval: Minimum seconds between two alert emails
+        :param queue_size: Maximum number of queued alerts
+        """
+        self.connect = connect
+        self.sender = sender
+        self.receivers = receivers
+        self.batch_window = batch_window
+        self.min_interval = min_interval
+        self.queue = Queue.Queue(queue_size)
+        self.connection = None
+        self.last_sent = 0.0
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='alert-notifier')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def alert(self, message):
+        """
+            Queues alert without waiting
+        :param message: Alert line, see describe_breaches
+        """
+        try:
+            self.queue.put_nowait(message)
+        except Queue.Full:
+            log.error('Alert queue is full, dropping alert: %s' % (message,))
+            metrics.increment('crawler_alerts_dropped')
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            message = self.queue.get()
+            if message is STOP:
+                break
+            batch = [message]
+            deadline = max(time.time() + self.batch_window, self.last_sent + self.min_interval)
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    message = self.queue.get(timeout=remaining)
+                except Queue.Empty:
+                    break
+                if message is STOP:
+                    stopping = True
+                    break
+                batch.append(message)
+            try:
+                self.send(batch)
+            except Exception as e:
+                log.exception('Failed to send alert email. Error: %s' % (e,))
+        self.close()
+
+    def send(self, batch):
+        """
+            Sends batch of alerts in one email, lost connection is reopened once
+        """
+        msg = MIMEText('\n'.join(batch), 'plain', _charset='utf-8')
+        msg['Subject'] = 'Loading time alert: %s website(s) over threshold on %s' % (
+            len(batch), datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        msg['From'] = self.sender
+        msg['To'] = ', '.join(self.receivers)
+        for attempt in xrange(2):
+            try:
+                if self.connection is None:
+                    self.connection = self.connect()
+                with metrics.span('alert_email'):
+                    self.connection.sendmail(self.sender, self.receivers, msg.as_string())
+                metrics.increment('crawler_alerts', amount=len(batch))
+                log.info('Sent alert email with %s alert(s)' % (len(batch),))
+                break
+            except (smtplib.SMTPServerDisconnected, socket.error) as e:
+                self.connection = None
+                if attempt:
+                    log.error('Failed to send alert email. Error: %s' % (e,))
+            except smtplib.SMTPException as e:
+                log.error('Failed to send alert email. Error: %s' % (e,))
+                break
+        self.last_sent = time.time()
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.quit()
+            except (smtplib.SMTPException, socket.error):
+                pass
+            self.connection = None
+
+    def stop(self):
+        """
+            Sends queued alerts right away and stops notifier thread
+        """
+        if self.thread is None:
+            return
+        self.queue.put(STOP)
+        self.thread.join()
+        self.thread = None
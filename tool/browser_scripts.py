@@ -0,0 +1,169 @@
+import json
+
+# JavaScript snippets executed inside the browser by Crawler
+
+# Fields of navigation and tag_resources returned by COLLECT_PAGE_TIMING
+NAVIGATION_FIELDS = ('dns', 'connect', 'ttfb', 'dom_content_loaded', 'load')
+TAG_RESOURCE_FIELDS = ('requests', 'bytes', 'duration', 'script_time')
+
+# Records performance.now() timestamps of tag milestones as soon as they appear in DOM:
+# tag - tag script node, 990 - effective page view pixel, unit - end of chain pixel (985 shown / 983 caps).
+# Has to be executed together with tag script, arguments[0] is tag lookup name.
+INSTALL_TIMING_OBSERVER = """
+(function (tagLookupName) {
+    // Epoch milliseconds of navigation start, so with_tag can be measured from the same origin as in polling mode
+    var marks = {
+        inject: performance.now(),
+        navigation_start: performance.timeOrigin || performance.timing.navigationStart
+    };
+    var selectors = {
+        'tag': "script[src*='" + tagLookupName + "']",
+        '990': "img[src*='990']",
+        'unit': "img[src*='ai=985'], img[src*='ai=983']"
+    };
+    var listeners = [];
+    var observer = new MutationObserver(check);
+
+    function check() {
+        for (var name in selectors) {
+            if (marks[name] === undefined) {
+                var node = document.querySelector(selectors[name]);
+                if (node) {
+                    marks[name] = performance.now();
+                    if (name === 'unit') {
+                        marks.unit_src = node.src;
+                    }
+                }
+            }
+        }
+        if (marks['990'] !== undefined && marks.unit !== undefined) {
+            observer.disconnect();
+            while (listeners.length) {
+                listeners.shift()(marks);
+            }
+        }
+    }
+
+    window.__loadingTimeMarks = {marks: marks, listeners: listeners};
+    observer.observe(document, {childList: true, subtree: true, attributes: true, attributeFilter: ['src']});
+    check();
+})(arguments[0]);
+"""
+
+# Asynchronous script, returns timing marks once chain ends or after arguments[0] milliseconds since injection
+COLLECT_TIMING_MARKS = """
+var timeout = arguments[0];
+var callback = arguments[arguments.length - 1];
+var state = window.__loadingTimeMarks;
+var done = false;
+
+function finish() {
+    if (!done) {
+        done = true;
+        callback(state.marks);
+    }
+}
+
+if (state.marks['990'] !== undefined && state.marks.unit !== undefined) {
+    finish();
+} else {
+    state.listeners.push(finish);
+    setTimeout(finish, Math.max(0, timeout - (performance.now() - state.marks.inject)));
+}
+"""
+
+# Returns Navigation Timing of the loaded page (seconds since navigation start, dns/connect/ttfb are durations)
+# and Resource Timing summary of requests which url contains arguments[0] (imonomy tag host).
+# Sizes of cross-origin resources are only known when server sends Timing-Allow-Origin header.
+COLLECT_PAGE_TIMING = """
+var tagHost = arguments[0];
+var navigation = performance.getEntriesByType ? performance.getEntriesByType('navigation')[0] : null;
+var start = 0;
+if (!navigation) {
+    navigation = performance.timing;
+    start = navigation.navigationStart;
+}
+
+function since(value) {
+    return value ? (value - start) / 1000 : null;
+}
+
+var resources = {requests: 0, bytes: 0, duration: 0, script_time: 0};
+var entries = performance.getEntriesByType ? performance.getEntriesByType('resource') : [];
+for (var i = 0; i < entries.length; i++) {
+    if (entries[i].name.indexOf(tagHost) === -1) {
+        continue;
+    }
+    resources.requests += 1;
+    resources.bytes += entries[i].transferSize || entries[i].encodedBodySize || 0;
+    resources.duration += entries[i].duration / 1000;
+    if (entries[i].initiatorType === 'script') {
+        resources.script_time += entries[i].duration / 1000;
+    }
+}
+
+return {
+    navigation: {
+        dns: (navigation.domainLookupEnd - navigation.domainLookupStart) / 1000,
+        connect: (navigation.connectEnd - navigation.connectStart) / 1000,
+        ttfb: navigation.responseStart ? (navigation.responseStart - navigation.requestStart) / 1000 : null,
+        dom_content_loaded: since(navigation.domContentLoadedEventEnd),
+        load: since(navigation.loadEventEnd)
+    },
+    tag_resources: resources
+};
+"""
+
+
+# Finds imonomy tag the same way as tag_position.PositionParser: element with src containing 'preload' in <head> or
+# 'preload.js' in <body>. Returns its location (head, body or missing), depth (1 for direct child of <body>), index
+# of the <body> node containing it, number of <body> nodes and whenever it's async/defer.
+TAG_POSITION = """
+function find(root, src) {
+    var nodes = root ? root.querySelectorAll('[src]') : [];
+    for (var i = 0; i < nodes.length; i++) {
+        if (nodes[i].getAttribute('src').indexOf(src) !== -1) {
+            return nodes[i];
+        }
+    }
+    return null;
+}
+
+var location = 'head';
+var tag = find(document.head, 'preload');
+if (!tag) {
+    location = 'body';
+    tag = find(document.body, 'preload.js');
+}
+if (!tag) {
+    return {location: 'missing'};
+}
+var position = {location: location, depth: null, index: null, count: null,
+                async: tag.hasAttribute('async'), defer: tag.hasAttribute('defer')};
+if (location === 'body') {
+    var node = tag;
+    position.depth = 1;
+    while (node.parentNode !== document.body) {
+        node = node.parentNode;
+        position.depth += 1;
+    }
+    position.index = Array.prototype.indexOf.call(document.body.childNodes, node);
+    position.count = document.body.childNodes.length;
+}
+return position;
+"""
+
+
+def as_expression(script, *arguments):
+    """
+        Wraps script written for WebDriver execute_script (function body using arguments and return) into expression
+        for DevTools Runtime.evaluate
+    """
+    return '(function () {\n%s\n}).apply(null, %s)' % (script, json.dumps(arguments))
+
+
+def with_inject_time(script):
+    """
+        Body of function, which runs tag script and returns Date.now() of the moment it was injected
+    """
+    return 'var inject = Date.now();\n(function () {\n%s\n})();\nreturn inject;' % (script,)
@@ -0,0 +1,338 @@
+import json
+import time
+import shutil
+import socket
+import tempfile
+import subprocess
+
+from logging import getLogger
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.concurrent import Future
+from tornado.websocket import websocket_connect
+from tornado.httpclient import AsyncHTTPClient, HTTPError
+
+log = getLogger('crawler')
+
+
+class DevToolsError(Exception):
+    """
+        Error response of DevTools command, exception thrown by evaluated script or lost browser connection
+    """
+
+
+class DevToolsConnection(object):
+    """
+        Websocket connection to browser DevTools endpoint. Commands of every page session are multiplexed over it
+        (flat sessions), responses resolve command futures and events are pushed to listener of their session.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.websocket = None
+        self.closed = False
+        self.last_id = 0
+        self.pending = {}  # Command id -> future of its result
+        self.listeners = {}  # Session id -> callable(method, params)
+
+    @gen.coroutine
+    def connect(self):
+        self.websocket = yield websocket_connect(self.url, max_message_size=256 * 1024 * 1024)
+        IOLoop.current().spawn_callback(self.read_messages)
+
+    def send(self, method, params=None, session_id=None):
+        """
+            Sends DevTools command
+        :param method: Command, e.g. Page.navigate
+        :param params: Dictionary of command parameters
+        :param session_id: Page session the command is sent to, None for browser commands
+        :return: Future of command result dictionary
+        """
+        future = Future()
+        if self.closed:
+            future.set_exception(DevToolsError('Connection to browser is closed'))
+            return future
+        self.last_id += 1
+        message = {'id': self.last_id, 'method': method, 'params': params or {}}
+        if session_id:
+            message['sessionId'] = session_id
+        self.pending[self.last_id] = future
+        self.websocket.write_message(json.dumps(message))
+        return future
+
+    @gen.coroutine
+    def read_messages(self):
+        while True:
+            message = yield self.websocket.read_message()
+            if message is None:
+                break
+            message = json.loads(message)
+            if 'id' in message:
+                future = self.pending.pop(message['id'], None)
+                if future is None:
+                    continue
+                if 'error' in message:
+                    future.set_exception(DevToolsError(message['error'].get('message')))
+                else:
+                    future.set_result(message.get('result', {}))
+            elif message.get('sessionId') in self.listeners:
+                self.listeners[message['sessionId']](message['method'], message.get('params', {}))
+        self.closed = True
+        for future in self.pending.values():
+            future.set_exception(DevToolsError('Connection to browser is closed'))
+        self.pending = {}
+
+    def close(self):
+        if self.websocket and not self.closed:
+            self.websocket.close()
+
+
+class HeadlessChrome(object):
+    """
+        Headless Chrome process with remote debugging enabled and DevTools connection to it
+    """
+
+    def __init__(self, binary, arguments):
+        """
+        :param binary: Path to Chrome binary
+        :param arguments: Additional command line arguments (proxy, host rules)
+        """
+        self.binary = binary
+        self.arguments = arguments
+        self.process = None
+        self.connection = None
+        self.user_data_dir = None
+
+    @staticmethod
+    def free_port():
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        return port
+
+    @gen.coroutine
+    def start(self, timeout):
+        """
+            Launches Chrome and connects to it once DevTools endpoint is up
+        :param timeout: Seconds to wait for DevTools endpoint
+        """
+        port = self.free_port()
+        self.user_data_dir = tempfile.mkdtemp(prefix='loading_time_chrome_')
+        self.process = subprocess.Popen([self.binary, '--headless', '--disable-gpu', '--no-first-run',
+                                         '--remote-debugging-port=%s' % (port,),
+                                         '--user-data-dir=%s' % (self.user_data_dir,)] +
+                                        list(self.arguments) + ['about:blank'])
+        deadline = time.time() + timeout
+        while True:
+            try:
+                response = yield AsyncHTTPClient().fetch('http://127.0.0.1:%s/json/version' % (port,))
+                break
+            except (HTTPError, socket.error):
+                if time.time() > deadline or self.process.poll() is not None:
+                    self.close()
+                    raise DevToolsError('Chrome DevTools endpoint is not available')
+                yield gen.sleep(0.1)
+        self.connection = DevToolsConnection(json.loads(response.body)['webSocketDebuggerUrl'])
+        yield self.connection.connect()
+
+    @property
+    def alive(self):
+        return self.connection is not None and not self.connection.closed and self.process.poll() is None
+
+    @gen.coroutine
+    def new_tab(self, blocked_urls=()):
+        """
+            Opens page in a new browser context, so it doesn't share cookies, cache and storage with other scans
+        :param blocked_urls: Url patterns (with * wildcards) the page isn't allowed to request
+        :return: DevToolsTab
+        """
+        tab = DevToolsTab(self.connection)
+        yield tab.open(blocked_urls)
+        raise gen.Return(tab)
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait()
+        if self.user_data_dir:
+            shutil.rmtree(self.user_data_dir, ignore_errors=True)
+
+
+class DevToolsTab(object):
+    """
+        Page of its own browser context attached as flat session. Lifecycle and network events are pushed by browser,
+        every requestWillBeSent is kept in requests and resolves waiters whose predicate it matches.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.context_id = None
+        self.target_id = None
+        self.session_id = None
+        self.requests = []  # Network.requestWillBeSent parameters in order of arrival
+        self.waiters = []  # List of (predicate, future) waiting for a request
+        self.load = None  # Future resolved by Page.loadEventFired of current navigation
+
+    @gen.coroutine
+    def open(self, blocked_urls=()):
+        result = yield self.connection.send('Target.createBrowserContext')
+        self.context_id = result['browserContextId']
+        result = yield self.connection.send('Target.createTarget', {'url': 'about:blank',
+                                                                    'browserContextId': self.context_id})
+        self.target_id = result['targetId']
+        result = yield self.connection.send('Target.attachToTarget', {'targetId': self.target_id, 'flatten': True})
+        self.session_id = result['sessionId']
+        self.connection.listeners[self.session_id] = self.on_event
+        yield [self.send('Page.enable'), self.send('Network.enable'), self.send('Runtime.enable')]
+        if blocked_urls:
+            yield self.send('Network.setBlockedURLs', {'urls': list(blocked_urls)})
+
+    def send(self, method, params=None):
+        return self.connection.send(method, params, self.session_id)
+
+    def on_event(self, method, params):
+        if method == 'Page.loadEventFired':
+            if self.load is not None and not self.load.done():
+                self.load.set_result(params['timestamp'])
+        elif method == 'Network.requestWillBeSent':
+            self.requests.append(params)
+            for waiter in list(self.waiters):
+                predicate, future = waiter
+                if predicate(params):
+                    self.waiters.remove(waiter)
+                    if not future.done():
+                        future.set_result(params)
+
+    @gen.coroutine
+    def navigate(self, url, timeout):
+        """
+            Navigates page and waits for its load event
+        :param url: Page url
+        :param timeout: Seconds to wait for load event
+        :return: Browser monotonic timestamp of load event, comparable with timestamp of requests
+        :raise gen.TimeoutError: Page wasn't loaded in time
+        """
+        self.load = Future()
+        result = yield self.send('Page.navigate', {'url': url})
+        if result.get('errorText'):
+            raise DevToolsError('Navigation to %s failed: %s' % (url, result['errorText']))
+        timestamp = yield gen.with_timeout(IOLoop.current().time() + timeout, self.load)
+        raise gen.Return(timestamp)
+
+    def document_request(self):
+        """
+            requestWillBeSent parameters of page document or None if navigation didn't start
+        """
+        for request in self.requests:
+            if request.get('type') == 'Document':
+                return request
+
+    @gen.coroutine
+    def evaluate(self, expression):
+        """
+            Evaluates expression in page, promises are awaited
+        :return: Value of the expression
+        """
+        result = yield self.send('Runtime.evaluate', {'expression': expression, 'returnByValue': True,
+                                                      'awaitPromise': True})
+        if 'exceptionDetails' in result:
+            details = result['exceptionDetails']
+            raise DevToolsError(details.get('exception', {}).get('description') or details.get('text'))
+        raise gen.Return(result['result'].get('value'))
+
+    @gen.coroutine
+    def wait_for_request(self, predicate, deadline):
+        """
+            Waits for a request matching predicate, requests sent earlier are matched too
+        :param predicate: Callable, which takes requestWillBeSent parameters
+        :param deadline: IOLoop time to wait until
+        :return: requestWillBeSent parameters or None if there was no matching request till deadline
+        """
+        for request in self.requests:
+            if predicate(request):
+                raise gen.Return(request)
+        future = Future()
+        waiter = (predicate, future)
+        self.waiters.append(waiter)
+        try:
+            request = yield gen.with_timeout(deadline, future)
+        except gen.TimeoutError:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+            request = None
+        raise gen.Return(request)
+
+    @gen.coroutine
+    def close(self):
+        """
+            Closes page and disposes its browser context with cookies, cache and storage of the scan
+        """
+        self.connection.listeners.pop(self.session_id, None)
+        if self.context_id:
+            yield self.connection.send('Target.disposeBrowserContext', {'browserContextId': self.context_id})
+
+
+class ChromePool(object):
+    """
+        Headless Chrome processes keyed by launch arguments (public proxy). Every scan gets a fresh browser context
+        of a warm browser, dead browser is relaunched on next use.
+    """
+
+    def __init__(self, factory, launch_timeout):
+        """
+        :param factory: Callable, which returns HeadlessChrome (not started) for given profile
+        :param launch_timeout: Seconds to wait for Chrome DevTools endpoint
+        """
+        self.factory = factory
+        self.launch_timeout = launch_timeout
+        self.browsers = {}  # Profile -> future of started HeadlessChrome
+        self.launches = 0
+        self.launch_time = 0.0
+        self.reuses = 0
+
+    @gen.coroutine
+    def browser(self, profile):
+        """
+            Returns started browser for profile, concurrent callers share one launch
+        """
+        future = self.browsers.get(profile)
+        if future is not None and future.done() and (future.exception() or not future.result().alive):
+            if not future.exception():
+                future.result().close()
+            future = None
+        if future is None:
+            future = self.browsers[profile] = self.launch(profile)
+        else:
+            self.reuses += 1
+        browser = yield future
+        raise gen.Return(browser)
+
+    @gen.coroutine
+    def launch(self, profile):
+        log.info('Launching headless Chrome for profile %s' % (profile,))
+        start_launch = time.time()
+        browser = self.factory(profile)
+        yield browser.start(self.launch_timeout)
+        self.launch_time += time.time() - start_launch
+        self.launches += 1
+        raise gen.Return(browser)
+
+    def close(self):
+        for future in self.browsers.values():
+            if future.done() and not future.exception():
+                future.result().close()
+        self.browsers = {}
+
+    def stats(self):
+        """
+            Startup statistics in the shape of DriverPool.stats
+        """
+        average_launch = self.launch_time / self.launches if self.launches else 0.0
+        return {'launches': self.launches,
+                'reuses': self.reuses,
+                'launch_time': self.launch_time,
+                'saved_time': self.reuses * average_launch}
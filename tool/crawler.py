@@ -2,63 +2,52 @@ import os
 import re
 import time
 import logging
-import smtplib
+import multiprocessing
 
 
-from csv import writer
 from urlparse import parse_qs
-from datetime import datetime
-from email.mime.text import MIMEText
-from configparser import ConfigParser
-from email.mime.multipart import MIMEMultipart
-from email.mime.application import MIMEApplication
-
-from torndb import Connection
-from bs4 import BeautifulSoup
+
+from tornado import gen, locks
+from tornado.ioloop import IOLoop
 from selenium import webdriver
-from tornado.template import Loader
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from browsermobproxy import Server
+from multiprocessing.util import Finalize
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
 
+import stats
+import alerts
+import providers
+import history
+import metrics
+import har_capture
+import tag_position
+import browser_scripts
 from utils import catching
+from scan_store import ScanStore
+from driver_pool import DriverPool
+from cdp_engine import ChromePool, HeadlessChrome, DevToolsError
 from proxy_countries import PROXY_COUNTRIES
+from work_queue import WorkQueue
+from proxy_manager import ProxyManager, ProxyUnavailable
+from browser_scripts import NAVIGATION_FIELDS, TAG_RESOURCE_FIELDS
 
-# Config initialization
-config = ConfigParser()
-config.read(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config.ini'))
-
-# Logging
-LOGLEVEL = int(config.get('logging', 'loglevel'))
-log_file = 'load_time_crawler_{0}.log'.format(datetime.now().strftime('%Y.%m.%d-%H.%M.%S'))
-log_file = os.path.join(config.get('logging', 'path'), log_file)
-# if not os.path.exists(log_file):
-#     open(log_file, 'a').close()
-logging.basicConfig(level=LOGLEVEL)
+# Config is read on first access, logging is configured in Crawler.initialize, so importing module has no side effects
+config = providers.LazyConfig()
 log = logging.getLogger('crawler')
-log.setLevel(LOGLEVEL)
-formatter = logging.Formatter('%(asctime)s [%(pathname)s:%(lineno)d] %(levelname)8s: %(message)s')
-handler = logging.NullHandler()
-handler.setFormatter(formatter)
-log.addHandler(handler)
-
-# Db connection, closes after loading configuration and reconnecting at the end to insert results
-db = Connection(config.get('mysql', 'host'),
-                config.get('mysql', 'db'),
-                config.get('mysql', 'user'),
-                config.get('mysql', 'pass'))
-
-# Template loading
-root_path = os.path.join(os.path.abspath(os.path.dirname(__file__)))
-loader = Loader(root_path)
-template = loader.load('results.html')
-
-# Email configurations
-gmail_user = config.get('alerts', 'gmail_user')
-gmail_password = config.get('alerts', 'gmail_password')
-gmail_host = config.get('alerts', 'gmail_host')
-gmail_port = int(config.get('alerts', 'gmail_port'))
+
+# Host of imonomy tag, it's blocked in without tag scans and its requests are summarized from Resource Timing
+TAG_HOST = 'mapping_placeholder'
+# Url pattern of imonomy tag and its ad chain requests, blacklisted and summarized by browsermob proxy in HAR capture
+TAG_URL_PATTERN = '.*%s.*' % (re.escape(TAG_HOST),)
+# Part of tag script src to look for, depends on whenever layer is active on website
+LAYER_TAG_LOOKUP_NAME = '%s' % ('tag_lookup_name_placeholder',)
+TAG_LOOKUP_NAME = '%s' % ('tag_lookup_name_placeholder',)
+WITH_TAG_MEASURES = ('preload', '990', 'with_tag', 'layer', 'unit', 'navigation', 'tag_resources', 'har', 'proxy_rtt')
+# Measures, which are None when their milestone wasn't reached (unit is a tuple with None load time)
+SENTINEL_MEASURES = ('preload', '990', 'with_tag', 'layer', 'unit', 'without_tag')
 
 
 class Crawler(object):
@@ -67,26 +56,66 @@ class Crawler(object):
     """
     configuration = None  # Added dummy properties here, so Pycharm won't highlight them as AttributeError
     driver = None  # ChromeDriver property of class Crawler
+    driver_profile = None  # Launch profile (public proxy, with_tag) of current driver
+    driver_pool = None  # Pool of warm ChromeDrivers, one per process
+    pool_stats = {}  # Pool startup statistics of the run, shown in results email
+    scan_store = None  # Durable store of every scan measurement
+    run_id = None  # Id of current run in Crawler.scan_store
     timeout = None  # Timeout for loading web pages
-    proxy = None  # Proxy client as a property of class Crawler
-    server = None  # Proxy server property
+    proxy = None  # Browsermob proxy client of current driver (HAR capture)
+    server = None  # Browsermob proxy server, started in parent process when HAR capture is enabled
+    har_proxies = None  # Pool of browsermob proxies, one per public proxy and process (HAR capture)
+    history = None  # History of previous runs for regression detection, None if it's disabled
     thresholds = None  # Thresholds for loading time
+    proxy_semaphores = {}  # Country -> semaphore capping concurrent workers behind one proxy (parallel mode)
+    proxy_manager = None  # Health of public proxies, picks proxy of every scan
+    proxy_rtt = None  # RTT of public proxy of current scan, None for scans without proxy
+    local_geos = ()  # Countries scanned without public proxy, worker node is placed in them
+    work_queue = None  # Shared queue of scans of distributed run
+    website_source = None  # Provider of website rows (MySQL, file, snapshot), created from config unless injected
+    result_sink = None  # Writes results of the run (csv), created from config unless injected
+    notifier = None  # Sends results of the run (email), created from config unless injected
+    alert_notifier = None  # Sends threshold alerts while the run is going, created from config unless injected
+    metrics_exporter = None  # Exports metrics of the run while it's going, None if it's disabled
+    profiler = None  # cProfile of current process, None unless metrics.profile is enabled
     headers = ['Website', 'Page loading time', 'Preload', 'Layer']  # Headers of an output csv document
 
     @staticmethod
     @catching
-    def initialize():
+    def initialize(worker=False):
         """
-            Initializes Crawler.configuration and Crawler.thresholds static variables, closes database to prevent
-            hanging connections. Throws an error in case of failed configuration load and exits.
+            Initializes Crawler.configuration and Crawler.thresholds static variables and providers, which weren't
+            injected. Throws an error in case of failed configuration load and exits.
+        :param worker: Boolean flag indicates worker node of distributed run, which gets websites with leased scans
+                       and doesn't store or send results
         """
-        Crawler.configuration = Crawler.get_configurations() or None
+        providers.configure_logging(config)
+        Crawler.metrics_exporter = metrics.create_exporter(config)
+        Crawler.profiler = metrics.create_profiler(config)
         Crawler.get_thresholds()
-        # Crawler.server = Server(config.get('chromedriver', 'proxy_bin'))
-        # Crawler.server.start()
-        # Crawler.proxy = server.create_proxy(params={'httpsProxy': True})
-        # Crawler.proxy = Crawler.server.create_proxy()
-        db.close()
+        Crawler.driver_pool = Crawler.create_driver_pool()
+        Crawler.proxy_manager = Crawler.create_proxy_manager()
+        if config.getboolean('proxies', 'probe_on_start'):
+            with metrics.span('proxy_probe'):
+                Crawler.proxy_manager.probe_all()
+        if config.getboolean('capture', 'har'):
+            Crawler.server = Server(config.get('chromedriver', 'proxy_bin'))
+            Crawler.server.start()
+            Crawler.har_proxies = Crawler.create_har_proxies(Crawler.har_server_url())
+        if worker:
+            return
+        if Crawler.website_source is None:
+            Crawler.website_source = providers.create_website_source(config)
+        if Crawler.result_sink is None:
+            Crawler.result_sink = providers.create_result_sink(config)
+        if Crawler.notifier is None:
+            Crawler.notifier = providers.EmailNotifier(config)
+        if Crawler.alert_notifier is None:
+            Crawler.alert_notifier = providers.create_alert_notifier(config)
+        Crawler.configuration = Crawler.get_configurations() or None
+        Crawler.scan_store = ScanStore(config.get('results', 'store_path'))
+        if config.getboolean('history', 'enabled'):
+            Crawler.history = history.HistoryStore(config.get('history', 'path'))
         if not Crawler.configuration:
             log.error('Something went wrong with initializing crawler. Exiting')
             exit(1)
@@ -101,266 +130,1201 @@ class Crawler(object):
             'slowdown': float(config.get('threshold', 'slowdown')),
             'preload': float(config.get('threshold', 'preload')),
             '990': float(config.get('threshold', '990')),
-            'provider_response': float(config.get('threshold', 'provider_response'))
+            'provider_response': float(config.get('threshold', 'provider_response')),
+            'failure_rate': float(config.get('threshold', 'failure_rate'))
         }
 
     @staticmethod
-    @catching
-    def process():
+    def process(resume=False, distributed=False):
         """
             Processes websites from database, fills results (time measurements), calculates average loading time,
             creates csv with all results and sends an email to a list of receivers from configuration file.
+            Every scan is persisted in Crawler.scan_store as soon as it's taken and results are aggregated from the
+            store. Errors aren't swallowed here, so crashed run is visible and can be continued with resume flag.
+        :param resume: Boolean flag indicates whenever we want to continue last unfinished run, skipping scans which
+                       are already stored
+        :param distributed: Boolean flag indicates scans are run by worker nodes (see Crawler.process_distributed)
+        """
+        Crawler.run_id = Crawler.scan_store.start_run(resume)
+        log.info('Processing run %s' % (Crawler.run_id,))
+        Crawler.start_instrumentation()
+        if Crawler.alert_notifier:
+            Crawler.alert_notifier.start()
+        try:
+            workers = int(config.get('parallel', 'workers'))
+            try:
+                if distributed:
+                    Crawler.process_distributed()
+                elif config.get('loading', 'engine') == 'cdp':
+                    Crawler.process_cdp()
+                elif workers > 1:
+                    Crawler.process_parallel(workers)
+                else:
+                    try:
+                        for website in Crawler.configuration:
+                            Crawler.test_load_time(website)
+                            Crawler.check_website(website)
+                    finally:
+                        Crawler.pool_stats = Crawler.driver_pool.stats()
+                        Crawler.driver_pool.close()
+                        if Crawler.har_proxies:
+                            Crawler.har_proxies.close()
+            finally:
+                if Crawler.server:
+                    Crawler.server.stop()
+                # Queued alerts go out before the results email
+                if Crawler.alert_notifier:
+                    Crawler.alert_notifier.stop()
+            log.info('Driver pool launched Chrome %(launches)s times (%(launch_time).1f sec), reused warm driver '
+                     '%(reuses)s times, saving about %(saved_time).1f sec' % Crawler.pool_stats)
+            with metrics.span('load_results'):
+                results = Crawler.load_results()
+            with metrics.span('calculate_results'):
+                Crawler.calculate_results(results)
+            Crawler.store(results)
+            adaptive = config.getboolean('adaptive', 'enabled') and not distributed and \
+                config.get('loading', 'engine') != 'cdp'
+            missing = Crawler.missing_scans(adaptive)
+            if missing:
+                # Websites skipped for lack of healthy proxy (or given up scans) are scanned by resumed run
+                log.error('Run %s is left unfinished, scans are missing: %s. Continue it with --resume' % (
+                    Crawler.run_id, ', '.join('%s (%s)' % (website, missing[website]) for website in sorted(missing))))
+            else:
+                Crawler.scan_store.finish_run(Crawler.run_id)
+        finally:
+            Crawler.stop_instrumentation()
+
+    @staticmethod
+    def missing_scans(adaptive=False):
+        """
+            Counts scans of current run, which aren't stored, e.g. website was skipped as its country had no healthy
+            proxy
+        :param adaptive: Boolean flag indicates website needs only adaptive.min_scans scans of each phase
+        :return: Dictionary website -> number of missing scans, websites with all scans stored are left out
         """
-        results = {}
+        missing = {}
         for website in Crawler.configuration:
-            results[website] = Crawler.test_load_time(website)
-        Crawler.calculate_results(results)
-        Crawler.store(results)
+            if adaptive:
+                required = int(config.get('adaptive', 'min_scans'))
+            else:
+                required = Crawler.configuration[website]['scans_number']
+            count = sum(len(Crawler.scan_store.pending_scans(Crawler.run_id, website, phase, required))
+                        for phase in ('with_tag', 'without_tag'))
+            if count:
+                missing[website] = count
+        return missing
+
+    @staticmethod
+    def start_instrumentation():
+        """
+            Starts metrics export and profiling of the run, if they are enabled
+        """
+        if Crawler.metrics_exporter:
+            Crawler.metrics_exporter.start()
+        if Crawler.profiler:
+            Crawler.profiler.start()
+
+    @staticmethod
+    @catching
+    def stop_instrumentation():
+        """
+            Dumps profile and writes final metrics of the run
+        """
+        if Crawler.profiler:
+            Crawler.profiler.dump(Crawler.run_id)
+        if Crawler.metrics_exporter:
+            Crawler.metrics_exporter.stop()
+
+    @staticmethod
+    def load_results():
+        """
+            Reads measurements of current run from Crawler.scan_store
+        :return: Results dictionary, time measurement statistics for every website
+        """
+        return dict((website, Crawler.load_website_results(website)) for website in Crawler.configuration)
+
+    @staticmethod
+    def load_website_results(website):
+        """
+            Reads measurements of website in current run from Crawler.scan_store
+        :return: Time measures of website
+        """
+        scans_with_tag = Crawler.scan_store.scans(Crawler.run_id, website, 'with_tag')
+        scans_without_tag = Crawler.scan_store.scans(Crawler.run_id, website, 'without_tag')
+        # Scans stored before HAR capture was enabled have no har entry
+        results_with_tag = dict((key, [scan.get(key) for scan in scans_with_tag]) for key in WITH_TAG_MEASURES)
+        results_with_tag['scans_used'] = len(scans_with_tag)
+        results_without_tag = {'without_tag': [scan['without_tag'] for scan in scans_without_tag],
+                               'navigation': [scan['navigation'] for scan in scans_without_tag],
+                               'proxy_rtt': [scan.get('proxy_rtt') for scan in scans_without_tag],
+                               'position': False, 'tag_position': None}
+        for scan in scans_without_tag:
+            if 'position' in scan:
+                results_without_tag['position'] = scan['position']
+                results_without_tag['tag_position'] = scan.get('tag_position')
+        return Crawler.merge_measures(results_with_tag, results_without_tag)
 
     @staticmethod
     @catching
-    def prepare(website, with_tag=True):
+    def check_website(website):
+        """
+            Checks results of website against Crawler.thresholds as soon as its scans are done and queues alert to
+            Crawler.alert_notifier if any threshold is breached
+        :param website: Website page, whose scans are done
+        """
+        if not Crawler.alert_notifier:
+            return
+        with metrics.span('alert_check'):
+            results = {website: Crawler.load_website_results(website)}
+            Crawler.calculate_results(results)
+        if results[website].get('breaches'):
+            Crawler.alert_notifier.alert(alerts.describe_breaches(website, results[website], Crawler.thresholds))
+
+    @staticmethod
+    def process_parallel(workers):
+        """
+            Spreads with/without tag phases of every website over a pool of worker processes. Every worker process
+            has its own copy of Crawler class, so Crawler.driver is a per-worker ChromeDriver. Number of workers
+            using the same proxy country at once is capped by config value parallel.proxy_concurrency.
+            Workers write their scans to Crawler.scan_store.
+        :param workers: Number of worker processes
+        """
+        proxy_concurrency = int(config.get('parallel', 'proxy_concurrency'))
+        semaphores = dict((country, multiprocessing.BoundedSemaphore(proxy_concurrency))
+                          for country in PROXY_COUNTRIES)
+
+        # Interleave phases by country, so workers don't all queue up behind the same proxy. Adaptive mode
+        # alternates phases of a website, so the whole website is one task.
+        adaptive = config.getboolean('adaptive', 'enabled')
+        phases_by_geo = {}
+        for website in Crawler.configuration:
+            geo_phases = phases_by_geo.setdefault(Crawler.configuration[website]['geo'], [])
+            geo_phases.extend([(website, None)] if adaptive else [(website, True), (website, False)])
+        phases = []
+        while phases_by_geo:
+            for geo in list(phases_by_geo):
+                phases.append(phases_by_geo[geo].pop(0))
+                if not phases_by_geo[geo]:
+                    del phases_by_geo[geo]
+
+        log.info('Processing %s phases with %s workers' % (len(phases), workers))
+        # Website is checked for alerts once all of its phases are done
+        pending_phases = {}
+        for website, with_tag in phases:
+            pending_phases[website] = pending_phases.get(website, 0) + 1
+        pool_stats = {}
+        pool = multiprocessing.Pool(workers, initializer=init_worker,
+                                    initargs=(Crawler.configuration, Crawler.thresholds, semaphores, Crawler.run_id,
+                                              Crawler.har_server_url() if Crawler.server else None,
+                                              Crawler.proxy_manager))
+        try:
+            for worker, worker_pool_stats, worker_metrics, website in pool.imap_unordered(run_phase, phases):
+                pool_stats[worker] = worker_pool_stats
+                metrics.REGISTRY.merge(worker_metrics)
+                pending_phases[website] -= 1
+                if not pending_phases[website]:
+                    Crawler.check_website(website)
+        finally:
+            pool.close()
+            pool.join()
+
+        # Worker pool statistics are cumulative, so only the last snapshot of every worker is summed
+        Crawler.pool_stats = dict((key, sum(stats[key] for stats in pool_stats.values()))
+                                  for key in ('launches', 'reuses', 'launch_time', 'saved_time'))
+
+    @staticmethod
+    def process_distributed():
+        """
+            Coordinator of distributed run: queues every scan of current run which isn't stored yet to
+            Crawler.work_queue and merges measures pushed back by worker nodes (see Crawler.work) into
+            Crawler.scan_store until no scan is pending or leased or queue.run_timeout elapses. Website is checked for
+            alerts as soon as all of its scans are merged or given up, scans given up are reported. Adaptive mode
+            isn't supported, as its scans depend on each other.
+        """
+        if config.getboolean('adaptive', 'enabled'):
+            log.warning('Adaptive mode isn\'t supported by distributed run, running scans_number scans of every '
+                        'website')
+        Crawler.work_queue = Crawler.create_work_queue()
+        items = []
+        for website in Crawler.configuration:
+            scans_number = Crawler.configuration[website]['scans_number']
+            for phase in ('with_tag', 'without_tag'):
+                for scan_index in Crawler.scan_store.pending_scans(Crawler.run_id, website, phase, scans_number):
+                    # Position of the tag is checked on the last loaded page
+                    items.append({'website': website, 'phase': phase, 'scan_index': scan_index,
+                                  'configuration': Crawler.configuration[website],
+                                  'check_position': phase == 'without_tag' and scan_index == scans_number - 1})
+        Crawler.work_queue.enqueue(Crawler.run_id, items)
+        log.info('Queued %s scans of run %s for worker nodes' % (len(items), Crawler.run_id))
+
+        poll_interval = float(config.get('queue', 'poll_interval'))
+        run_timeout = float(config.get('queue', 'run_timeout'))
+        deadline = time.time() + run_timeout if run_timeout else None
+        checked = set()
+        while True:
+            Crawler.work_queue.reap(Crawler.run_id)
+            # Counted before merge, so scans pushed in between are merged in the last round
+            unfinished = Crawler.work_queue.unfinished(Crawler.run_id)
+            Crawler.merge_scans(checked)
+            if not unfinished:
+                break
+            if deadline is not None and time.time() > deadline:
+                log.error('Run %s timed out after %s sec, giving up %s unfinished scans' %
+                          (Crawler.run_id, run_timeout, unfinished))
+                Crawler.work_queue.give_up(Crawler.run_id)
+                Crawler.merge_scans(checked)
+                break
+            log.info('Run %s scans: %s' % (Crawler.run_id, Crawler.work_queue.counts(Crawler.run_id)))
+            time.sleep(poll_interval)
+        failed = Crawler.work_queue.failed_items(Crawler.run_id)
+        if failed:
+            log.error('%s scans of run %s failed and are missing in results: %s' % (
+                len(failed), Crawler.run_id, ', '.join('%s %s scan %s' % item for item in failed)))
+        # Chrome runs on worker nodes
+        Crawler.pool_stats = {'launches': 0, 'reuses': 0, 'launch_time': 0.0, 'saved_time': 0.0}
+
+    @staticmethod
+    def merge_scans(checked):
+        """
+            Stores scans pushed back by worker nodes in Crawler.scan_store and checks websites, which have no scan
+            pending or leased anymore
+        :param checked: Set of websites already checked, updated
+        """
+        items = Crawler.work_queue.done_items(Crawler.run_id)
+        for website, phase, scan_index, measures in items:
+            Crawler.record_scan(website, phase, scan_index, measures)
+        Crawler.work_queue.mark_merged(Crawler.run_id, items)
+        for website in Crawler.configuration:
+            if website not in checked and not Crawler.work_queue.unfinished(Crawler.run_id, website):
+                checked.add(website)
+                Crawler.check_website(website)
+
+    @staticmethod
+    def work(worker_id, geos=None, exit_when_idle=False):
+        """
+            Worker node of distributed run: leases scans from Crawler.work_queue, runs them on warm drivers the same
+            way as local run does and pushes their measures back. Scan of a country without healthy proxy is put
+            back to the queue, so node of another country can take it.
+        :param worker_id: Unique id of worker node
+        :param geos: Countries node leases scans of, None for all
+        :param exit_when_idle: Boolean flag indicates node stops once there is nothing to lease
+        """
+        Crawler.work_queue = Crawler.create_work_queue()
+        Crawler.configuration = {}
+        poll_interval = float(config.get('queue', 'poll_interval'))
+        log.info('Worker node %s started' % (worker_id,))
+        Crawler.start_instrumentation()
+        try:
+            while True:
+                item = Crawler.work_queue.lease(worker_id, geos)
+                if item is None:
+                    if exit_when_idle:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+                website = item['website']
+                Crawler.run_id = item['run_id']
+                Crawler.configuration[website] = item['configuration']
+                if not Crawler.proxy_available(website):
+                    Crawler.work_queue.release(item)
+                    time.sleep(poll_interval)
+                    continue
+                if item['phase'] == 'with_tag':
+                    scan = Crawler.scan_with_tag(website)
+                else:
+                    scan = Crawler.scan_without_tag(website, check_position=item['check_position'])
+                if scan is None:
+                    # Proxies of the country died after lease, scan is put back instead of failing
+                    Crawler.work_queue.release(item)
+                    time.sleep(poll_interval)
+                    continue
+                metrics.increment('crawler_scans', website=website, proxy=scan.get('proxy') or 'direct',
+                                  phase=item['phase'])
+                Crawler.work_queue.complete(item, scan)
+        finally:
+            Crawler.driver_pool.close()
+            if Crawler.har_proxies:
+                Crawler.har_proxies.close()
+            if Crawler.server:
+                Crawler.server.stop()
+            Crawler.stop_instrumentation()
+        log.info('Worker node %s is idle, exiting' % (worker_id,))
+
+    @staticmethod
+    def create_work_queue():
+        """
+            Creates shared queue of scans from queue section of configuration
+        """
+        return WorkQueue(config.get('queue', 'path'), lease_timeout=float(config.get('queue', 'lease_timeout')),
+                         max_attempts=int(config.get('queue', 'max_attempts')),
+                         release_backoff=float(config.get('queue', 'release_backoff')))
+
+    @staticmethod
+    def process_cdp():
+        """
+            Runs scans of all websites concurrently from one event loop on headless Chrome driven over DevTools
+            protocol (loading.engine = cdp). Number of open pages is capped by cdp.concurrency, number of pages
+            behind one proxy country by parallel.proxy_concurrency. Scans are stored in Crawler.scan_store the same
+            way as with Selenium, adaptive mode and HAR capture aren't supported by this engine.
+        """
+        if config.getboolean('adaptive', 'enabled'):
+            log.warning('Adaptive mode isn\'t supported by cdp engine, running scans_number scans of every website')
+        chrome_pool = ChromePool(Crawler.launch_chrome, int(config.get('loading', 'timeout_page_load')))
+        try:
+            IOLoop.current().run_sync(lambda: Crawler.run_cdp_scans(chrome_pool))
+        finally:
+            Crawler.pool_stats = chrome_pool.stats()
+            chrome_pool.close()
+
+    @staticmethod
+    @gen.coroutine
+    def run_cdp_scans(chrome_pool):
         """
-            Prepares ChromeDriver for tests
+            Starts every scan of current run which isn't stored yet and waits for all of them
+        :param chrome_pool: Pool of headless Chrome processes
+        """
+        concurrency = locks.Semaphore(int(config.get('cdp', 'concurrency')))
+        proxy_concurrency = int(config.get('parallel', 'proxy_concurrency'))
+        semaphores = dict((country, locks.Semaphore(proxy_concurrency)) for country in PROXY_COUNTRIES)
+        websites = []
+        for website in Crawler.configuration:
+            log.info('Started processing website %s, it has %s runs' %
+                     (website, Crawler.configuration[website]['scans_number']))
+            scans = []
+            for phase in ('with_tag', 'without_tag'):
+                done = Crawler.scan_store.done_scans(Crawler.run_id, website, phase)
+                for scan_index in xrange(Crawler.configuration[website]['scans_number']):
+                    if scan_index not in done:
+                        scans.append(Crawler.run_cdp_scan(chrome_pool, website, phase, scan_index, concurrency,
+                                                          semaphores.get(Crawler.configuration[website]['geo'])))
+            websites.append(Crawler.run_cdp_website(website, scans))
+        log.info('Processing %s websites with cdp engine' % (len(websites),))
+        yield websites
+
+    @staticmethod
+    @gen.coroutine
+    def run_cdp_website(website, scans):
+        """
+            Waits for started scans of website and checks its results for alerts
+        :param scans: Futures of website scans
+        """
+        yield scans
+        Crawler.check_website(website)
+
+    @staticmethod
+    @gen.coroutine
+    def run_cdp_scan(chrome_pool, website, phase, scan_index, concurrency, semaphore):
+        """
+            Runs one scan once there is a free page slot (and proxy country slot) and stores it
+        :param phase: with_tag or without_tag
+        :param concurrency: Semaphore of open pages
+        :param semaphore: Semaphore of proxy country or None
+        """
+        if semaphore:
+            yield semaphore.acquire()
+        try:
+            # Proxies may be probed, which blocks, so it's done in a thread
+            available = yield IOLoop.current().run_in_executor(None, Crawler.proxy_available, website)
+            if not available:
+                return
+            with (yield concurrency.acquire()):
+                if phase == 'with_tag':
+                    scan = yield Crawler.scan_with_tag_cdp(chrome_pool, website)
+                else:
+                    # Position of the tag is checked on the last loaded page
+                    check_position = scan_index == Crawler.configuration[website]['scans_number'] - 1
+                    scan = yield Crawler.scan_without_tag_cdp(chrome_pool, website, check_position)
+        finally:
+            if semaphore:
+                semaphore.release()
+        if scan is not None:
+            Crawler.record_scan(website, phase, scan_index, scan)
+
+    @staticmethod
+    def launch_chrome(proxy_server):
+        """
+            Creates headless Chrome for public proxy. Tag is blocked per page in without tag scans, so one browser
+            serves both phases.
+        :param proxy_server: Public proxy (host:port) or None
+        :return: HeadlessChrome, which isn't started yet
+        """
+        arguments = ['--dns-prefetch-disable']
+        if proxy_server:
+            arguments.append('--proxy-server=%s' % proxy_server)
+        return HeadlessChrome(config.get('cdp', 'chrome_bin'), arguments)
+
+    @staticmethod
+    def create_driver_pool():
+        """
+            Creates pool of warm ChromeDrivers for current process
+        """
+        return DriverPool(Crawler.launch_driver, int(config.get('chromedriver', 'max_uses')),
+                          max_idle=int(config.get('chromedriver', 'max_idle')) or None)
+
+    @staticmethod
+    def create_proxy_manager():
+        """
+            Creates manager of public proxies from PROXY_COUNTRIES and proxies section of configuration, countries of
+            Crawler.local_geos are scanned without proxy
+        """
+        proxies = dict((country, PROXY_COUNTRIES[country]) for country in PROXY_COUNTRIES
+                       if country not in Crawler.local_geos)
+        return ProxyManager(proxies, config.get('proxies', 'probe_url'),
+                            timeout=float(config.get('proxies', 'probe_timeout')),
+                            workers=int(config.get('proxies', 'probe_workers')),
+                            recheck_interval=float(config.get('proxies', 'recheck_interval')))
+
+    @staticmethod
+    def proxy_available(website):
+        """
+            Checks whenever website can be scanned, i.e. its country has a healthy proxy or doesn't need one
+        """
+        if Crawler.proxy_manager.available(Crawler.configuration[website]['geo']):
+            return True
+        log.error('Skipping scans of %s, there is no healthy proxy for %s' %
+                  (website, Crawler.configuration[website]['geo']))
+        return False
+
+    @staticmethod
+    def report_proxy_failure():
+        """
+            Probes public proxy of failed scan again, so dead proxy is replaced before the next scan
+        """
+        Crawler.proxy_manager.report_failure(Crawler.current_proxy())
+
+    @staticmethod
+    def record_scan(website, phase, scan_index, scan):
+        """
+            Stores scan in Crawler.scan_store and counts its missing (None) measures in metrics
+        :param phase: with_tag or without_tag
+        """
+        proxy_server = scan.get('proxy') or 'direct'
+        metrics.increment('crawler_scans', website=website, proxy=proxy_server, phase=phase)
+        for measure in SENTINEL_MEASURES:
+            value = scan.get(measure, 0)
+            if value is None or measure == 'unit' and value and value[1] is None:
+                metrics.increment('crawler_missing_measures', website=website, proxy=proxy_server, measure=measure)
+        with metrics.span('scan_store'):
+            Crawler.scan_store.add_scan(Crawler.run_id, website, phase, scan_index, scan)
+
+    @staticmethod
+    def count_error(website, proxy_server, error):
+        """
+            Counts failed scan step in metrics, timeouts separately from other exceptions
+        """
+        if isinstance(error, (TimeoutException, gen.TimeoutError)):
+            metrics.increment('crawler_timeouts', website=website, proxy=proxy_server or 'direct')
+        else:
+            metrics.increment('crawler_exceptions', website=website, proxy=proxy_server or 'direct',
+                              type=type(error).__name__)
+
+    @staticmethod
+    def current_proxy():
+        """
+            Public proxy of Crawler.driver, None for scans without proxy
+        """
+        return Crawler.driver_profile[0] if Crawler.driver_profile else None
+
+    @staticmethod
+    def har_server_url():
+        """
+            Address of browsermob server REST API started in Crawler.initialize
+        """
+        return 'localhost:%s' % (Crawler.server.port,)
+
+    @staticmethod
+    def create_har_proxies(server_url):
+        """
+            Creates pool of browsermob proxies for current process, chained to public proxy of every profile
+        :param server_url: Address of browsermob server REST API
+        """
+        return har_capture.HarProxyPool(server_url, TAG_URL_PATTERN)
+
+    @staticmethod
+    def select_proxy(website):
+        """
+            Fastest healthy public proxy of website country. When all proxies of the country are dead the scan is
+            skipped, not recorded as failed, so it doesn't count in failure rate of the website and run stays open.
         :param website: Website page to get country to test on
+        :return: Proxy (host:port), None for scans without proxy or False if there is no healthy proxy
+        """
+        try:
+            with metrics.span('proxy_select'):
+                return Crawler.proxy_manager.select(Crawler.configuration[website]['geo'])
+        except ProxyUnavailable as e:
+            log.error('Skipping scan of %s. Error: %s' % (website, e))
+            return False
+
+    @staticmethod
+    @catching
+    def prepare(proxy_server, with_tag=True):
+        """
+            Prepares ChromeDriver for a single scan, taking warm driver of public proxy from Crawler.driver_pool
+        :param proxy_server: Public proxy selected by Crawler.select_proxy or None
         :param with_tag: Boolean flag indicates whenever we want to use driver hosts to prevent loading our js
         :return: Returns nothing, as it creates static variable inside Crawler class
         """
+        Crawler.driver_profile = None
+        Crawler.proxy_rtt = Crawler.proxy_manager.rtt(proxy_server)
+        if Crawler.har_proxies:
+            # Chrome of public proxy serves both phases, its browsermob proxy blacklists the tag in scans without it
+            Crawler.proxy = Crawler.har_proxies.proxy(proxy_server, with_tag)
+            Crawler.driver_profile = (proxy_server, None)
+        else:
+            Crawler.driver_profile = (proxy_server, with_tag)
+        with metrics.span('driver_acquire'):
+            Crawler.driver = Crawler.driver_pool.acquire(Crawler.driver_profile)
+
+    @staticmethod
+    @catching
+    def release_driver(broken=False):
+        """
+            Returns Crawler.driver back to Crawler.driver_pool after a scan
+        :param broken: Boolean flag indicates driver crashed during scan and should be recycled
+        """
+        if Crawler.driver:
+            with metrics.span('driver_release'):
+                Crawler.driver_pool.release(Crawler.driver_profile, Crawler.driver, broken=broken)
+        Crawler.driver = None
+
+    @staticmethod
+    def launch_driver(profile):
+        """
+            Launches new ChromeDriver for given launch profile
+        :param profile: Tuple (public proxy or None, with_tag), with_tag is None with HAR capture
+        :return: ChromeDriver
+        """
+        proxy_server, with_tag = profile
         chrome_options = webdriver.ChromeOptions()
-        proxy_server = PROXY_COUNTRIES.get(Crawler.configuration[website]['geo'])
         chrome_options.add_argument('--dns-prefetch-disable')
-        if proxy_server:
-            chrome_options.add_argument('--proxy-server=%s' % proxy_server)
-        if not with_tag:
-            chrome_options.add_argument('--host-rules=%s' % "MAP %s 127.0.0.1" % ('mapping_placeholder',))
-            # Crawler.proxy = Crawler.server.create_proxy()
-            # Crawler.proxy.blacklist(".*imonomy.*", 200)
-            # chrome_options.add_argument('--proxy-server=%s' % proxy_url)
-        # else:
-        #     chrome_options.add_argument('--proxy-server=%s' % '198.50.219.239:80')
-        # else:
-        #     Crawler.proxy.whitelist('tag.imonomy.com', 200)
-        Crawler.driver = webdriver.Chrome(config.get('chromedriver', 'path'), chrome_options=chrome_options)
-        Crawler.driver.set_page_load_timeout(int(config.get('loading', 'timeout_page_load')))
+        if Crawler.har_proxies:
+            # Browsermob proxy chains to public proxy and blacklists the tag in scans without tag
+            chrome_options.add_argument('--proxy-server=%s' % Crawler.har_proxies.proxy(proxy_server).proxy)
+            chrome_options.add_argument('--ignore-certificate-errors')
+        else:
+            if proxy_server:
+                chrome_options.add_argument('--proxy-server=%s' % proxy_server)
+            if not with_tag:
+                chrome_options.add_argument('--host-rules=%s' % "MAP %s 127.0.0.1" % (TAG_HOST,))
+        log.info('Launching ChromeDriver for profile %s' % (profile,))
+        with metrics.span('chrome_launch'):
+            driver = webdriver.Chrome(config.get('chromedriver', 'path'), chrome_options=chrome_options)
+        driver.set_page_load_timeout(int(config.get('loading', 'timeout_page_load')))
+        # Observer timing marks are collected with asynchronous script, which waits up to timeout_script itself
+        driver.set_script_timeout(int(config.get('loading', 'timeout_script')) + 5)
+        return driver
 
     @staticmethod
     @catching
     def calculate_results(results):
         """
-            Calculates results for initial dictionary, like average/maximum loading time
+            Calculates results for initial dictionary: failures count, average/maximum loading time, percentiles,
+            trimmed means, slowdown with its bootstrap confidence interval and thresholds breaches (see
+            stats.summarize). With history enabled latency added by tag is compared with previous runs, regression is
+            a breach too.
         :param results: Time measures dictionary for every website
         :return: Returns nothing, as it changes the initial dictionary
         """
+        stats.summarize(results, Crawler.thresholds,
+                        trim=float(config.get('statistics', 'trim')),
+                        resamples=int(config.get('statistics', 'bootstrap_resamples')),
+                        confidence=float(config.get('statistics', 'confidence')))
         for website in results:
-            results[website]['average_with_tag'] = sum(results[website]['with_tag'])/len(results[website]['with_tag'])
-            results[website]['average_without_tag'] = sum(results[website]['without_tag'])/len(results[website]['without_tag'])
-
-            results[website]['max_with_tag'] = max(results[website]['with_tag'])
-            results[website]['max_without_tag'] = max(results[website]['without_tag'])
-
-            results[website]['average_preload'] = sum(results[website]['preload'])/len(results[website]['preload'])
-            results[website]['average_layer'] = sum(results[website]['layer'])/len(results[website]['layer'])
-            results[website]['average_990'] = sum(results[website]['990'])/len(results[website]['990'])
-            results[website]['average_unit'] = (filter(lambda x: x[0], results[website]['unit']) or None,
-                                                sum([x[1] for x in results[website]['unit']]) /
-                                                len(results[website]['unit']))
+            results[website]['average_navigation_with_tag'] = Crawler.average_fields(
+                results[website]['navigation_with_tag'], NAVIGATION_FIELDS)
+            results[website]['average_navigation_without_tag'] = Crawler.average_fields(
+                results[website]['navigation_without_tag'], NAVIGATION_FIELDS)
+            results[website]['average_tag_resources'] = Crawler.average_fields(
+                results[website]['tag_resources'], TAG_RESOURCE_FIELDS)
+            results[website]['har_summary'] = har_capture.aggregate(results[website]['har'])
+            proxy_rtt = [rtt for key in ('proxy_rtt_with_tag', 'proxy_rtt_without_tag') for rtt in results[website][key]
+                         if rtt is not None]
+            results[website]['average_proxy_rtt'] = sum(proxy_rtt) / len(proxy_rtt) if proxy_rtt else None
+            results[website]['regression'] = None
+            if Crawler.history:
+                results[website]['regression'] = history.regression(
+                    Crawler.history, website, results[website]['with_tag'], results[website]['without_tag'],
+                    baseline_runs=int(config.get('history', 'baseline_runs')),
+                    min_runs=int(config.get('history', 'min_runs')),
+                    alpha=float(config.get('history', 'alpha')),
+                    min_increase=float(config.get('history', 'min_increase')))
+                if results[website]['regression'] and results[website]['regression']['regression']:
+                    results[website]['breaches'].append('regression')
 
-            results[website]['max_preload'] = max(results[website]['preload'])
-            results[website]['max_layer'] = max(results[website]['layer'])
-            results[website]['max_990'] = max(results[website]['990'])
-            results[website]['max_unit'] = max(results[website]['unit'], key=lambda unit: unit[1])
+    @staticmethod
+    def average_fields(samples, fields):
+        """
+            Averages every field of timing dictionaries, skipping failed scans and missing values
+        :param samples: List of dictionaries (or None for failed scans)
+        :param fields: Field names to average
+        :return: Dictionary field -> average or None if there is no value
+        """
+        averages = {}
+        for field in fields:
+            values = [sample[field] for sample in samples if sample and sample.get(field) is not None]
+            averages[field] = sum(values)/len(values) if values else None
+        return averages
 
     @staticmethod
-    @catching
     def test_load_time_with_tag(website):
         """
             Tests loading page with tag. Workflow is following:
-                1) Prepare working webdriver for current website (depends if we need proxy or not)
-                2) Initializes time_measures dictionary
-                3) Delete cookies and request website page
-                4) Measure time by following rules:
+                1) Take warm webdriver for current website from pool (depends if we need proxy or not)
+                2) Request website page
+                3) Measure time by following rules:
                     -- Preload - loading time is from driver.get(page) till 'layer' is present in driver
                     -- Layer - loading time is from 'layer' is present in driver till effective page_view pixel fire
                        (990)
                     -- 990 - loading time is from driver.get(page) till 990 is present in driver
                     -- N provider response is from 'layer' is present and driver has pixel of end of chain (985)
-                5) Repeat N times from configuration['scans_number']
-        :return: Preload load time list, 990 load time list, with_tag load list, position of imonomy tag,
-                 Layer load time list, unit_id load time list (unit_id, load time)
+                   Milestones are either polled with WebDriverWait (timing_mode = polling) or recorded in browser
+                   by injected observer script (timing_mode = observer). Navigation Timing of the page and Resource
+                   Timing summary of tag requests are collected afterwards. With HAR capture enabled scan goes through
+                   browsermob proxy and its HAR is summarized too.
+                4) Return webdriver to pool, which resets cookies, cache and storage
+                5) Store preload, 990, with_tag, layer, unit (unit_id, load time), navigation timing and tag resources
+                   summary of the scan in Crawler.scan_store
+                6) Repeat N times from configuration['scans_number'], skipping scans already stored for current run
         """
-        Crawler.prepare(website)
-
-        time_measures = {'preload': [], 'with_tag': [], '990': [], 'layer': [], 'unit': []}
-
         log.info('Processing website %s with tag' % website)
 
+        done = Crawler.scan_store.done_scans(Crawler.run_id, website, 'with_tag')
+        for scan_index in xrange(Crawler.configuration[website]['scans_number']):
+            if scan_index in done:
+                continue
+            if not Crawler.proxy_available(website):
+                break
+            scan = Crawler.scan_with_tag(website)
+            if scan is None:
+                break
+            Crawler.record_scan(website, 'with_tag', scan_index, scan)
+
+    @staticmethod
+    def scan_with_tag(website):
+        """
+            Runs one scan of website with tag on a warm driver (see Crawler.test_load_time_with_tag)
+        :param website: Website page to test
+        :return: Dictionary with preload, 990, with_tag, layer, unit, navigation, tag_resources and har measures,
+                 failed milestones are None. None if there is no healthy proxy, so scan is skipped.
+        """
         if Crawler.configuration[website]['is_layer_active']:
-            tag_lookup_name = '%s' % ('tag_lookup_name_placeholder',)
+            tag_lookup_name = LAYER_TAG_LOOKUP_NAME
         else:
-            tag_lookup_name = '%s' % ('tag_lookup_name_placeholder',)
-        for _ in xrange(Crawler.configuration[website]['scans_number']):
+            tag_lookup_name = TAG_LOOKUP_NAME
 
-            try:
+        proxy_server = Crawler.select_proxy(website)
+        if proxy_server is False:
+            return None
+        Crawler.prepare(proxy_server)
+        broken = False
+        try:
+            if Crawler.proxy:
+                Crawler.proxy.new_har(website)
 
-                # Clear cookies and go to website url
-                Crawler.driver.delete_all_cookies()
-                start_loading_page = time.time()
+            # Go to website url
+            start_loading_page = time.time()
+            with metrics.span('navigation'):
                 Crawler.driver.get(website)
 
-                # Inject tag and start counting time from executing script
-                Crawler.driver.execute_script(Crawler.configuration[website]['script'])
-                start_loading_tag = time.time()
+            if config.get('loading', 'timing_mode') == 'observer':
+                scan = Crawler.measure_tag_observer(website, tag_lookup_name, start_loading_page)
+            else:
+                scan = Crawler.measure_tag_polling(website, tag_lookup_name, start_loading_page)
 
-                # Init variables for end time
-                end_loading_tag = None
-                end_loading_990 = None
-                end_loading_page = None
-                end_loading_unit = None
-                end_loading_layer = None
-                unit_id = None
-                try:
-                    wait = WebDriverWait(Crawler.driver, timeout=int(config.get('loading', 'timeout_script')),
-                                         poll_frequency=0.1)
-                    wait.until(
-                        expected_conditions.presence_of_element_located(
-                            (By.CSS_SELECTOR, "script[src*='%s']" % (tag_lookup_name,))))
-                    end_loading_tag = time.time() - start_loading_tag
-                    start_loading_layer = time.time()
-                    wait.until(
-                        expected_conditions.presence_of_element_located(
-                            (By.CSS_SELECTOR, "img[src*='990']")))
-
-                    end_loading_page = time.time() - start_loading_page
-                    end_loading_990 = time.time() - start_loading_tag
-                    end_loading_layer = time.time() - start_loading_layer
-                    log.info('Located layer and effective_page_view pixel. Trying to locate shown pixel (985)')
-                except TimeoutException:
-                    log.error('Our script took too much time to load')
-                    end_loading_page, end_loading_tag, end_loading_990, end_loading_layer = end_loading_page or 100,\
-                                                                                            end_loading_tag or 100,\
-                                                                                            end_loading_990 or 100,\
-                                                                                            end_loading_layer or 100
-                except NoSuchElementException:
-                    log.error('Our script wasn\'t located in source of web page %s' % (website, ))
-                    end_loading_page, end_loading_tag, end_loading_990, end_loading_layer = end_loading_page or 100, \
-                                                                                            end_loading_tag or 100, \
-                                                                                            end_loading_990 or 100, \
-                                                                                            end_loading_layer or 100
-                finally:
-                    try:
-                        unit_id = None
-                        end_loading_unit = 0
-                        wait.until(expected_conditions.presence_of_element_located(
-                            (By.CSS_SELECTOR, "img[src*='ai=985'], img[src*='ai=983']")
-                        ))
-                        end_loading_unit = time.time() - start_loading_tag
-                        unit_id = Crawler.driver.find_element_by_css_selector("img[src*='ai=985'], img[src*='ai=983']")
-                        unit_id = parse_qs(unit_id.get_attribute('src'))
-                        if unit_id['ai'][0] == '983':
-                            log.info('No Adunits because of caps')
-                            unit_id = 'Failed on caps'
-                        else:
-                            unit_id, = unit_id['uid']
-                            log.info('Located ad unit %s' % unit_id)
-                    except TimeoutException:
-                        log.error('No ad units were found on web page because of timeout %s' % (website,))
-                    except NoSuchElementException:
-                        log.error('Shown wasn\'t located in web page %s' % (website, ))
-                    except KeyError:
-                        log.error('Error parsing end of chain pixel src')
-
-                time_measures['preload'].append(end_loading_tag)
-                time_measures['990'].append(end_loading_990)
-                time_measures['with_tag'].append(end_loading_page)
-                time_measures['layer'].append(end_loading_layer)
-                time_measures['unit'].append((unit_id, end_loading_unit))
-            except Exception as e:
-                log.error('Error processing %s. Error: %s' % (website, e))
-                time_measures['preload'].append(100)
-                time_measures['990'].append(100)
-                time_measures['with_tag'].append(100)
-                time_measures['layer'].append(100)
-                time_measures['unit'].append((None, 0))
-        Crawler.driver.quit()
-        return time_measures
+            scan.update(Crawler.collect_page_timing())
+            scan['har'] = Crawler.collect_har()
+        except Exception as e:
+            log.error('Error processing %s. Error: %s' % (website, e))
+            Crawler.count_error(website, Crawler.current_proxy(), e)
+            broken = not isinstance(e, TimeoutException)
+            if isinstance(e, WebDriverException):
+                Crawler.report_proxy_failure()
+            scan = {'preload': None, '990': None, 'with_tag': None, 'layer': None, 'unit': (None, None),
+                    'navigation': None, 'tag_resources': None, 'har': None}
+        scan['proxy'] = Crawler.current_proxy()
+        scan['proxy_rtt'] = Crawler.proxy_rtt
+        Crawler.release_driver(broken)
+        return scan
 
     @staticmethod
-    @catching
-    def test_load_time_without_tag(website):
+    @gen.coroutine
+    def scan_with_tag_cdp(chrome_pool, website):
         """
-                Tests loading time without imonomy tag
+            Runs one scan of website with tag in a fresh browser context of headless Chrome. Milestones are taken from
+            requests pushed by browser instead of polling DOM: preload ends with tag script request, 990 with
+            effective page view pixel request and unit with end of chain pixel request. All of them use browser's
+            wall clock (requestWillBeSent wallTime and Date.now() at injection), so event loop load doesn't skew them.
+        :param chrome_pool: Pool of headless Chrome processes
         :param website: Website page to test
-        :return: Returns list of seconds, which take driver to fully load website page without imonomy tag
+        :return: Dictionary in the shape of Crawler.scan_with_tag, None if there is no healthy proxy
         """
-        Crawler.prepare(website, with_tag=False)
-        time_measures = {'without_tag': [], 'position': False}
-        log.info('Processing website %s without tag' % website)
-        for _ in xrange(Crawler.configuration[website]['scans_number']):
+        if Crawler.configuration[website]['is_layer_active']:
+            tag_lookup_name = LAYER_TAG_LOOKUP_NAME
+        else:
+            tag_lookup_name = TAG_LOOKUP_NAME
 
-            # Clear cookies and go to website url
-            Crawler.driver.delete_all_cookies()
-            start_loading_page = time.time()
+        proxy_server = Crawler.select_proxy(website)
+        if proxy_server is False:
+            raise gen.Return(None)
+        tab = None
+        try:
+            with metrics.span('browser_acquire'):
+                browser = yield chrome_pool.browser(proxy_server)
+                tab = yield browser.new_tab()
+            with metrics.span('navigation'):
+                yield tab.navigate(website, int(config.get('loading', 'timeout_page_load')))
+            start_loading_page = tab.document_request()['wallTime']
+            with metrics.span('script_injection'):
+                start_loading_tag = (yield tab.evaluate(browser_scripts.as_expression(
+                    browser_scripts.with_inject_time(Crawler.configuration[website]['script'])))) / 1000.0
+
+            deadline = IOLoop.current().time() + int(config.get('loading', 'timeout_script'))
+            with metrics.span('wait_milestones'):
+                tag = yield tab.wait_for_request(lambda request: tag_lookup_name in request['request']['url'],
+                                                 deadline)
+                pixel_990 = yield tab.wait_for_request(
+                    lambda request: request.get('type') == 'Image' and '990' in request['request']['url'], deadline)
+                pixel_unit = yield tab.wait_for_request(
+                    lambda request: request.get('type') == 'Image' and ('ai=985' in request['request']['url'] or
+                                                                        'ai=983' in request['request']['url']),
+                    deadline)
+
+            scan = {'preload': None, '990': None, 'with_tag': None, 'layer': None, 'unit': (None, None), 'har': None}
+            if tag:
+                scan['preload'] = tag['wallTime'] - start_loading_tag
+            else:
+                log.error('Our script took too much time to load')
+            if pixel_990:
+                scan['with_tag'] = pixel_990['wallTime'] - start_loading_page
+                scan['990'] = pixel_990['wallTime'] - start_loading_tag
+                if tag:
+                    scan['layer'] = pixel_990['wallTime'] - tag['wallTime']
+                log.info('Located layer and effective_page_view pixel')
+            if pixel_unit:
+                scan['unit'] = (Crawler.parse_unit_id(pixel_unit['request']['url']),
+                                pixel_unit['wallTime'] - start_loading_tag)
+            else:
+                log.error('No ad units were found on web page because of timeout %s' % (website,))
+
+            with metrics.span('page_timing'):
+                scan.update((yield tab.evaluate(browser_scripts.as_expression(browser_scripts.COLLECT_PAGE_TIMING,
+                                                                              TAG_HOST))))
+        except Exception as e:
+            log.error('Error processing %s. Error: %s' % (website, e))
+            Crawler.count_error(website, proxy_server, e)
+            scan = {'preload': None, '990': None, 'with_tag': None, 'layer': None, 'unit': (None, None),
+                    'navigation': None, 'tag_resources': None, 'har': None}
+            if isinstance(e, (gen.TimeoutError, DevToolsError)):
+                yield IOLoop.current().run_in_executor(None, Crawler.proxy_manager.report_failure, proxy_server)
+        scan['proxy'] = proxy_server
+        scan['proxy_rtt'] = Crawler.proxy_manager.rtt(proxy_server)
+        yield Crawler.close_tab(tab)
+        raise gen.Return(scan)
+
+    @staticmethod
+    @gen.coroutine
+    def scan_without_tag_cdp(chrome_pool, website, check_position=False):
+        """
+            Runs one scan of website without tag in a fresh browser context of headless Chrome, tag requests are
+            blocked by the page. Loading time is taken from browser's monotonic timestamps of document request and
+            load event.
+        :param chrome_pool: Pool of headless Chrome processes
+        :param website: Website page to test
+        :param check_position: Boolean flag indicates whenever we want to check position of imonomy tag on loaded page
+        :return: Dictionary in the shape of Crawler.scan_without_tag, None if there is no healthy proxy
+        """
+        proxy_server = Crawler.select_proxy(website)
+        if proxy_server is False:
+            raise gen.Return(None)
+        scan = {'without_tag': None, 'navigation': None}
+        tab = None
+        try:
+            with metrics.span('browser_acquire'):
+                browser = yield chrome_pool.browser(proxy_server)
+                tab = yield browser.new_tab(blocked_urls=['*%s*' % (TAG_HOST,)])
             try:
-                Crawler.driver.get(website)
-            except TimeoutException:
+                with metrics.span('navigation'):
+                    end_loading_page = yield tab.navigate(website, int(config.get('loading', 'timeout_page_load')))
+                scan['without_tag'] = end_loading_page - tab.document_request()['timestamp']
+            except gen.TimeoutError as e:
+                # Timed out load is a failed scan (None), as in with tag phase, not a sample of loading time
                 log.info('Timeout loading webpage %s' % (website,))
+                Crawler.count_error(website, proxy_server, e)
+                yield IOLoop.current().run_in_executor(None, Crawler.proxy_manager.report_failure, proxy_server)
+
+            with metrics.span('page_timing'):
+                scan['navigation'] = (yield tab.evaluate(browser_scripts.as_expression(
+                    browser_scripts.COLLECT_PAGE_TIMING, TAG_HOST)))['navigation']
+            if check_position:
+                with metrics.span('tag_position'):
+                    scan['tag_position'] = yield tab.evaluate(
+                        browser_scripts.as_expression(browser_scripts.TAG_POSITION))
+                scan['position'] = Crawler.get_position(website, scan['tag_position'])
+        except Exception as e:
+            log.error('Error processing %s. Error: %s' % (website, e))
+            Crawler.count_error(website, proxy_server, e)
+        scan['proxy'] = proxy_server
+        scan['proxy_rtt'] = Crawler.proxy_manager.rtt(proxy_server)
+        yield Crawler.close_tab(tab)
+        raise gen.Return(scan)
+
+    @staticmethod
+    @gen.coroutine
+    def close_tab(tab):
+        """
+            Closes page of a cdp scan, browser may be gone already
+        """
+        if tab is None:
+            return
+        try:
+            yield tab.close()
+        except Exception as e:
+            log.error('Failed to close page. Error: %s' % (e,))
+
+    @staticmethod
+    def measure_tag_polling(website, tag_lookup_name, start_loading_page):
+        """
+            Injects tag into loaded page and measures tag milestones by polling driver with WebDriverWait
+        :param website: Website page, which is loaded in Crawler.driver
+        :param tag_lookup_name: Part of tag script src to look for
+        :param start_loading_page: Time when page request started
+        :return: Dictionary with preload, 990, with_tag, layer and unit (unit_id, load time) measures of one scan
+        """
+        # Inject tag and start counting time from executing script
+        with metrics.span('script_injection'):
+            Crawler.driver.execute_script(Crawler.configuration[website]['script'])
+        start_loading_tag = time.time()
+
+        # Init variables for end time
+        end_loading_tag = None
+        end_loading_990 = None
+        end_loading_page = None
+        end_loading_unit = None
+        end_loading_layer = None
+        unit_id = None
+        try:
+            wait = WebDriverWait(Crawler.driver, timeout=int(config.get('loading', 'timeout_script')),
+                                 poll_frequency=0.1)
+            with metrics.span('wait_tag'):
+                wait.until(
+                    expected_conditions.presence_of_element_located(
+                        (By.CSS_SELECTOR, "script[src*='%s']" % (tag_lookup_name,))))
+            end_loading_tag = time.time() - start_loading_tag
+            start_loading_layer = time.time()
+            with metrics.span('wait_990'):
+                wait.until(
+                    expected_conditions.presence_of_element_located(
+                        (By.CSS_SELECTOR, "img[src*='990']")))
 
             end_loading_page = time.time() - start_loading_page
+            end_loading_990 = time.time() - start_loading_tag
+            end_loading_layer = time.time() - start_loading_layer
+            log.info('Located layer and effective_page_view pixel. Trying to locate shown pixel (985)')
+        except TimeoutException as e:
+            # Milestones which weren't reached stay None and are counted as failures
+            log.error('Our script took too much time to load')
+            Crawler.count_error(website, Crawler.current_proxy(), e)
+        except NoSuchElementException:
+            log.error('Our script wasn\'t located in source of web page %s' % (website, ))
+        finally:
+            try:
+                unit_id = None
+                end_loading_unit = None
+                with metrics.span('wait_unit'):
+                    wait.until(expected_conditions.presence_of_element_located(
+                        (By.CSS_SELECTOR, "img[src*='ai=985'], img[src*='ai=983']")
+                    ))
+                end_loading_unit = time.time() - start_loading_tag
+                unit_id = Crawler.driver.find_element_by_css_selector("img[src*='ai=985'], img[src*='ai=983']")
+                unit_id = Crawler.parse_unit_id(unit_id.get_attribute('src'))
+            except TimeoutException as e:
+                log.error('No ad units were found on web page because of timeout %s' % (website,))
+                Crawler.count_error(website, Crawler.current_proxy(), e)
+            except NoSuchElementException:
+                log.error('Shown wasn\'t located in web page %s' % (website, ))
+
+        return {'preload': end_loading_tag, '990': end_loading_990, 'with_tag': end_loading_page,
+                'layer': end_loading_layer, 'unit': (unit_id, end_loading_unit)}
+
+    @staticmethod
+    def measure_tag_observer(website, tag_lookup_name, start_loading_page):
+        """
+            Injects tag into loaded page together with observer script, which records performance.now() timestamps
+            of tag milestones as they appear in DOM. All timestamps are fetched with one asynchronous script call
+            after the chain ends or timeout_script passes, so timings come from browser's own clock. with_tag is
+            measured from start_loading_page as in polling mode, browser's navigation start is converted with wall
+            clock shared by browser and crawler.
+        :param website: Website page, which is loaded in Crawler.driver
+        :param tag_lookup_name: Part of tag script src to look for
+        :param start_loading_page: Time when page request started
+        :return: Dictionary with preload, 990, with_tag, layer and unit (unit_id, load time) measures of one scan
+        """
+        with metrics.span('script_injection'):
+            Crawler.driver.execute_script(
+                browser_scripts.INSTALL_TIMING_OBSERVER + Crawler.configuration[website]['script'], tag_lookup_name)
+        with metrics.span('wait_milestones'):
+            marks = Crawler.driver.execute_async_script(browser_scripts.COLLECT_TIMING_MARKS,
+                                                        int(config.get('loading', 'timeout_script')) * 1000)
+
+        end_loading_tag, end_loading_990, end_loading_page, end_loading_layer = None, None, None, None
+        if marks.get('tag') is not None:
+            end_loading_tag = (marks['tag'] - marks['inject']) / 1000.0
+        else:
+            log.error('Our script took too much time to load')
+        if marks.get('990') is not None:
+            end_loading_page = (marks['navigation_start'] + marks['990']) / 1000.0 - start_loading_page
+            end_loading_990 = (marks['990'] - marks['inject']) / 1000.0
+            if marks.get('tag') is not None:
+                end_loading_layer = (marks['990'] - marks['tag']) / 1000.0
+            log.info('Located layer and effective_page_view pixel')
+
+        unit_id = None
+        end_loading_unit = None
+        if marks.get('unit') is not None:
+            end_loading_unit = (marks['unit'] - marks['inject']) / 1000.0
+            unit_id = Crawler.parse_unit_id(marks['unit_src'])
+        else:
+            log.error('No ad units were found on web page because of timeout %s' % (website,))
+
+        return {'preload': end_loading_tag, '990': end_loading_990, 'with_tag': end_loading_page,
+                'layer': end_loading_layer, 'unit': (unit_id, end_loading_unit)}
+
+    @staticmethod
+    def collect_page_timing():
+        """
+            Collects Navigation Timing of the page loaded in Crawler.driver and Resource Timing summary of tag requests
+        :return: Dictionary with navigation (dns, connect, ttfb, dom_content_loaded, load in seconds) and
+                 tag_resources (requests, bytes, duration, script_time)
+        """
+        with metrics.span('page_timing'):
+            return Crawler.driver.execute_script(browser_scripts.COLLECT_PAGE_TIMING, TAG_HOST)
 
-            time_measures['without_tag'].append(end_loading_page)
+    @staticmethod
+    def collect_har():
+        """
+            Summarizes tag requests of HAR recorded by browsermob proxy of Crawler.driver during the scan
+        :return: Dictionary with requests, bytes, load_span and timings (see har_capture.summarize_har) or None
+                 if HAR capture is disabled
+        """
+        if not Crawler.proxy:
+            return None
+        with metrics.span('har_summary'):
+            return har_capture.summarize_har(Crawler.proxy.har, TAG_URL_PATTERN)
 
-        # Position is determined following way:
-        # False (Wrong) if preload.js is inside <head></head> or it's not in 30% of end of the <body></body>
-        # Otherwise True (OK)
-        source = BeautifulSoup(Crawler.driver.page_source, "html.parser")
-        source_body = source.body
+    @staticmethod
+    def parse_unit_id(src):
+        """
+            Parses ad unit id from end of chain pixel src (985 - shown, 983 - no ad units because of caps)
+        :param src: Pixel src
+        :return: Unit id, 'Failed on caps' or None if src can't be parsed
+        """
+        query = parse_qs(src)
         try:
-            if source.head.find_all(src=re.compile('preload')) or (source_body.find(src=re.compile('preload.js')) and
-                                                                   source_body.index(source_body.find(
-                                                                       src=re.compile('preload.js')))/float(len(source_body)) < 0.7):
+            if query['ai'][0] == '983':
+                log.info('No Adunits because of caps')
+                return 'Failed on caps'
+            unit_id, = query['uid']
+            log.info('Located ad unit %s' % unit_id)
+            return unit_id
+        except KeyError:
+            log.error('Error parsing end of chain pixel src')
 
-                time_measures['position'] = (False, "Tag is located in <head>")
-            else:
-                time_measures['position'] = True
-        except ValueError:
-            log.error('Tag is located in one of <body></body> children. Website %s' % website)
-            time_measures['position'] = (False, "Tag is located in one of <body></body> children.")
+    @staticmethod
+    def test_load_time_without_tag(website):
+        """
+                Tests loading time without imonomy tag. Seconds, which take driver to fully load website page without
+                imonomy tag and navigation timing of every scan are stored in Crawler.scan_store, last scan also
+                stores position of imonomy tag.
+        :param website: Website page to test
+        """
+        log.info('Processing website %s without tag' % website)
+        scans_number = Crawler.configuration[website]['scans_number']
+        done = Crawler.scan_store.done_scans(Crawler.run_id, website, 'without_tag')
+        for scan_index in xrange(scans_number):
+            if scan_index in done:
+                continue
+            if not Crawler.proxy_available(website):
+                break
+            # Position of the tag is checked on the last loaded page
+            scan = Crawler.scan_without_tag(website, check_position=scan_index == scans_number - 1)
+            if scan is None:
+                break
+            Crawler.record_scan(website, 'without_tag', scan_index, scan)
 
-        Crawler.driver.quit()
-        return time_measures
+    @staticmethod
+    def scan_without_tag(website, check_position=False):
+        """
+            Runs one scan of website without tag on a warm driver
+        :param website: Website page to test
+        :param check_position: Boolean flag indicates whenever we want to check position of imonomy tag on loaded page
+        :return: Dictionary with without_tag and navigation measures (and position with tag_position if it was
+                 checked), without_tag is None if page didn't load. None if there is no healthy proxy, so scan is
+                 skipped.
+        """
+        proxy_server = Crawler.select_proxy(website)
+        if proxy_server is False:
+            return None
+        Crawler.prepare(proxy_server, with_tag=False)
+        if Crawler.driver is None:
+            # Driver couldn't be prepared (e.g. Chrome failed to launch), scan is recorded as failed
+            log.error('Failed to prepare driver for %s, skipping scan without tag' % (website,))
+            return {'without_tag': None, 'navigation': None, 'proxy': Crawler.current_proxy(),
+                    'proxy_rtt': Crawler.proxy_rtt}
+
+        # Go to website url
+        broken = False
+        end_loading_page = None
+        start_loading_page = time.time()
+        try:
+            with metrics.span('navigation'):
+                Crawler.driver.get(website)
+            end_loading_page = time.time() - start_loading_page
+        except TimeoutException as e:
+            # Timed out load is a failed scan (None), as in with tag phase, not a sample of loading time
+            log.info('Timeout loading webpage %s' % (website,))
+            Crawler.count_error(website, Crawler.current_proxy(), e)
+            Crawler.report_proxy_failure()
+        except WebDriverException as e:
+            log.error('Error processing %s. Error: %s' % (website, e))
+            Crawler.count_error(website, Crawler.current_proxy(), e)
+            Crawler.report_proxy_failure()
+            broken = True
+
+        scan = {'without_tag': end_loading_page, 'navigation': None, 'proxy': Crawler.current_proxy(),
+                'proxy_rtt': Crawler.proxy_rtt}
+        if not broken:
+            try:
+                scan['navigation'] = Crawler.collect_page_timing()['navigation']
+            except WebDriverException as e:
+                log.error('Failed to collect navigation timing of %s. Error: %s' % (website, e))
+
+        if check_position and not broken:
+            scan['tag_position'] = Crawler.get_tag_position()
+            scan['position'] = Crawler.get_position(website, scan['tag_position'])
+        Crawler.release_driver(broken)
+        return scan
 
     @staticmethod
     @catching
+    def get_tag_position():
+        """
+            Finds imonomy tag in the page currently loaded in Crawler.driver with one DOM query, so page source isn't
+            transferred and parsed
+        :return: Dictionary with location, depth, index, count, async and defer (see tag_position.verdict)
+        """
+        with metrics.span('tag_position'):
+            return Crawler.driver.execute_script(browser_scripts.TAG_POSITION)
+
+    @staticmethod
+    def get_position(website, position):
+        """
+            Checks position of imonomy tag. Position is wrong if tag is inside <head></head>, nested in one of
+            <body></body> children or not in 30% of end of the <body></body>.
+        :param website: Website page, which is loaded
+        :param position: Tag position found in the page or None if it couldn't be found
+        :return: True if position is OK, otherwise tuple (False, reason)
+        """
+        result = tag_position.verdict(position)
+        if result is not True:
+            log.error('%s Website %s' % (result[1], website))
+        return result
+
+    @staticmethod
     def test_load_time(website):
         """
         Method measures loading time for websites with/without imonomy tag.
         Workflow is following:
             1) Open website page we need to run tests on via Selenium
             2) Inject our tag with execute_script function and measure time with callback-based WebDriver.
+            3) Store time measurements of every scan in Crawler.scan_store
         :param website:
-        :return: time measurement statistics
         """
+        if config.getboolean('adaptive', 'enabled'):
+            Crawler.test_load_time_adaptive(website)
+            return
+
         log.info('Started processing website %s, it has %s runs' %
                  (website, Crawler.configuration[website]['scans_number']))
 
-        results_with_tag = Crawler.test_load_time_with_tag(website)
-        results_without_tag = Crawler.test_load_time_without_tag(website)
+        Crawler.test_load_time_with_tag(website)
+        Crawler.test_load_time_without_tag(website)
+
+        log.info('Finished processing website %s' % website)
+
+    @staticmethod
+    def test_load_time_adaptive(website):
+        """
+            Adaptive alternative of fixed scans_number phases. With tag and without tag scans are alternated, so both
+            phases see the same network conditions, and sampling stops as soon as bootstrap confidence interval of
+            slowdown is narrower than adaptive.ci_width (after at least adaptive.min_scans scans) or
+            adaptive.max_scans is reached. Position of imonomy tag is checked on the first without tag scan.
+        :param website: Website page to test
+        """
+        min_scans = int(config.get('adaptive', 'min_scans'))
+        max_scans = int(config.get('adaptive', 'max_scans'))
+        ci_width = float(config.get('adaptive', 'ci_width'))
+        log.info('Started processing website %s adaptively, %s to %s runs' % (website, min_scans, max_scans))
+
+        done_with_tag = Crawler.scan_store.done_scans(Crawler.run_id, website, 'with_tag')
+        done_without_tag = Crawler.scan_store.done_scans(Crawler.run_id, website, 'without_tag')
+        for scan_index in xrange(max_scans):
+            if not Crawler.proxy_available(website):
+                break
+            if scan_index not in done_with_tag:
+                scan = Crawler.scan_with_tag(website)
+                if scan is None:
+                    break
+                Crawler.record_scan(website, 'with_tag', scan_index, scan)
+            if scan_index not in done_without_tag:
+                scan = Crawler.scan_without_tag(website, check_position=scan_index == 0)
+                if scan is None:
+                    break
+                Crawler.record_scan(website, 'without_tag', scan_index, scan)
+            if scan_index + 1 < min_scans:
+                continue
+
+            low, high = stats.slowdown_interval(
+                [scan['with_tag'] for scan in Crawler.scan_store.scans(Crawler.run_id, website, 'with_tag')],
+                [scan['without_tag'] for scan in Crawler.scan_store.scans(Crawler.run_id, website, 'without_tag')],
+                trim=float(config.get('statistics', 'trim')),
+                resamples=int(config.get('statistics', 'bootstrap_resamples')),
+                confidence=float(config.get('statistics', 'confidence')))
+            if low is not None and high - low < ci_width:
+                log.info('Slowdown of %s is stable after %s runs: %s - %s' % (website, scan_index + 1, low, high))
+                break
 
+        log.info('Finished processing website %s' % website)
+
+    @staticmethod
+    @catching
+    def merge_measures(results_with_tag, results_without_tag):
+        """
+            Merges with/without tag phase measures into one results entry for a website
+        :param results_with_tag: Dictionary of with tag measure lists
+        :param results_without_tag: Dictionary of without tag measure lists and position of imonomy tag
+        :return: time measurement statistics
+        """
         time_measures = {'preload': results_with_tag['preload'],
                          'without_tag': results_without_tag['without_tag'],
                          '990': results_with_tag['990'],
                          'with_tag': results_with_tag['with_tag'],
                          'position': results_without_tag['position'],
+                         'tag_position': results_without_tag['tag_position'],
                          'layer': results_with_tag['layer'],
-                         'unit': results_with_tag['unit']}
-
-        log.info('Finished processing website %s' % website)
+                         'unit': results_with_tag['unit'],
+                         'navigation_with_tag': results_with_tag['navigation'],
+                         'navigation_without_tag': results_without_tag['navigation'],
+                         'tag_resources': results_with_tag['tag_resources'],
+                         'har': results_with_tag['har'],
+                         'proxy_rtt_with_tag': results_with_tag['proxy_rtt'],
+                         'proxy_rtt_without_tag': results_without_tag['proxy_rtt'],
+                         'scans_used': results_with_tag['scans_used']}
         return time_measures
 
     @staticmethod
     @catching
     def get_configurations():
-        res = db.query("QUERY PLACEHOLDER")
+        res = Crawler.website_source.websites()
         configurations = {
             website['website_page']:
                 {
@@ -375,63 +1339,66 @@ class Crawler(object):
     @staticmethod
     @catching
     def store(results):
-        log.info('Creating an csv document with results of run')
-        output_file = Crawler.create_name()
-        with open(output_file, 'w+') as file_handler:
-            csv_writer = writer(file_handler, dialect="excel")
-            for website in results:
-                csv_writer.writerow([website] + range(1, Crawler.configuration[website]['scans_number']+1))
-                csv_writer.writerow(['Loading time without tag'] + results[website]['without_tag'])
-                csv_writer.writerow(['Loading time with tag'] + results[website]['with_tag'])
-                csv_writer.writerow(['Preload loading time'] + results[website]['preload'])
-                csv_writer.writerow(['Layer loading time'] + results[website]['layer'])
-                csv_writer.writerow(['990 loading time'] + results[website]['990'])
-                csv_writer.writerow([])
-        Crawler.send_mail(output_file, results)
-
-    @staticmethod
-    @catching
-    def create_name():
-        filename_pattern = config.get('results', 'filename_pattern')
-        filename_pattern = filename_pattern.format(datetime.now().__str__().split('.')[0])
-        return filename_pattern
+        """
+            Stores results of the run with Crawler.result_sink and Crawler.history and sends them with Crawler.notifier
+        :param results: Results dictionary, time measurement statistics for every website
+        """
+        if Crawler.history:
+            with metrics.span('history'):
+                Crawler.history.add_run('run %s of %s' % (Crawler.run_id, config.get('results', 'store_path')),
+                                        time.time(), results)
+        with metrics.span('result_sink'):
+            output_file = Crawler.result_sink.store(results, Crawler.run_id)
+        with metrics.span('email'):
+            Crawler.notifier.send(output_file, results=results, config=Crawler.configuration,
+                                  thresholds=Crawler.thresholds, pool_stats=Crawler.pool_stats)
 
-    @staticmethod
-    @catching
-    def generate_template(results):
-        return template.generate(results)
 
-    @staticmethod
-    @catching
-    def send_mail(output_file, results):
-        log.info("Sending email with results")
-        msg = MIMEMultipart()
-        msg['Subject'] = 'Results for automated page loading scan tool on %s' %\
-                         (datetime.now().__str__().split('.')[0],)
-        to = config.get('results', 'receivers').split(',')
-        emailto = ', '.join(to)
-        msg['From'] = gmail_user
-        msg['To'] = emailto
-        msg.preamble = 'Results for automated page loading scan tool'
-        html = MIMEText(template.generate(results=results, config=Crawler.configuration,
-                                          thresholds=Crawler.thresholds),
-                        'html', _charset='utf-8')
-        msg.attach(html)
-        if not os.path.isfile(output_file):
-            log.error('Something went wrong with results file. Aborting')
-            return
-        with open(output_file, "rb") as file_handler:
-            part = MIMEApplication(
-                file_handler.read(),
-                Name=os.path.basename(output_file)
-            )
-            part['Content-Disposition'] = 'attachment; filename="%s"' % os.path.basename(output_file)
-            msg.attach(part)
-        server = smtplib.SMTP(gmail_host, gmail_port)
-        server.ehlo()
-        server.starttls()
-        server.login(gmail_user, gmail_password)
-        server.sendmail(gmail_user, to, msg.as_string())
-        server.close()
+def init_worker(configuration, thresholds, semaphores, run_id, har_server_url, proxy_manager):
+    """
+        Initializer of parallel mode worker process, sets up Crawler static variables. Worker creates its own
+        browsermob proxies on server of parent process, so HARs of parallel scans don't mix. Proxy health probed by
+        parent process is copied to every worker, which re-probes it on its own afterwards.
+    """
+    metrics.REGISTRY.reset()
+    Crawler.configuration = configuration
+    Crawler.thresholds = thresholds
+    Crawler.proxy_manager = proxy_manager
+    Crawler.proxy_semaphores = semaphores
+    Crawler.run_id = run_id
+    Crawler.scan_store = ScanStore(config.get('results', 'store_path'))
+    Crawler.driver_pool = Crawler.create_driver_pool()
+    # Quit warm drivers when worker process exits
+    Finalize(Crawler.driver_pool, Crawler.driver_pool.close, exitpriority=10)
+    if har_server_url:
+        Crawler.har_proxies = Crawler.create_har_proxies(har_server_url)
+        Finalize(Crawler.har_proxies, Crawler.har_proxies.close, exitpriority=5)
+    # Every worker dumps its own profile when it exits
+    Crawler.profiler = metrics.create_profiler(config)
+    if Crawler.profiler:
+        Crawler.profiler.start()
+        Finalize(Crawler.profiler, Crawler.profiler.dump, args=(run_id,), exitpriority=1)
 
 
+def run_phase(phase):
+    """
+        Runs one with/without tag phase of a website inside worker process. Holds proxy country semaphore while
+        the phase is running.
+    :param phase: Tuple (website, with_tag), with_tag is None for adaptive mode website
+    :return: Tuple (worker pid, worker driver pool statistics, metrics collected since previous phase, website)
+    """
+    website, with_tag = phase
+    semaphore = Crawler.proxy_semaphores.get(Crawler.configuration[website]['geo'])
+    if semaphore:
+        semaphore.acquire()
+    try:
+        if with_tag is None:
+            Crawler.test_load_time_adaptive(website)
+        elif with_tag:
+            Crawler.test_load_time_with_tag(website)
+        else:
+            Crawler.test_load_time_without_tag(website)
+    finally:
+        if semaphore:
+            semaphore.release()
+    return os.getpid(), Crawler.driver_pool.stats(), metrics.REGISTRY.drain(), website
@@ -0,0 +1,130 @@
+import time
+
+from logging import getLogger
+from collections import OrderedDict
+
+from selenium.common.exceptions import WebDriverException
+
+log = getLogger('crawler')
+
+
+class DriverPool(object):
+    """
+        Pool of warm ChromeDriver instances keyed by launch profile. Drivers are handed out for a single scan, their
+        state (cookies, cache and storage of every origin) is reset over DevTools protocol on release instead of
+        restarting Chrome. Driver is recycled after max_uses scans, when it is released as broken (crashed) or when
+        its state can't be reset, i.e. Selenium has no DevTools commands. At most max_idle drivers are kept warm, least
+        recently used one is quit, so many profiles (proxies) don't keep a Chrome each.
+    """
+
+    def __init__(self, factory, max_uses, max_idle=None):
+        """
+        :param factory: Callable, which launches new driver for given profile
+        :param max_uses: Number of scans after which driver is quit and replaced by a fresh one
+        :param max_idle: Maximum number of idle drivers of all profiles, None for no limit
+        """
+        self.factory = factory
+        self.max_uses = max_uses
+        self.max_idle = max_idle
+        self.idle = {}  # Profile -> list of warm drivers
+        self.recent = OrderedDict()  # Idle driver -> profile, least recently released first
+        self.uses = {}  # Driver -> number of scans it has served
+        self.launches = 0  # Number of Chrome launches
+        self.launch_time = 0.0  # Total seconds spent launching Chrome
+        self.reuses = 0  # Number of times warm driver was handed out instead of launching a new one
+
+    def acquire(self, profile):
+        """
+            Returns warm driver for given profile or launches a new one
+        :param profile: Hashable launch profile, e.g. (geo, with_tag)
+        :return: ChromeDriver
+        """
+        idle = self.idle.get(profile)
+        if idle:
+            self.reuses += 1
+            driver = idle.pop()
+            del self.recent[driver]
+            return driver
+        start_launch = time.time()
+        driver = self.factory(profile)
+        self.launch_time += time.time() - start_launch
+        self.launches += 1
+        self.uses[driver] = 0
+        return driver
+
+    def release(self, profile, driver, broken=False):
+        """
+            Returns driver back to the pool, resetting its state. Quits driver if it's broken or worn out.
+        :param profile: Profile driver was acquired for
+        :param driver: ChromeDriver
+        :param broken: Boolean flag indicates driver crashed during scan and can't be reused
+        """
+        self.uses[driver] += 1
+        # Without DevTools commands only cookies and storage of current origin could be cleared
+        if not broken and self.uses[driver] < self.max_uses and hasattr(driver, 'execute_cdp_cmd'):
+            try:
+                self.reset(driver)
+                self.idle.setdefault(profile, []).append(driver)
+                self.recent[driver] = profile
+                self.evict()
+                return
+            except WebDriverException as e:
+                log.error('Failed to reset driver, recycling it. Error: %s' % (e,))
+        self.discard(driver)
+
+    def evict(self):
+        """
+            Quits least recently used idle drivers over max_idle
+        """
+        while self.max_idle is not None and len(self.recent) > self.max_idle:
+            driver, profile = self.recent.popitem(last=False)
+            self.idle[profile].remove(driver)
+            self.discard(driver)
+
+    def discard(self, driver):
+        """
+            Quits driver and forgets about it
+        """
+        del self.uses[driver]
+        try:
+            driver.quit()
+        except WebDriverException as e:
+            log.error('Failed to quit driver. Error: %s' % (e,))
+
+    @staticmethod
+    def reset(driver):
+        """
+            Clears cookies, cache and storage (local, session, IndexedDB, service workers, ...) of every origin, so
+            third-party frames start cold too, then leaves the page
+        """
+        try:
+            # Session storage lives in the tab, it isn't covered by clearing data of origins
+            driver.execute_script('window.sessionStorage.clear();')
+        except WebDriverException:
+            log.debug('Session storage is not accessible on %s' % (driver.current_url,))
+        driver.execute_cdp_cmd('Storage.clearDataForOrigin', {'origin': '*', 'storageTypes': 'all'})
+        driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+        driver.execute_cdp_cmd('Network.clearBrowserCache', {})
+        driver.get('about:blank')
+
+    def close(self):
+        """
+            Quits all idle drivers
+        """
+        for profile in self.idle:
+            for driver in self.idle[profile]:
+                self.discard(driver)
+        self.idle = {}
+        self.recent = OrderedDict()
+
+    def stats(self):
+        """
+            Startup statistics of the pool. Saved time is estimated as number of reuses multiplied by average
+            Chrome launch time.
+        :return: Dictionary with launches, reuses, launch_time and saved_time (seconds)
+        """
+        average_launch = self.launch_time / self.launches if self.launches else 0.0
+        return {'launches': self.launches,
+                'reuses': self.reuses,
+                'launch_time': self.launch_time,
+                'saved_time': self.reuses * average_launch}
@@ -0,0 +1,124 @@
+import re
+import requests
+
+from datetime import datetime
+from logging import getLogger
+from urlparse import urlparse
+
+from browsermobproxy import Client
+
+log = getLogger('crawler')
+
+
+class HarProxyPool(object):
+    """
+        Long-lived browsermob proxies keyed by public proxy, created on a shared browsermob server. Proxy chains to its
+        public proxy and blacklists tag requests while it serves scans without tag, so one Chrome per public proxy
+        serves both phases. Every process has its own pool, so HARs of parallel workers don't mix.
+    """
+
+    def __init__(self, server_url, tag_pattern):
+        """
+        :param server_url: Url of browsermob server REST API, e.g. localhost:8080
+        :param tag_pattern: Regular expression of tag request urls
+        """
+        self.server_url = server_url
+        self.tag_pattern = tag_pattern
+        self.proxies = {}
+        self.blocking = {}  # Public proxy -> True if its browsermob proxy blacklists the tag
+
+    def proxy(self, upstream, with_tag=None):
+        """
+            Returns proxy client chained to public proxy, creating it on first use
+        :param upstream: Public proxy (host:port) or None for scans without proxy
+        :param with_tag: Boolean flag indicates the tag is let through (True) or blacklisted (False) from now on,
+                         None keeps blacklist as it is
+        """
+        if upstream not in self.proxies:
+            params = {}
+            if upstream:
+                params['httpProxy'] = upstream
+            self.proxies[upstream] = Client(self.server_url, params=params)
+            self.blocking[upstream] = False
+            log.info('Created browsermob proxy %s for public proxy %s' % (self.proxies[upstream].proxy, upstream))
+        proxy = self.proxies[upstream]
+        if with_tag is not None and self.blocking[upstream] == with_tag:
+            if with_tag:
+                requests.delete('%s/proxy/%s/blacklist' % (proxy.host, proxy.port)).raise_for_status()
+            else:
+                proxy.blacklist(self.tag_pattern, 204)
+            self.blocking[upstream] = not with_tag
+        return proxy
+
+    def close(self):
+        for upstream in self.proxies:
+            self.proxies[upstream].close()
+        self.proxies = {}
+        self.blocking = {}
+
+
+def request_key(url):
+    """
+        Url without query string, so requests of the same chain step are grouped between scans
+    """
+    url = urlparse(url)
+    return '%s://%s%s' % (url.scheme, url.netloc, url.path)
+
+
+def parse_started(started):
+    """
+        Parses HAR startedDateTime, timezone is ignored as all entries come from the same proxy
+    """
+    return datetime.strptime(started[:23], '%Y-%m-%dT%H:%M:%S.%f')
+
+
+def summarize_har(har, tag_pattern):
+    """
+        Summarizes tag requests of a HAR
+    :param har: HAR dictionary
+    :param tag_pattern: Regular expression of tag request urls
+    :return: Dictionary with requests count, bytes (headers and body), load_span (seconds from first tag request
+             start till last tag response end, requests in between may run in parallel) and timings (request key ->
+             seconds)
+    """
+    entries = [entry for entry in har['log']['entries'] if re.search(tag_pattern, entry['request']['url'])]
+    summary = {'requests': len(entries), 'bytes': 0, 'load_span': 0, 'timings': {}}
+    if not entries:
+        return summary
+    start = None
+    end = None
+    for entry in entries:
+        summary['bytes'] += max(entry['response'].get('bodySize', 0), 0) + \
+            max(entry['response'].get('headersSize', 0), 0)
+        key = request_key(entry['request']['url'])
+        summary['timings'][key] = summary['timings'].get(key, 0) + entry['time'] / 1000.0
+        started = parse_started(entry['startedDateTime'])
+        finished = (started - datetime(1970, 1, 1)).total_seconds() + entry['time'] / 1000.0
+        started = (started - datetime(1970, 1, 1)).total_seconds()
+        start = started if start is None else min(start, started)
+        end = finished if end is None else max(end, finished)
+    summary['load_span'] = end - start
+    return summary
+
+
+def aggregate(summaries, slowest=5):
+    """
+        Averages HAR summaries of website scans
+    :param summaries: List of summarize_har dictionaries (None for scans without HAR)
+    :param slowest: Number of slowest chain requests to report
+    :return: Dictionary with average requests, bytes, load_span and slowest list of (request key, average
+             seconds, number of scans with the request), or None if there is no HAR
+    """
+    summaries = [summary for summary in summaries if summary]
+    if not summaries:
+        return None
+    timings = {}
+    for summary in summaries:
+        for key in summary['timings']:
+            timings.setdefault(key, []).append(summary['timings'][key])
+    requests = sorted(((key, sum(timings[key]) / len(timings[key]), len(timings[key])) for key in timings),
+                      key=lambda request: request[1], reverse=True)
+    return {'requests': sum(summary['requests'] for summary in summaries) / float(len(summaries)),
+            'bytes': sum(summary['bytes'] for summary in summaries) / float(len(summaries)),
+            'load_span': sum(summary['load_span'] for summary in summaries) / float(len(summaries)),
+            'slowest': requests[:slowest]}
@@ -0,0 +1,228 @@
+"""
+    Columnar history of loading time measurements. Every measured value is a row of four numpy columns (website, run,
+    metric, value) kept sorted by website and run in one compressed npz file, so history of a website is a binary
+    search away. Existing csv results are imported with:
+
+        python tool/history.py history.npz "loading_results_2017-05-18 13:31:06.csv" [...]
+"""
+import os
+import re
+import sys
+import csv
+import time
+
+import numpy
+
+import stats
+
+# Metrics kept in history and labels of their rows in csv results
+HISTORY_METRICS = ('without_tag', 'with_tag', 'preload', 'layer', '990')
+CSV_LABELS = {'Loading time without tag': 'without_tag',
+              'Loading time with tag': 'with_tag',
+              'Preload loading time': 'preload',
+              'Layer loading time': 'layer',
+              '990 loading time': '990'}
+CSV_DATE = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}')
+# Value legacy csv results have for failed measurements
+CSV_FAILED = 100.0
+
+
+class HistoryStore(object):
+    """
+        History of runs in npz file. Runs are identified by source (csv file name or id of crawler run), so
+        importing the same source twice is a no-op.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.load()
+
+    def load(self):
+        if os.path.isfile(self.path):
+            data = numpy.load(self.path)
+            self.websites = [str(website) for website in data['websites']]
+            self.sources = [str(source) for source in data['sources']]
+            self.run_times = data['run_times']
+            self.website = data['website']
+            self.run = data['run']
+            self.metric = data['metric']
+            self.value = data['value']
+        else:
+            self.websites = []
+            self.sources = []
+            self.run_times = numpy.zeros(0)
+            self.website = numpy.zeros(0, dtype=numpy.int32)
+            self.run = numpy.zeros(0, dtype=numpy.int32)
+            self.metric = numpy.zeros(0, dtype=numpy.int8)
+            self.value = numpy.zeros(0)
+        self.website_ids = dict((website, index) for index, website in enumerate(self.websites))
+
+    def save(self):
+        temporary_path = '%s.tmp' % (self.path,)
+        with open(temporary_path, 'wb') as file_handler:
+            numpy.savez_compressed(file_handler, websites=numpy.array(self.websites), sources=numpy.array(self.sources),
+                                   run_times=self.run_times, website=self.website, run=self.run, metric=self.metric,
+                                   value=self.value)
+        os.rename(temporary_path, self.path)
+
+    def add_run(self, source, run_time, measures, save=True):
+        """
+            Appends run to history
+        :param source: Unique name of the run
+        :param run_time: Unix time of the run
+        :param measures: Dictionary website -> dictionary metric -> list of values (None for failed scans)
+        :param save: Boolean flag indicates whenever history file should be written right away
+        :return: False if run with this source is already in history
+        """
+        if source in self.sources:
+            return False
+        run = len(self.sources)
+        self.sources.append(source)
+        self.run_times = numpy.append(self.run_times, run_time)
+        websites, metrics, values = [], [], []
+        for website in measures:
+            if website not in self.website_ids:
+                self.website_ids[website] = len(self.websites)
+                self.websites.append(website)
+            for metric in HISTORY_METRICS:
+                valid = [value for value in measures[website].get(metric) or [] if value is not None]
+                websites.extend([self.website_ids[website]] * len(valid))
+                metrics.extend([HISTORY_METRICS.index(metric)] * len(valid))
+                values.extend(valid)
+        website = numpy.concatenate((self.website, numpy.array(websites, dtype=numpy.int32)))
+        run = numpy.concatenate((self.run, numpy.full(len(values), run, dtype=numpy.int32)))
+        metric = numpy.concatenate((self.metric, numpy.array(metrics, dtype=numpy.int8)))
+        value = numpy.concatenate((self.value, numpy.array(values, dtype=float)))
+        order = numpy.lexsort((run, website))
+        self.website, self.run, self.metric, self.value = website[order], run[order], metric[order], value[order]
+        if save:
+            self.save()
+        return True
+
+    def website_runs(self, website, metric):
+        """
+            Values of metric in every run of website
+        :return: Dictionary run -> numpy array of values
+        """
+        if website not in self.website_ids:
+            return {}
+        website_id = self.website_ids[website]
+        start = numpy.searchsorted(self.website, website_id, side='left')
+        end = numpy.searchsorted(self.website, website_id, side='right')
+        mask = self.metric[start:end] == HISTORY_METRICS.index(metric)
+        runs, values = self.run[start:end][mask], self.value[start:end][mask]
+        return dict((run, values[runs == run]) for run in numpy.unique(runs))
+
+    def added_latency(self, website, last_runs):
+        """
+            Latency added by tag in the last runs of website: with tag values minus median of without tag values of
+            the same run. Runs are ordered by their time, so csv documents imported after crawler runs are placed
+            before them.
+        :return: numpy array of values and number of runs they come from
+        """
+        with_tag = self.website_runs(website, 'with_tag')
+        without_tag = self.website_runs(website, 'without_tag')
+        runs = sorted((run for run in with_tag if run in without_tag),
+                      key=lambda run: (self.run_times[run], run))[-last_runs:]
+        if not runs:
+            return numpy.zeros(0), 0
+        return numpy.concatenate([with_tag[run] - numpy.median(without_tag[run]) for run in runs]), len(runs)
+
+
+def added_latency(with_tag, without_tag):
+    """
+        Latency added by tag in current run, the same way as HistoryStore.added_latency
+    """
+    with_tag = numpy.array([value for value in with_tag if value is not None], dtype=float)
+    without_tag = [value for value in without_tag if value is not None]
+    if not without_tag:
+        return numpy.zeros(0)
+    return with_tag - numpy.median(without_tag)
+
+
+def regression(history, website, with_tag, without_tag, baseline_runs, min_runs, alpha, min_increase):
+    """
+        Compares latency added by tag in current run with rolling baseline of previous runs. Regression is flagged
+        when one-sided Mann-Whitney test says current values are greater (p < alpha) and median grew by more than
+        min_increase seconds, so a single noisy scan or a tiny shift isn't reported.
+    :param history: HistoryStore without current run
+    :param baseline_runs: Number of previous runs in baseline
+    :param min_runs: Minimum number of previous runs to compare with
+    :return: Dictionary with regression flag, p_value, current and baseline medians and number of baseline runs, or
+             None if there isn't enough history
+    """
+    current = added_latency(with_tag, without_tag)
+    baseline, runs = history.added_latency(website, baseline_runs)
+    if runs < min_runs or not len(current) or not len(baseline):
+        return None
+    p_value = stats.mann_whitney_greater(current, baseline)
+    current_median, baseline_median = float(numpy.median(current)), float(numpy.median(baseline))
+    return {'regression': p_value < alpha and current_median - baseline_median > min_increase,
+            'p_value': p_value,
+            'current_median': current_median,
+            'baseline_median': baseline_median,
+            'baseline_runs': runs}
+
+
+def read_csv(path):
+    """
+        Reads measurements from csv results document (see providers.CsvResultSink)
+    :return: Dictionary website -> dictionary metric -> list of values (None for failed scans)
+    """
+    measures = {}
+    website = None
+    with open(path) as file_handler:
+        for row in csv.reader(file_handler):
+            if not row or not row[0]:
+                continue
+            if row[0] in CSV_LABELS:
+                if website is not None:
+                    measures[website][CSV_LABELS[row[0]]] = [csv_value(value) for value in row[1:]]
+            elif not row[0].startswith(('Navigation ', 'Tag resources ', 'Proxy RTT ')):
+                website = row[0]
+                measures[website] = {}
+    return measures
+
+
+def csv_value(value):
+    """
+        Measured value of csv cell, None for failed measurement (blank or CSV_FAILED)
+    """
+    if not value.strip():
+        return None
+    value = float(value)
+    return None if value == CSV_FAILED else value
+
+
+def csv_run_time(path):
+    """
+        Time of the run from csv file name (filename_pattern puts date and time into it) or its modification time
+    """
+    match = CSV_DATE.search(os.path.basename(path))
+    if match:
+        return time.mktime(time.strptime(match.group(0), '%Y-%m-%d %H:%M:%S'))
+    return os.path.getmtime(path)
+
+
+def import_csv(history, paths):
+    """
+        Imports csv results documents into history
+    :return: Number of imported documents
+    """
+    imported = 0
+    for path in sorted(paths, key=csv_run_time):
+        if history.add_run(os.path.basename(path), csv_run_time(path), read_csv(path), save=False):
+            imported += 1
+    if imported:
+        history.save()
+    return imported
+
+
+def main():
+    history = HistoryStore(sys.argv[1])
+    imported = import_csv(history, sys.argv[2:])
+    sys.stdout.write('Imported %s of %s documents, history has %s runs of %s websites\n' %
+                     (imported, len(sys.argv) - 2, len(history.sources), len(history.websites)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+"""
+    Instrumentation of a run: timing spans of crawler phases and counters of timeouts, missing measures and exceptions
+    per website and proxy. Metrics are exported in OpenMetrics text format to a file and/or local HTTP endpoint while
+    the run is going, e.g.:
+
+        curl http://127.0.0.1:9108/metrics
+"""
+import os
+import time
+import cProfile
+import threading
+
+from logging import getLogger
+from contextlib import contextmanager
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+log = getLogger('crawler')
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+
+class Registry(object):
+    """
+        Thread safe registry of metrics of current process. Spans are kept as count and sum of seconds per phase,
+        counters as value per name and labels.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+            Drops all metrics and creates a new lock. Forked worker process calls it first, as it inherits metrics of
+            parent process, which are already counted there, and lock possibly held by a thread of parent process.
+        """
+        self.lock = threading.Lock()
+        self.spans = {}  # Labels -> [count, sum of seconds]
+        self.counters = {}  # Name -> dictionary labels -> value
+
+    def observe(self, phase, seconds):
+        with self.lock:
+            span = self.spans.setdefault((('phase', phase),), [0, 0.0])
+            span[0] += 1
+            span[1] += seconds
+
+    @contextmanager
+    def span(self, phase):
+        """
+            Times the block as one span of phase, span is recorded when block raises too
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(phase, time.time() - start)
+
+    def increment(self, name, amount=1, **labels):
+        """
+        :param name: Counter name without _total suffix
+        :param labels: Label values, None is exported as empty value
+        """
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counter = self.counters.setdefault(name, {})
+            counter[key] = counter.get(key, 0) + amount
+
+    def drain(self):
+        """
+            Takes metrics collected since last drain, parallel workers pass them to parent process this way
+        :return: Tuple (spans, counters)
+        """
+        with self.lock:
+            collected = self.spans, self.counters
+            self.spans, self.counters = {}, {}
+        return collected
+
+    def merge(self, collected):
+        """
+            Adds metrics drained from another registry
+        """
+        spans, counters = collected
+        with self.lock:
+            for key, (count, total) in spans.items():
+                span = self.spans.setdefault(key, [0, 0.0])
+                span[0] += count
+                span[1] += total
+            for name in counters:
+                counter = self.counters.setdefault(name, {})
+                for key, value in counters[name].items():
+                    counter[key] = counter.get(key, 0) + value
+
+    def render(self):
+        """
+        :return: Metrics in OpenMetrics text format
+        """
+        with self.lock:
+            lines = ['# TYPE crawler_phase_seconds summary',
+                     '# UNIT crawler_phase_seconds seconds',
+                     '# HELP crawler_phase_seconds Wall time spent in crawler phases']
+            for key in sorted(self.spans):
+                count, total = self.spans[key]
+                lines.append('crawler_phase_seconds_count%s %s' % (format_labels(key), count))
+                lines.append('crawler_phase_seconds_sum%s %r' % (format_labels(key), total))
+            for name in sorted(self.counters):
+                lines.append('# TYPE %s counter' % (name,))
+                for key in sorted(self.counters[name]):
+                    lines.append('%s_total%s %s' % (name, format_labels(key), self.counters[name][key]))
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(key):
+    if not key:
+        return ''
+    return '{%s}' % (','.join('%s="%s"' % (label, escape(value)) for label, value in key),)
+
+
+def escape(value):
+    if value is None:
+        return ''
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Registry of current process, crawler phases are recorded here
+REGISTRY = Registry()
+observe = REGISTRY.observe
+span = REGISTRY.span
+increment = REGISTRY.increment
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.registry.render()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug('Metrics endpoint: %s' % (format % args,))
+
+
+class MetricsExporter(object):
+    """
+        Exports registry while the run is going: rewrites file every interval seconds and/or serves it on local
+        HTTP endpoint. Both run in daemon threads, so they never hold up the crawler.
+    """
+
+    def __init__(self, registry, path=None, port=None, interval=10.0):
+        """
+        :param path: File metrics are written to, None to disable
+        :param port: Port of HTTP endpoint on 127.0.0.1, None to disable
+        :param interval: Seconds between file updates
+        """
+        self.registry = registry
+        self.path = path
+        self.port = port
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.writer = None
+        self.server = None
+
+    def start(self):
+        if self.path:
+            self.writer = threading.Thread(target=self.write_periodically, name='metrics-writer')
+            self.writer.daemon = True
+            self.writer.start()
+        if self.port:
+            self.server = HTTPServer(('127.0.0.1', self.port), MetricsHandler)
+            self.server.registry = self.registry
+            thread = threading.Thread(target=self.server.serve_forever, name='metrics-endpoint')
+            thread.daemon = True
+            thread.start()
+            log.info('Serving metrics on http://127.0.0.1:%s/metrics' % (self.port,))
+
+    def write(self):
+        temporary_path = '%s.tmp' % (self.path,)
+        with open(temporary_path, 'w') as file_handler:
+            file_handler.write(self.registry.render())
+        os.rename(temporary_path, self.path)
+
+    def write_periodically(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.write()
+            except (IOError, OSError) as e:
+                log.error('Failed to write metrics. Error: %s' % (e,))
+
+    def stop(self):
+        """
+            Stops exporting, final metrics of the run are written to file
+        """
+        self.stopped.set()
+        if self.writer:
+            self.writer.join()
+            self.write()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+class RunProfiler(object):
+    """
+        Opt-in cProfile of a process, dumped as pstats file per run and process, e.g.:
+
+            python -m pstats crawler_run_12_4242.prof
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def dump(self, run_id):
+        self.profile.disable()
+        path = os.path.join(self.directory, 'crawler_run_%s_%s.prof' % (run_id, os.getpid()))
+        self.profile.dump_stats(path)
+        log.info('Profile of run %s written to %s' % (run_id, path))
+
+
+def create_exporter(config):
+    """
+        Creates exporter of REGISTRY from metrics section of configuration, None if both file and port are disabled
+    """
+    path = config.get('metrics', 'path') or None
+    port = int(config.get('metrics', 'port') or 0) or None
+    if not path and not port:
+        return None
+    return MetricsExporter(REGISTRY, path, port, float(config.get('metrics', 'interval')))
+
+
+def create_profiler(config):
+    """
+        Creates profiler from metrics section of configuration, None unless metrics.profile is enabled
+    """
+    if not config.getboolean('metrics', 'profile'):
+        return None
+    return RunProfiler(config.get('metrics', 'profile_path'))
@@ -0,0 +1,278 @@
+import os
+import gzip
+import json
+import time
+import logging
+import smtplib
+
+from csv import writer
+from StringIO import StringIO
+from datetime import datetime
+from email.mime.text import MIMEText
+from configparser import ConfigParser
+from email.mime.multipart import MIMEMultipart
+from email.mime.application import MIMEApplication
+
+from torndb import Connection
+from tornado.template import Loader
+
+import alerts
+import result_database
+from browser_scripts import NAVIGATION_FIELDS, TAG_RESOURCE_FIELDS
+
+log = logging.getLogger('crawler')
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.ini')
+
+
+class LazyConfig(object):
+    """
+        ConfigParser, which reads configuration file on first access. Path is taken from LOADING_TIME_CONFIG
+        environment variable (e.g. benchmark configuration) or defaults to config.ini in project root.
+    """
+
+    def __init__(self):
+        self.parser = None
+
+    def __getattr__(self, name):
+        if self.parser is None:
+            self.parser = ConfigParser()
+            self.parser.read(os.environ.get('LOADING_TIME_CONFIG', DEFAULT_CONFIG_PATH))
+        return getattr(self.parser, name)
+
+
+def configure_logging(config):
+    """
+        Sets up crawler logger from configuration
+    """
+    loglevel = int(config.get('logging', 'loglevel'))
+    log_file = 'load_time_crawler_{0}.log'.format(datetime.now().strftime('%Y.%m.%d-%H.%M.%S'))
+    log_file = os.path.join(config.get('logging', 'path'), log_file)
+    # if not os.path.exists(log_file):
+    #     open(log_file, 'a').close()
+    logging.basicConfig(level=loglevel)
+    log.setLevel(loglevel)
+    formatter = logging.Formatter('%(asctime)s [%(pathname)s:%(lineno)d] %(levelname)8s: %(message)s')
+    handler = logging.NullHandler()
+    handler.setFormatter(formatter)
+    log.addHandler(handler)
+
+
+class MySQLWebsiteSource(object):
+    """
+        Reads website rows from MySQL, connection is open only while the query runs
+    """
+
+    def __init__(self, config):
+        self.config = config
+
+    def websites(self):
+        db = Connection(self.config.get('mysql', 'host'),
+                        self.config.get('mysql', 'db'),
+                        self.config.get('mysql', 'user'),
+                        self.config.get('mysql', 'pass'))
+        try:
+            return db.query("QUERY PLACEHOLDER")
+        finally:
+            db.close()
+
+
+class FileWebsiteSource(object):
+    """
+        Reads website rows from JSON file, list of objects with website_page, website_tag, scans_number, geo and
+        is_layer keys (the same columns MySQL query returns)
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def websites(self):
+        with open(self.path) as file_handler:
+            return json.load(file_handler)
+
+
+class SnapshotWebsiteSource(object):
+    """
+        Caches website rows of another source in a JSON snapshot. Snapshot younger than ttl seconds is used without
+        asking the source, stale snapshot is used if the source fails.
+    """
+
+    def __init__(self, source, path, ttl):
+        self.source = source
+        self.path = path
+        self.ttl = ttl
+
+    def websites(self):
+        if os.path.isfile(self.path) and time.time() - os.path.getmtime(self.path) < self.ttl:
+            log.info('Using website list snapshot %s' % (self.path,))
+            return FileWebsiteSource(self.path).websites()
+        try:
+            rows = list(self.source.websites())
+        except Exception as e:
+            if not os.path.isfile(self.path):
+                raise
+            log.error('Failed to load website list, using stale snapshot %s. Error: %s' % (self.path, e))
+            return FileWebsiteSource(self.path).websites()
+        temporary_path = '%s.tmp' % (self.path,)
+        with open(temporary_path, 'w') as file_handler:
+            json.dump(rows, file_handler)
+        os.rename(temporary_path, self.path)
+        return rows
+
+
+def create_website_source(config):
+    """
+        Creates website source from configuration: websites.source is mysql or file (websites.path), positive
+        websites.snapshot_ttl caches the list in websites.snapshot_path
+    """
+    if config.get('websites', 'source') == 'file':
+        source = FileWebsiteSource(config.get('websites', 'path'))
+    else:
+        source = MySQLWebsiteSource(config)
+    snapshot_ttl = int(config.get('websites', 'snapshot_ttl'))
+    if snapshot_ttl > 0:
+        source = SnapshotWebsiteSource(source, config.get('websites', 'snapshot_path'), snapshot_ttl)
+    return source
+
+
+class CsvResultSink(object):
+    """
+        Writes measurements of every website to csv document
+    """
+
+    def __init__(self, filename_pattern):
+        """
+        :param filename_pattern: Output file name, {0} is replaced with date and time of the run
+        """
+        self.filename_pattern = filename_pattern
+
+    def create_name(self):
+        return self.filename_pattern.format(datetime.now().__str__().split('.')[0])
+
+    def store(self, results, scan_run_id=None):
+        """
+        :param results: Results dictionary, time measurement statistics for every website
+        :param scan_run_id: Id of the run in scan store, not used by csv document
+        :return: Path to csv document
+        """
+        log.info('Creating an csv document with results of run')
+        output_file = self.create_name()
+        with open(output_file, 'w+') as file_handler:
+            csv_writer = writer(file_handler, dialect="excel")
+            for website in results:
+                csv_writer.writerow([website] + range(1, results[website]['scans_used']+1))
+                csv_writer.writerow(['Loading time without tag'] + results[website]['without_tag'])
+                csv_writer.writerow(['Loading time with tag'] + results[website]['with_tag'])
+                csv_writer.writerow(['Preload loading time'] + results[website]['preload'])
+                csv_writer.writerow(['Layer loading time'] + results[website]['layer'])
+                csv_writer.writerow(['990 loading time'] + results[website]['990'])
+                csv_writer.writerow(['Proxy RTT without tag'] + results[website]['proxy_rtt_without_tag'])
+                csv_writer.writerow(['Proxy RTT with tag'] + results[website]['proxy_rtt_with_tag'])
+                for field in NAVIGATION_FIELDS:
+                    csv_writer.writerow(['Navigation %s without tag' % field] +
+                                        [(navigation or {}).get(field) for navigation in
+                                         results[website]['navigation_without_tag']])
+                    csv_writer.writerow(['Navigation %s with tag' % field] +
+                                        [(navigation or {}).get(field) for navigation in
+                                         results[website]['navigation_with_tag']])
+                for field in TAG_RESOURCE_FIELDS:
+                    csv_writer.writerow(['Tag resources %s' % field] +
+                                        [(resources or {}).get(field) for resources in
+                                         results[website]['tag_resources']])
+                csv_writer.writerow([])
+        return output_file
+
+
+def create_result_sink(config):
+    """
+        Creates result sink from configuration: csv document from results.filename_pattern, with results.database
+        mysql or sqlite (results.database_path) scans and aggregates are written to database too
+    """
+    sink = CsvResultSink(config.get('results', 'filename_pattern'))
+    database = config.get('results', 'database')
+    if database == 'mysql':
+        sink = result_database.DatabaseResultSink(sink, result_database.mysql_pool(config), 'mysql')
+    elif database == 'sqlite':
+        sink = result_database.DatabaseResultSink(sink, result_database.sqlite_pool(
+            config.get('results', 'database_path')), 'sqlite')
+    return sink
+
+
+def smtp_connection(config, smtp_class=smtplib.SMTP):
+    """
+        Opens SMTP connection from alerts section of configuration and logs in
+    :param smtp_class: SMTP client class, replaced with a stand-in in benchmarks
+    """
+    server = smtp_class(config.get('alerts', 'gmail_host'), int(config.get('alerts', 'gmail_port')))
+    server.ehlo()
+    server.starttls()
+    server.login(config.get('alerts', 'gmail_user'), config.get('alerts', 'gmail_password'))
+    return server
+
+
+def create_alert_notifier(config, smtp_class=smtplib.SMTP):
+    """
+        Creates real-time alert notifier from alerts section of configuration, None unless alerts.realtime is enabled
+    """
+    if not config.getboolean('alerts', 'realtime'):
+        return None
+    return alerts.AlertNotifier(lambda: smtp_connection(config, smtp_class), config.get('alerts', 'gmail_user'),
+                                config.get('results', 'receivers').split(','),
+                                batch_window=float(config.get('alerts', 'batch_window')),
+                                min_interval=float(config.get('alerts', 'min_interval')))
+
+
+class EmailNotifier(object):
+    """
+        Sends results email rendered from results.html with gzipped csv document attached. Template and SMTP settings
+        are loaded on first email.
+    """
+
+    def __init__(self, config, smtp_class=smtplib.SMTP):
+        """
+        :param config: Configuration with results.receivers and alerts section
+        :param smtp_class: SMTP client class, replaced with a stand-in in benchmarks
+        """
+        self.config = config
+        self.smtp_class = smtp_class
+        self.template = None
+
+    def render(self, **template_values):
+        if self.template is None:
+            self.template = Loader(os.path.abspath(os.path.dirname(__file__))).load('results.html')
+        return self.template.generate(**template_values)
+
+    def send(self, output_file, **template_values):
+        """
+        :param output_file: Csv document to attach
+        :param template_values: Values for results.html template
+        """
+        log.info("Sending email with results")
+        gmail_user = self.config.get('alerts', 'gmail_user')
+        msg = MIMEMultipart()
+        msg['Subject'] = 'Results for automated page loading scan tool on %s' %\
+                         (datetime.now().__str__().split('.')[0],)
+        to = self.config.get('results', 'receivers').split(',')
+        emailto = ', '.join(to)
+        msg['From'] = gmail_user
+        msg['To'] = emailto
+        msg.preamble = 'Results for automated page loading scan tool'
+        html = MIMEText(self.render(**template_values), 'html', _charset='utf-8')
+        msg.attach(html)
+        if not os.path.isfile(output_file):
+            log.error('Something went wrong with results file. Aborting')
+            return
+        compressed = StringIO()
+        with open(output_file, "rb") as file_handler:
+            with gzip.GzipFile(filename=os.path.basename(output_file), mode='wb', fileobj=compressed) as archive:
+                archive.write(file_handler.read())
+        attachment_name = '%s.gz' % (os.path.basename(output_file),)
+        part = MIMEApplication(
+            compressed.getvalue(),
+            Name=attachment_name
+        )
+        part['Content-Disposition'] = 'attachment; filename="%s"' % attachment_name
+        msg.attach(part)
+        server = smtp_connection(self.config, self.smtp_class)
+        server.sendmail(gmail_user, to, msg.as_string())
+        server.close()
@@ -1,13 +1,14 @@
+# Public proxies of every country, scans use the fastest healthy one (see proxy_manager.ProxyManager)
 PROXY_COUNTRIES = {
-    'US': '52.39.218.190:80',
-    'CH': '218.75.117.86:8088',
-    'ES': '84.122.218.224:3128',
-    'MX': '201.166.23.226:8080',
-    'RU': '81.177.255.126:3128',
-    'IL': '188.225.254.206:8080',
-    'UA': '109.254.6.40:8080',
-    'UK': '51.15.134.180:8080',
-    'BR': '201.54.5.115:8080',
-    'CA': '198.50.219.239:80',
-    'DE': '207.154.229.110:8080'
+    'US': ['52.39.218.190:80'],
+    'CH': ['218.75.117.86:8088'],
+    'ES': ['84.122.218.224:3128'],
+    'MX': ['201.166.23.226:8080'],
+    'RU': ['81.177.255.126:3128'],
+    'IL': ['188.225.254.206:8080'],
+    'UA': ['109.254.6.40:8080'],
+    'UK': ['51.15.134.180:8080'],
+    'BR': ['201.54.5.115:8080'],
+    'CA': ['198.50.219.239:80'],
+    'DE': ['207.154.229.110:8080']
 }
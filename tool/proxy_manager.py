@@ -0,0 +1,122 @@
+import time
+import socket
+import urllib2
+import httplib
+
+from logging import getLogger
+from multiprocessing.pool import ThreadPool
+
+log = getLogger('crawler')
+
+
+class ProxyUnavailable(Exception):
+    """
+        All proxies of a country are dead
+    """
+
+
+class ProxyManager(object):
+    """
+        Health of public proxies of every country. Proxies are probed concurrently: TCP connect time to the proxy is
+        its RTT, probe url downloaded through it gives throughput. Proxy of a country is the fastest healthy one,
+        proxy which fails a scan is probed again right away, so scans fail over to the next one in seconds.
+    """
+
+    def __init__(self, proxies, probe_url, timeout, workers, recheck_interval):
+        """
+        :param proxies: Dictionary country -> list of proxies (host:port)
+        :param probe_url: Url downloaded through every proxy
+        :param timeout: Seconds before probe of a proxy fails
+        :param workers: Number of proxies probed at once
+        :param recheck_interval: Seconds after which health of a proxy is probed again
+        """
+        self.proxies = proxies
+        self.probe_url = probe_url
+        self.timeout = timeout
+        self.workers = workers
+        self.recheck_interval = recheck_interval
+        self.health = {}  # Proxy -> dictionary with alive, rtt, throughput and checked_at
+
+    def probe(self, proxy):
+        """
+            Measures reachability, RTT and throughput of proxy
+        :return: Dictionary with alive, rtt (sec), throughput (bytes/sec) and checked_at
+        """
+        host, port = proxy.rsplit(':', 1)
+        health = {'alive': False, 'rtt': None, 'throughput': None}
+        try:
+            start = time.time()
+            socket.create_connection((host, int(port)), self.timeout).close()
+            health['rtt'] = time.time() - start
+            opener = urllib2.build_opener(urllib2.ProxyHandler({'http': 'http://%s' % (proxy,),
+                                                                'https': 'http://%s' % (proxy,)}))
+            start = time.time()
+            size = len(opener.open(self.probe_url, timeout=self.timeout).read())
+            health['throughput'] = size / max(time.time() - start, 1e-6)
+            health['alive'] = True
+        except (socket.error, urllib2.URLError, httplib.HTTPException) as e:
+            log.error('Proxy %s failed health check. Error: %s' % (proxy, e))
+        health['checked_at'] = time.time()
+        return health
+
+    def probe_all(self, proxies=None):
+        """
+            Probes proxies concurrently
+        :param proxies: List of proxies, all proxies of all countries by default
+        """
+        if proxies is None:
+            proxies = [proxy for country in self.proxies for proxy in self.proxies[country]]
+        if not proxies:
+            return
+        pool = ThreadPool(min(self.workers, len(proxies)))
+        try:
+            for proxy, health in zip(proxies, pool.map(self.probe, proxies)):
+                self.health[proxy] = health
+        finally:
+            pool.close()
+            pool.join()
+        for proxy in proxies:
+            log.info('Proxy %s: %s' % (proxy, self.health[proxy]))
+
+    def select(self, country):
+        """
+            Fastest healthy proxy of country, stale health is probed again first
+        :return: Proxy (host:port) or None if country is scanned without proxy
+        :raise ProxyUnavailable: All proxies of the country are dead
+        """
+        candidates = self.proxies.get(country)
+        if not candidates:
+            return None
+        now = time.time()
+        stale = [proxy for proxy in candidates
+                 if proxy not in self.health or now - self.health[proxy]['checked_at'] > self.recheck_interval]
+        if stale:
+            self.probe_all(stale)
+        healthy = [proxy for proxy in candidates if self.health[proxy]['alive']]
+        if not healthy:
+            raise ProxyUnavailable('All proxies of %s are dead' % (country,))
+        return min(healthy, key=lambda proxy: (self.health[proxy]['rtt'], -self.health[proxy]['throughput']))
+
+    def available(self, country):
+        """
+            Checks whenever country is scanned without proxy or has a healthy one
+        """
+        try:
+            self.select(country)
+            return True
+        except ProxyUnavailable as e:
+            log.error(e)
+            return False
+
+    def report_failure(self, proxy):
+        """
+            Probes proxy, which failed a scan, so dead proxy isn't selected anymore
+        """
+        if proxy:
+            self.probe_all([proxy])
+
+    def rtt(self, proxy):
+        """
+            Last measured RTT of proxy, None for scans without proxy
+        """
+        return self.health.get(proxy, {}).get('rtt')
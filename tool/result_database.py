@@ -0,0 +1,298 @@
+import json
+import Queue
+import sqlite3
+
+from datetime import datetime
+from logging import getLogger
+
+log = getLogger('crawler')
+
+# Run, raw scans and per website aggregates. Primary keys start with website, so "last N runs of website" is a range
+# scan of the primary key: SELECT ... WHERE website = %s ORDER BY run_id DESC LIMIT N
+SCHEMA = {
+    'mysql': [
+        """CREATE TABLE IF NOT EXISTS loading_time_runs (
+            id INTEGER NOT NULL AUTO_INCREMENT PRIMARY KEY,
+            scan_run_id INTEGER NULL,
+            finished_at DATETIME NOT NULL,
+            KEY finished_at (finished_at),
+            KEY scan_run_id (scan_run_id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS loading_time_scans (
+            website VARCHAR(255) NOT NULL,
+            run_id INTEGER NOT NULL,
+            scan_index INTEGER NOT NULL,
+            preload DOUBLE NULL,
+            effective_page_view DOUBLE NULL,
+            with_tag DOUBLE NULL,
+            layer DOUBLE NULL,
+            unit_id VARCHAR(64) NULL,
+            unit DOUBLE NULL,
+            without_tag DOUBLE NULL,
+            PRIMARY KEY (website, run_id, scan_index),
+            KEY run_id (run_id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS loading_time_results (
+            website VARCHAR(255) NOT NULL,
+            run_id INTEGER NOT NULL,
+            scans_used INTEGER NOT NULL,
+            average_with_tag DOUBLE NULL,
+            average_without_tag DOUBLE NULL,
+            trimmed_with_tag DOUBLE NULL,
+            trimmed_without_tag DOUBLE NULL,
+            p90_with_tag DOUBLE NULL,
+            p90_without_tag DOUBLE NULL,
+            average_preload DOUBLE NULL,
+            average_effective_page_view DOUBLE NULL,
+            average_layer DOUBLE NULL,
+            average_unit DOUBLE NULL,
+            failures_with_tag INTEGER NULL,
+            failures_without_tag INTEGER NULL,
+            slowdown DOUBLE NULL,
+            slowdown_low DOUBLE NULL,
+            slowdown_high DOUBLE NULL,
+            position_ok TINYINT NULL,
+            breaches VARCHAR(255) NULL,
+            PRIMARY KEY (website, run_id),
+            KEY run_id (run_id)
+        )"""
+    ],
+    'sqlite': [
+        """CREATE TABLE IF NOT EXISTS loading_time_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scan_run_id INTEGER,
+            finished_at TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS loading_time_scans (
+            website TEXT NOT NULL,
+            run_id INTEGER NOT NULL,
+            scan_index INTEGER NOT NULL,
+            preload REAL,
+            effective_page_view REAL,
+            with_tag REAL,
+            layer REAL,
+            unit_id TEXT,
+            unit REAL,
+            without_tag REAL,
+            PRIMARY KEY (website, run_id, scan_index)
+        )""",
+        """CREATE TABLE IF NOT EXISTS loading_time_results (
+            website TEXT NOT NULL,
+            run_id INTEGER NOT NULL,
+            scans_used INTEGER NOT NULL,
+            average_with_tag REAL,
+            average_without_tag REAL,
+            trimmed_with_tag REAL,
+            trimmed_without_tag REAL,
+            p90_with_tag REAL,
+            p90_without_tag REAL,
+            average_preload REAL,
+            average_effective_page_view REAL,
+            average_layer REAL,
+            average_unit REAL,
+            failures_with_tag INTEGER,
+            failures_without_tag INTEGER,
+            slowdown REAL,
+            slowdown_low REAL,
+            slowdown_high REAL,
+            position_ok INTEGER,
+            breaches TEXT,
+            PRIMARY KEY (website, run_id)
+        )""",
+        'CREATE INDEX IF NOT EXISTS loading_time_scans_run_id ON loading_time_scans (run_id)',
+        'CREATE INDEX IF NOT EXISTS loading_time_results_run_id ON loading_time_results (run_id)'
+    ]
+}
+
+# Bound parameters allowed in one statement (SQLite before 3.32 is compiled with 999)
+MAX_PARAMETERS = {'mysql': 65535, 'sqlite': 999}
+
+SCAN_COLUMNS = ('website', 'run_id', 'scan_index', 'preload', 'effective_page_view', 'with_tag', 'layer', 'unit_id',
+                'unit', 'without_tag')
+RESULT_COLUMNS = ('website', 'run_id', 'scans_used', 'average_with_tag', 'average_without_tag', 'trimmed_with_tag',
+                  'trimmed_without_tag', 'p90_with_tag', 'p90_without_tag', 'average_preload',
+                  'average_effective_page_view', 'average_layer', 'average_unit', 'failures_with_tag',
+                  'failures_without_tag', 'slowdown', 'slowdown_low', 'slowdown_high', 'position_ok', 'breaches')
+
+
+class ConnectionPool(object):
+    """
+        Small pool of DB-API connections. Work runs in one transaction on a pooled connection, connection which
+        failed with one of disconnect errors is thrown away and work is retried on a fresh one.
+    """
+
+    def __init__(self, connect, size, placeholder, disconnect_errors, retries=2):
+        """
+        :param connect: Callable, which opens new connection
+        :param size: Maximum number of idle connections kept
+        :param placeholder: Parameter placeholder of the driver, %s (MySQLdb) or ? (sqlite3)
+        :param disconnect_errors: Tuple of exception classes meaning connection is lost
+        :param retries: Number of retries on fresh connection
+        """
+        self.connect = connect
+        self.idle = Queue.LifoQueue(size)
+        self.placeholder = placeholder
+        self.disconnect_errors = disconnect_errors
+        self.retries = retries
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except Queue.Empty:
+            return self.connect()
+
+    def release(self, connection):
+        try:
+            self.idle.put_nowait(connection)
+        except Queue.Full:
+            connection.close()
+
+    def run(self, work):
+        """
+            Runs work in transaction, reconnecting on lost connection
+        :param work: Callable, which takes cursor
+        :return: Result of work
+        """
+        for attempt in xrange(self.retries + 1):
+            connection = self.acquire()
+            try:
+                cursor = connection.cursor()
+                result = work(cursor)
+                connection.commit()
+            except self.disconnect_errors as e:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+                if attempt == self.retries:
+                    raise
+                log.error('Lost database connection, reconnecting. Error: %s' % (e,))
+                continue
+            except Exception:
+                connection.rollback()
+                self.release(connection)
+                raise
+            self.release(connection)
+            return result
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Queue.Empty:
+                break
+
+
+def mysql_pool(config):
+    """
+        Creates connection pool to MySQL database from mysql section of configuration
+    """
+    import MySQLdb
+
+    def connect():
+        return MySQLdb.connect(host=config.get('mysql', 'host'), port=int(config.get('mysql', 'port')),
+                               user=config.get('mysql', 'user'), passwd=config.get('mysql', 'pass'),
+                               db=config.get('mysql', 'db'), charset='utf8')
+    return ConnectionPool(connect, int(config.get('results', 'pool_size')), '%s', (MySQLdb.OperationalError,))
+
+
+def sqlite_pool(path, size=1):
+    """
+        Creates connection pool to SQLite database, local stand-in of MySQL
+    """
+    return ConnectionPool(lambda: sqlite3.connect(path, timeout=60), size, '?', (sqlite3.OperationalError,))
+
+
+class DatabaseResultSink(object):
+    """
+        Writes raw timings of every scan and aggregates of every website to database with batched multi-row inserts,
+        then passes results to another sink (csv), whose output is attached to results email
+    """
+
+    def __init__(self, sink, pool, dialect, batch_size=500):
+        """
+        :param sink: Sink results are passed to, its return value is returned
+        :param pool: ConnectionPool
+        :param dialect: mysql or sqlite
+        :param batch_size: Number of rows inserted with one statement
+        """
+        self.sink = sink
+        self.pool = pool
+        self.dialect = dialect
+        self.batch_size = batch_size
+        self.schema_created = False
+
+    def store(self, results, scan_run_id=None):
+        """
+        :param results: Results dictionary, time measurement statistics for every website
+        :param scan_run_id: Id of the run in scan store, so database run can be traced back to its raw scans
+        :return: Return value of wrapped sink
+        """
+        try:
+            run_id = self.pool.run(lambda cursor: self.insert(cursor, results, scan_run_id))
+            log.info('Stored results of %s websites as database run %s' % (len(results), run_id))
+        except Exception as e:
+            log.error('Failed to store results in database. Error: %s' % (e,))
+        return self.sink.store(results, scan_run_id)
+
+    def insert(self, cursor, results, scan_run_id=None):
+        if not self.schema_created:
+            for statement in SCHEMA[self.dialect]:
+                cursor.execute(statement)
+            self.schema_created = True
+        cursor.execute('INSERT INTO loading_time_runs (scan_run_id, finished_at) VALUES (%s, %s)' %
+                       (self.pool.placeholder, self.pool.placeholder),
+                       (scan_run_id, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        run_id = cursor.lastrowid
+        scans = []
+        aggregates = []
+        for website in results:
+            scans.extend(self.scan_rows(website, run_id, results[website]))
+            aggregates.append(self.result_row(website, run_id, results[website]))
+        self.insert_rows(cursor, 'loading_time_scans', SCAN_COLUMNS, scans)
+        self.insert_rows(cursor, 'loading_time_results', RESULT_COLUMNS, aggregates)
+        return run_id
+
+    def insert_rows(self, cursor, table, columns, rows):
+        """
+            Inserts rows with multi-row INSERT statements of at most batch_size rows
+        """
+        row_placeholders = '(%s)' % (', '.join([self.pool.placeholder] * len(columns)),)
+        batch_size = min(self.batch_size, MAX_PARAMETERS[self.dialect] // len(columns))
+        for start in xrange(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cursor.execute('INSERT INTO %s (%s) VALUES %s' % (table, ', '.join(columns),
+                                                              ', '.join([row_placeholders] * len(batch))),
+                           [value for row in batch for value in row])
+
+    @staticmethod
+    def scan_rows(website, run_id, measures):
+        """
+            Rows of loading_time_scans, with tag and without tag scans of the same index share a row
+        """
+        def value(key, index):
+            return measures[key][index] if index < len(measures[key]) else None
+
+        rows = []
+        for index in xrange(max(len(measures['with_tag']), len(measures['without_tag']))):
+            unit_id, unit = value('unit', index) or (None, None)
+            rows.append((website, run_id, index, value('preload', index), value('990', index),
+                         value('with_tag', index), value('layer', index), unit_id, unit,
+                         value('without_tag', index)))
+        return rows
+
+    @staticmethod
+    def result_row(website, run_id, measures):
+        """
+            Row of loading_time_results from statistics of stats.summarize, position_ok is NULL when position of the
+            tag wasn't checked
+        """
+        low, high = measures.get('slowdown_interval') or (None, None)
+        position_ok = None if measures['position'] is False else measures['position'] is True
+        return (website, run_id, measures['scans_used'], measures.get('average_with_tag'),
+                measures.get('average_without_tag'), measures.get('trimmed_with_tag'),
+                measures.get('trimmed_without_tag'), measures.get('p90_with_tag'), measures.get('p90_without_tag'),
+                measures.get('average_preload'), measures.get('average_990'), measures.get('average_layer'),
+                (measures.get('average_unit') or (None, None))[1], measures.get('failures_with_tag'),
+                measures.get('failures_without_tag'), measures.get('slowdown'), low, high,
+                position_ok, json.dumps(measures.get('breaches') or []))
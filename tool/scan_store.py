@@ -0,0 +1,100 @@
+import json
+import sqlite3
+
+from datetime import datetime
+from logging import getLogger
+
+log = getLogger('crawler')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at TEXT NOT NULL,
+    finished_at TEXT
+);
+CREATE TABLE IF NOT EXISTS scans (
+    run_id INTEGER NOT NULL,
+    website TEXT NOT NULL,
+    phase TEXT NOT NULL,
+    scan_index INTEGER NOT NULL,
+    measures TEXT NOT NULL,
+    PRIMARY KEY (run_id, website, phase, scan_index)
+);
+"""
+
+
+class ScanStore(object):
+    """
+        Durable SQLite store of scan measurements. Every scan is committed as soon as it's taken, so the run is
+        checkpointed per website, phase and scan index and can be resumed after crash.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Path to SQLite database file, it's shared between parallel workers
+        """
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+
+    def start_run(self, resume=False):
+        """
+            Starts new run or continues the last unfinished one
+        :param resume: Boolean flag indicates whenever we want to continue the last unfinished run
+        :return: Run id
+        """
+        if resume:
+            row = self.connection.execute('SELECT id FROM runs WHERE finished_at IS NULL '
+                                          'ORDER BY id DESC LIMIT 1').fetchone()
+            if row:
+                log.info('Resuming run %s' % (row[0],))
+                return row[0]
+            log.info('There is no unfinished run to resume, starting a new one')
+        with self.connection:
+            cursor = self.connection.execute('INSERT INTO runs (started_at) VALUES (?)',
+                                             (datetime.now().isoformat(),))
+        return cursor.lastrowid
+
+    def finish_run(self, run_id):
+        """
+            Marks run as finished, so it won't be resumed
+        """
+        with self.connection:
+            self.connection.execute('UPDATE runs SET finished_at = ? WHERE id = ?',
+                                    (datetime.now().isoformat(), run_id))
+
+    def add_scan(self, run_id, website, phase, scan_index, measures):
+        """
+            Commits measures of one scan
+        :param measures: JSON serializable dictionary of scan measures
+        """
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO scans (run_id, website, phase, scan_index, measures) '
+                                    'VALUES (?, ?, ?, ?, ?)',
+                                    (run_id, website, phase, scan_index, json.dumps(measures)))
+
+    def done_scans(self, run_id, website, phase):
+        """
+            Scan indexes, which are already stored for website phase of the run
+        :return: Set of scan indexes
+        """
+        rows = self.connection.execute('SELECT scan_index FROM scans WHERE run_id = ? AND website = ? AND phase = ?',
+                                       (run_id, website, phase))
+        return set(row[0] for row in rows)
+
+    def pending_scans(self, run_id, website, phase, scans_number):
+        """
+            Scan indexes of website phase of the run, which aren't stored yet
+        :param scans_number: Number of scans of the phase
+        :return: Sorted list of scan indexes
+        """
+        return sorted(set(xrange(scans_number)) - self.done_scans(run_id, website, phase))
+
+    def scans(self, run_id, website, phase):
+        """
+            Measures of website phase of the run, ordered by scan index
+        :return: List of measures dictionaries
+        """
+        rows = self.connection.execute('SELECT measures FROM scans WHERE run_id = ? AND website = ? AND phase = ? '
+                                       'ORDER BY scan_index', (run_id, website, phase))
+        return [json.loads(row[0]) for row in rows]
@@ -0,0 +1,215 @@
+import math
+import warnings
+
+import numpy
+
+# Time metrics of a website results entry, failed scans are stored as None
+TIME_METRICS = ('with_tag', 'without_tag', 'preload', 'layer', '990', 'unit')
+PERCENTILES = (50, 90, 95)
+# Maximum number of resampled values held in memory at once while bootstrapping
+BOOTSTRAP_CHUNK = 2 ** 20
+
+
+def as_float(value):
+    """
+        Converts numpy value to float, NaN (no valid samples) becomes None
+    """
+    value = float(value)
+    return None if numpy.isnan(value) else value
+
+
+def metric_values(results, website, metric):
+    """
+        Time values of metric for website, unit measures are (unit_id, load time) pairs
+    """
+    if metric == 'unit':
+        return [unit[1] for unit in results[website]['unit']]
+    return results[website][metric]
+
+
+def to_matrix(samples):
+    """
+        Packs samples of every website into one NaN padded matrix. Valid values of every row are sorted ascending and
+        NaNs (failed scans and padding) are left at the end of the row.
+    :param samples: List of lists of values or None
+    :return: Tuple (sorted matrix websites x max samples, valid value counts, failure counts)
+    """
+    width = max([len(row) for row in samples] + [1])
+    matrix = numpy.full((len(samples), width), numpy.nan)
+    failures = numpy.zeros(len(samples), dtype=int)
+    for row, values in enumerate(samples):
+        valid = [value for value in values if value is not None]
+        matrix[row, :len(valid)] = valid
+        failures[row] = len(values) - len(valid)
+    matrix.sort(axis=1)
+    return matrix, numpy.sum(~numpy.isnan(matrix), axis=1), failures
+
+
+def trimmed_mean(matrix, counts, trim):
+    """
+        Mean of every row without trim share of the lowest and the highest values
+    :param matrix: Sorted matrix from to_matrix
+    :param counts: Valid value counts of every row
+    :param trim: Share of values cut from each side, e.g. 0.1
+    """
+    cut = (counts * trim).astype(int)
+    positions = numpy.arange(matrix.shape[1])
+    mask = (positions >= cut[:, None]) & (positions < (counts - cut)[:, None])
+    kept = mask.sum(axis=1)
+    total = numpy.where(mask, numpy.nan_to_num(matrix), 0).sum(axis=1)
+    return numpy.where(kept > 0, total / numpy.maximum(kept, 1), numpy.nan)
+
+
+def bootstrap_means(matrix, counts, resamples, random_state, trim=0.0):
+    """
+        Bootstrap distribution of the trimmed mean of every row (see trimmed_mean), all rows are resampled together
+        in chunks of resamples, so at most BOOTSTRAP_CHUNK values are held in memory
+    :return: Matrix websites x resamples of resampled trimmed means
+    """
+    rows, width = matrix.shape
+    chunk = max(1, BOOTSTRAP_CHUNK // (rows * width))
+    means = numpy.empty((rows, resamples))
+    for start in xrange(0, resamples, chunk):
+        size = min(chunk, resamples - start)
+        index = (random_state.random_sample((rows, size, width)) * counts[:, None, None]).astype(int)
+        sampled = matrix[numpy.arange(rows)[:, None, None], index]
+        # Every resample has as many values as the row has valid samples, the rest is padding
+        sampled = numpy.where(numpy.arange(width) < counts[:, None, None], sampled, numpy.nan)
+        sampled.sort(axis=2)
+        means[:, start:start + size] = trimmed_mean(sampled.reshape(rows * size, width), numpy.repeat(counts, size),
+                                                    trim).reshape(rows, size)
+    return means
+
+
+def summarize(results, thresholds, trim=0.1, resamples=1000, confidence=0.95, seed=None):
+    """
+        Computes statistics of every time metric for all websites in one batched pass: failures count, mean, max,
+        percentiles and trimmed mean. Slowdown of a website is a ratio of with/without tag trimmed means, its
+        confidence interval and confidence interval of with tag minus without tag trimmed mean difference are
+        bootstrapped. Threshold breaches are evaluated against robust (trimmed mean) values and share of failed
+        page loads.
+    :param results: Results dictionary, time measurement statistics for every website
+    :param thresholds: Dictionary of slowdown, preload, 990, provider_response and failure_rate thresholds
+    :return: Returns nothing, as it changes the initial dictionary
+    """
+    websites = list(results)
+    if not websites:
+        return
+    random_state = numpy.random.RandomState(seed)
+    tail = (1 - confidence) / 2 * 100
+    statistics = {}
+    with warnings.catch_warnings():
+        # Websites without any valid sample produce NaN statistics, which are reported as None
+        warnings.simplefilter('ignore', RuntimeWarning)
+        for metric in TIME_METRICS:
+            matrix, counts, failures = to_matrix([metric_values(results, website, metric) for website in websites])
+            statistics[metric] = {
+                'matrix': matrix,
+                'counts': counts,
+                'failures': failures,
+                'average': numpy.nanmean(matrix, axis=1),
+                'max': numpy.nanmax(matrix, axis=1),
+                'percentiles': numpy.nanpercentile(matrix, PERCENTILES, axis=1),
+                'trimmed': trimmed_mean(matrix, counts, trim)
+            }
+
+        with_tag, without_tag = statistics['with_tag'], statistics['without_tag']
+        boot_with_tag = bootstrap_means(with_tag['matrix'], with_tag['counts'], resamples, random_state, trim)
+        boot_without_tag = bootstrap_means(without_tag['matrix'], without_tag['counts'], resamples, random_state,
+                                           trim)
+        difference_interval = numpy.nanpercentile(boot_with_tag - boot_without_tag, (tail, 100 - tail), axis=1)
+        slowdown_interval = numpy.nanpercentile(boot_with_tag / boot_without_tag, (tail, 100 - tail), axis=1)
+        slowdown = with_tag['trimmed'] / without_tag['trimmed']
+        # Share of failed page loads of both phases
+        loads = with_tag['counts'] + with_tag['failures'] + without_tag['counts'] + without_tag['failures']
+        failure_rate = numpy.where(loads > 0, (with_tag['failures'] + without_tag['failures']) /
+                                   numpy.maximum(loads, 1).astype(float), numpy.nan)
+
+    for row, website in enumerate(websites):
+        entry = results[website]
+        for metric in TIME_METRICS:
+            metric_statistics = statistics[metric]
+            entry['failures_%s' % metric] = int(metric_statistics['failures'][row])
+            entry['average_%s' % metric] = as_float(metric_statistics['average'][row])
+            entry['max_%s' % metric] = as_float(metric_statistics['max'][row])
+            entry['trimmed_%s' % metric] = as_float(metric_statistics['trimmed'][row])
+            for index, percentile in enumerate(PERCENTILES):
+                entry['p%s_%s' % (percentile, metric)] = as_float(metric_statistics['percentiles'][index][row])
+
+        # Template shows located unit ids and the slowest unit
+        units = [unit for unit in entry['unit'] if unit[1] is not None]
+        entry['average_unit'] = ([unit for unit in entry['unit'] if unit[0]] or None, entry['average_unit'])
+        entry['max_unit'] = max(units, key=lambda unit: unit[1]) if units else (None, None)
+
+        entry['slowdown'] = as_float(slowdown[row])
+        entry['slowdown_interval'] = (as_float(slowdown_interval[0][row]), as_float(slowdown_interval[1][row]))
+        entry['difference_interval'] = (as_float(difference_interval[0][row]),
+                                        as_float(difference_interval[1][row]))
+        entry['failure_rate'] = as_float(failure_rate[row])
+
+        entry['breaches'] = []
+        if entry['slowdown'] is not None and entry['slowdown'] > thresholds['slowdown']:
+            entry['breaches'].append('slowdown')
+        if entry['trimmed_preload'] is not None and entry['trimmed_preload'] > thresholds['preload']:
+            entry['breaches'].append('preload')
+        if entry['trimmed_990'] is not None and entry['trimmed_990'] > thresholds['990']:
+            entry['breaches'].append('990')
+        if entry['trimmed_unit'] is not None and entry['trimmed_unit'] > thresholds['provider_response']:
+            entry['breaches'].append('provider_response')
+        if entry['failure_rate'] is not None and entry['failure_rate'] > thresholds['failure_rate']:
+            entry['breaches'].append('failure_rate')
+
+
+def slowdown_interval(with_tag, without_tag, trim=0.1, resamples=1000, confidence=0.95, seed=None):
+    """
+        Bootstrap confidence interval of slowdown (ratio of with/without tag trimmed means) for one website, the
+        same way as summarize
+    :param with_tag: With tag loading times, None for failed scans
+    :param without_tag: Without tag loading times, None for failed scans
+    :return: Tuple (low, high), (None, None) if one of phases has no valid samples
+    """
+    random_state = numpy.random.RandomState(seed)
+    tail = (1 - confidence) / 2 * 100
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        with_matrix, with_counts, _ = to_matrix([with_tag])
+        without_matrix, without_counts, _ = to_matrix([without_tag])
+        ratio = (bootstrap_means(with_matrix, with_counts, resamples, random_state, trim) /
+                 bootstrap_means(without_matrix, without_counts, resamples, random_state, trim))
+        low, high = numpy.nanpercentile(ratio, (tail, 100 - tail), axis=1)
+    return as_float(low[0]), as_float(high[0])
+
+
+def average_ranks(values):
+    """
+        1-based ranks of values, tied values get the average of their ranks
+    """
+    order = numpy.argsort(values, kind='mergesort')
+    _, first, counts = numpy.unique(values[order], return_index=True, return_counts=True)
+    ranks = numpy.empty(len(values))
+    ranks[order] = numpy.repeat(first + (counts + 1) / 2.0, counts)
+    return ranks, counts
+
+
+def mann_whitney_greater(sample, baseline):
+    """
+        One-sided Mann-Whitney U test whenever sample tends to be greater than baseline, normal approximation with
+        tie and continuity correction
+    :param sample: Values of current run
+    :param baseline: Values of baseline runs
+    :return: p-value or None if one of samples is empty
+    """
+    sample = numpy.asarray(sample, dtype=float)
+    baseline = numpy.asarray(baseline, dtype=float)
+    sample_size, baseline_size = len(sample), len(baseline)
+    if not sample_size or not baseline_size:
+        return None
+    total = sample_size + baseline_size
+    ranks, ties = average_ranks(numpy.concatenate((sample, baseline)))
+    u = ranks[:sample_size].sum() - sample_size * (sample_size + 1) / 2.0
+    tie_correction = (ties ** 3 - ties).sum() / float(total * (total - 1)) if total > 1 else 0.0
+    variance = sample_size * baseline_size / 12.0 * ((total + 1) - tie_correction)
+    if variance <= 0:
+        return 1.0
+    z = (u - sample_size * baseline_size / 2.0 - 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
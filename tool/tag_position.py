@@ -0,0 +1,165 @@
+"""
+    Position of imonomy tag in a page. In a browser it's found by browser_scripts.TAG_POSITION, archived pages are
+    streamed through incremental HTML parser:
+
+        python tool/tag_position.py page.html [page.html ...]
+"""
+import sys
+
+from HTMLParser import HTMLParser
+
+# Part of src of tag script in <head> and in <body>
+HEAD_TAG_SRC = 'preload'
+BODY_TAG_SRC = 'preload.js'
+# Tag is expected among the last 30% of <body> nodes
+MIN_BODY_INDEX_RATIO = 0.7
+# Elements without closing tag
+VOID_ELEMENTS = frozenset(('area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param',
+                           'source', 'track', 'wbr'))
+# Elements, which start a block and so end open <p>
+BLOCK_ELEMENTS = frozenset(('address', 'article', 'aside', 'blockquote', 'center', 'details', 'dialog', 'dir', 'div',
+                            'dl', 'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5',
+                            'h6', 'header', 'hgroup', 'hr', 'listing', 'main', 'menu', 'nav', 'ol', 'p', 'pre',
+                            'section', 'summary', 'table', 'ul', 'li', 'dd', 'dt'))
+# Start tag -> open elements it ends, as their end tag is optional
+IMPLIED_END_TAGS = {'li': ('li',), 'dt': ('dt', 'dd'), 'dd': ('dt', 'dd'), 'option': ('option',),
+                    'optgroup': ('option', 'optgroup'), 'tr': ('tr', 'td', 'th'), 'td': ('td', 'th'),
+                    'th': ('td', 'th'), 'thead': ('thead', 'tbody', 'tfoot', 'tr', 'td', 'th'),
+                    'tbody': ('thead', 'tbody', 'tfoot', 'tr', 'td', 'th'),
+                    'tfoot': ('thead', 'tbody', 'tfoot', 'tr', 'td', 'th')}
+# Elements, which aren't crossed when looking for element with implied end tag
+SCOPE_ELEMENTS = frozenset(('html', 'body', 'table', 'caption', 'ul', 'ol', 'dl', 'select', 'button', 'object',
+                            'template', 'applet', 'marquee'))
+CHUNK_SIZE = 64 * 1024
+
+
+def verdict(position):
+    """
+        Decides whenever tag position is OK
+    :param position: Dictionary with location (head, body or missing), depth (1 for direct child of <body>), index
+                     (index of the <body> node containing the tag), count (number of <body> nodes), async and defer
+    :return: True if position is OK, otherwise tuple (False, reason)
+    """
+    if position is None:
+        return False, "Position of the tag couldn't be checked"
+    if position['location'] == 'head':
+        return False, "Tag is located in <head>"
+    if position['location'] == 'body':
+        if position['depth'] > 1:
+            return False, "Tag is located in one of <body></body> children."
+        if position['index'] / float(position['count']) < MIN_BODY_INDEX_RATIO:
+            return False, "Tag isn't located in the last 30% of <body>"
+    return True
+
+
+class PositionParser(HTMLParser):
+    """
+        Incremental parser, which finds tag the same way as browser_scripts.TAG_POSITION does. Only the stack of open
+        elements is kept, so page can be fed in chunks of any size. Optional end tags (<p>, <li>, table cells, ...)
+        and <tbody> are implied as browser does, so depth and index match DOM of the page.
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.stack = []
+        self.in_body = False
+        self.body_depth = None  # Stack size inside <body>, None before <body> starts
+        self.count = 0  # Number of <body> nodes so far
+        self.text_node = False  # Whenever last <body> node is text, consecutive data is one text node
+        self.position = {'location': 'missing'}
+
+    def body_node(self, text=False):
+        if self.in_body and len(self.stack) == self.body_depth:
+            if not (text and self.text_node):
+                self.count += 1
+            self.text_node = text
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'body' and not self.in_body:
+            self.in_body = True
+            self.stack.append(tag)
+            self.body_depth = len(self.stack)
+            return
+        self.implied_end(tag)
+        self.body_node()
+        self.check(tag, dict(attrs))
+        if tag not in VOID_ELEMENTS:
+            self.stack.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.implied_end(tag)
+        self.body_node()
+        self.check(tag, dict(attrs))
+
+    def implied_end(self, tag):
+        """
+            Pops open elements ended by start of tag, i.e. the outermost one of them in current scope with all
+            elements inside it, and opens <tbody> of a row started directly in <table>
+        """
+        ended = IMPLIED_END_TAGS.get(tag, ())
+        if tag in BLOCK_ELEMENTS:
+            ended += ('p',)
+        start = None
+        for index in xrange(len(self.stack) - 1, -1, -1):
+            if self.stack[index] in ended:
+                start = index
+            elif self.stack[index] in SCOPE_ELEMENTS:
+                break
+        if start is not None:
+            del self.stack[start:]
+        if tag == 'tr' and self.stack and self.stack[-1] == 'table':
+            self.stack.append('tbody')
+
+    def handle_endtag(self, tag):
+        if tag in self.stack:
+            while self.stack.pop() != tag:
+                pass
+        if tag == 'body':
+            self.in_body = False
+
+    def handle_data(self, data):
+        self.body_node(text=True)
+
+    def handle_comment(self, data):
+        self.body_node()
+
+    def check(self, tag, attrs):
+        if self.position['location'] != 'missing':
+            return
+        src = attrs.get('src') or ''
+        if self.body_depth is None:
+            if HEAD_TAG_SRC in src:
+                self.position = {'location': 'head', 'depth': None, 'index': None, 'count': None,
+                                 'async': 'async' in attrs, 'defer': 'defer' in attrs}
+        elif self.in_body and BODY_TAG_SRC in src:
+            self.position = {'location': 'body', 'depth': len(self.stack) - self.body_depth + 1,
+                             'index': self.count - 1, 'count': None, 'async': 'async' in attrs,
+                             'defer': 'defer' in attrs}
+
+    def result(self):
+        self.close()
+        if self.position['location'] == 'body':
+            self.position['count'] = self.count
+        return self.position
+
+
+def check_file(path):
+    """
+        Finds tag position in archived page without loading it in browser
+    :param path: Path to html file
+    :return: Position dictionary (see verdict)
+    """
+    parser = PositionParser()
+    with open(path) as file_handler:
+        for chunk in iter(lambda: file_handler.read(CHUNK_SIZE), ''):
+            parser.feed(chunk)
+    return parser.result()
+
+
+def main():
+    for path in sys.argv[1:]:
+        position = check_file(path)
+        sys.stdout.write('%s\t%s\t%s\n' % (path, verdict(position), position))
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,7 @@
 from logging import getLogger
 
+import metrics
+
 log = getLogger('crawler')
 
 
@@ -9,6 +11,7 @@ def catching(func):
             return func(*args, **kwargs)
         except Exception as e:
             log.exception('Exception in %s: %s' % (func.func_name, e))
+            metrics.increment('crawler_caught_exceptions', function=func.func_name, type=type(e).__name__)
     return wrapped
 
 
@@ -0,0 +1,219 @@
+"""
+    Shared queue of scans for distributed runs. Coordinator enqueues (website, phase, scan index) work items, worker
+    nodes lease them, run the scan and push its measures back with the item. Lease of a crashed worker expires and the
+    item is leased again, item which failed max_attempts times is given up (failed). Failed items of the run are
+    queued again when the run is resumed. SQLite backend works for workers on one machine or on a shared file system.
+"""
+import json
+import time
+import sqlite3
+
+from contextlib import contextmanager
+from logging import getLogger
+
+log = getLogger('crawler')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS work_items (
+    run_id INTEGER NOT NULL,
+    website TEXT NOT NULL,
+    phase TEXT NOT NULL,
+    scan_index INTEGER NOT NULL,
+    geo TEXT NOT NULL,
+    configuration TEXT NOT NULL,
+    check_position INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    measures TEXT,
+    merged INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (run_id, website, phase, scan_index)
+);
+CREATE INDEX IF NOT EXISTS work_items_state ON work_items (state, geo);
+"""
+
+# Item states, leased item with expired lease is available again, failed item is terminal within one run
+PENDING, LEASED, DONE, FAILED = 'pending', 'leased', 'done', 'failed'
+
+
+class WorkQueue(object):
+    """
+        SQLite work queue. Every lease is taken in an immediate transaction, so concurrent workers never get the same
+        item.
+    """
+
+    def __init__(self, path, lease_timeout, max_attempts, release_backoff=0.0):
+        """
+        :param path: Path to SQLite database file shared by coordinator and workers
+        :param lease_timeout: Seconds a worker holds an item before it's considered crashed
+        :param max_attempts: Number of leases after which item is given up
+        :param release_backoff: Seconds released item waits before it can be leased again
+        """
+        # Transactions are started explicitly, so lease can lock the database before reading
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.release_backoff = release_backoff
+
+    @contextmanager
+    def transaction(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.connection
+        except Exception:
+            self.connection.execute('ROLLBACK')
+            raise
+        self.connection.execute('COMMIT')
+
+    def enqueue(self, run_id, items):
+        """
+            Adds work items of the run, items which are already queued are kept as they are, except failed ones,
+            which get all their attempts again (resumed run)
+        :param items: List of dictionaries with website, phase, scan_index, configuration (website configuration
+                      entry) and check_position
+        """
+        with self.transaction() as connection:
+            cursor = connection.executemany(
+                'UPDATE work_items SET state = ?, attempts = 0, worker = NULL, lease_expires = NULL WHERE run_id = ? '
+                'AND website = ? AND phase = ? AND scan_index = ? AND state = ?',
+                [(PENDING, run_id, item['website'], item['phase'], item['scan_index'], FAILED) for item in items])
+            if cursor.rowcount > 0:
+                log.info('Queued %s failed scans of run %s again' % (cursor.rowcount, run_id))
+            connection.executemany(
+                'INSERT OR IGNORE INTO work_items (run_id, website, phase, scan_index, geo, configuration, '
+                'check_position, state) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(run_id, item['website'], item['phase'], item['scan_index'], item['configuration']['geo'],
+                  json.dumps(item['configuration']), int(item['check_position']), PENDING) for item in items])
+
+    def lease(self, worker, geos=None):
+        """
+            Leases the next available item, items whose attempts are used up are given up on the way
+        :param worker: Id of worker node
+        :param geos: Countries worker scans, None for all
+        :return: Item dictionary or None if there is nothing to do
+        """
+        now = time.time()
+        query = ('SELECT run_id, website, phase, scan_index, configuration, check_position, attempts FROM work_items '
+                 'WHERE (state = ? OR state = ? AND lease_expires < ?)')
+        parameters = [PENDING, LEASED, now]
+        if geos:
+            query += ' AND geo IN (%s)' % (', '.join('?' * len(geos)),)
+            parameters.extend(geos)
+        query += ' ORDER BY run_id, scan_index, website, phase LIMIT 1'
+        with self.transaction() as connection:
+            while True:
+                row = connection.execute(query, parameters).fetchone()
+                if row is None:
+                    return None
+                run_id, website, phase, scan_index, configuration, check_position, attempts = row
+                key = (run_id, website, phase, scan_index)
+                if attempts >= self.max_attempts:
+                    log.error('Giving up %s scan %s of %s after %s attempts' % (phase, scan_index, website, attempts))
+                    connection.execute('UPDATE work_items SET state = ?, worker = NULL WHERE run_id = ? AND '
+                                       'website = ? AND phase = ? AND scan_index = ?', (FAILED,) + key)
+                    continue
+                connection.execute('UPDATE work_items SET state = ?, attempts = attempts + 1, worker = ?, '
+                                   'lease_expires = ? WHERE run_id = ? AND website = ? AND phase = ? AND '
+                                   'scan_index = ?', (LEASED, worker, now + self.lease_timeout) + key)
+                return {'run_id': run_id, 'website': website, 'phase': phase, 'scan_index': scan_index,
+                        'configuration': json.loads(configuration), 'check_position': bool(check_position),
+                        'worker': worker}
+
+    def complete(self, item, measures):
+        """
+            Pushes measures of leased item back
+        :return: False if lease was lost (expired and taken by another worker), measures are dropped then
+        """
+        with self.transaction() as connection:
+            cursor = connection.execute(
+                'UPDATE work_items SET state = ?, measures = ?, lease_expires = NULL WHERE run_id = ? AND '
+                'website = ? AND phase = ? AND scan_index = ? AND state = ? AND worker = ?',
+                (DONE, json.dumps(measures), item['run_id'], item['website'], item['phase'], item['scan_index'],
+                 LEASED, item['worker']))
+        if not cursor.rowcount:
+            log.error('Lease of %s scan %s of %s was lost' % (item['phase'], item['scan_index'], item['website']))
+        return bool(cursor.rowcount)
+
+    def release(self, item):
+        """
+            Returns leased item to the queue, e.g. when worker has no healthy proxy for it. Item stays leased for
+            release_backoff seconds, so releasing worker doesn't lease it straight back and burn its attempts. Attempt
+            is counted, so item nobody can scan is given up.
+        """
+        with self.transaction() as connection:
+            connection.execute('UPDATE work_items SET worker = NULL, lease_expires = ? WHERE run_id = ? AND '
+                               'website = ? AND phase = ? AND scan_index = ? AND state = ? AND worker = ?',
+                               (time.time() + self.release_backoff, item['run_id'], item['website'], item['phase'],
+                                item['scan_index'], LEASED, item['worker']))
+
+    def done_items(self, run_id):
+        """
+            Done items of the run, which weren't merged yet
+        :return: List of tuples (website, phase, scan_index, measures)
+        """
+        rows = self.connection.execute('SELECT website, phase, scan_index, measures FROM work_items WHERE run_id = ? '
+                                       'AND state = ? AND merged = 0', (run_id, DONE))
+        return [(website, phase, scan_index, json.loads(measures)) for website, phase, scan_index, measures in rows]
+
+    def mark_merged(self, run_id, items):
+        """
+        :param items: List of tuples (website, phase, scan_index, ...) merged into results of the run
+        """
+        with self.transaction() as connection:
+            connection.executemany('UPDATE work_items SET merged = 1 WHERE run_id = ? AND website = ? AND phase = ? '
+                                   'AND scan_index = ?', [(run_id,) + tuple(item[:3]) for item in items])
+
+    def reap(self, run_id):
+        """
+            Gives up items of the run whose attempts are used up and whose last lease expired, so they don't wait for
+            a worker to lease them. Run by coordinator, which would wait for them otherwise.
+        :return: Number of items given up
+        """
+        with self.transaction() as connection:
+            cursor = connection.execute(
+                'UPDATE work_items SET state = ?, worker = NULL WHERE run_id = ? AND attempts >= ? AND '
+                '(state = ? OR state = ? AND lease_expires < ?)',
+                (FAILED, run_id, self.max_attempts, PENDING, LEASED, time.time()))
+        if cursor.rowcount:
+            log.error('Gave up %s scans of run %s after %s attempts' % (cursor.rowcount, run_id, self.max_attempts))
+        return cursor.rowcount
+
+    def give_up(self, run_id):
+        """
+            Gives up every pending and leased item of the run, e.g. when run timed out. Measures pushed by worker
+            later are dropped.
+        :return: Number of items given up
+        """
+        with self.transaction() as connection:
+            cursor = connection.execute('UPDATE work_items SET state = ?, worker = NULL WHERE run_id = ? AND '
+                                        'state IN (?, ?)', (FAILED, run_id, PENDING, LEASED))
+        return cursor.rowcount
+
+    def failed_items(self, run_id):
+        """
+        :return: List of tuples (website, phase, scan_index) of failed items of the run
+        """
+        return self.connection.execute('SELECT website, phase, scan_index FROM work_items WHERE run_id = ? AND '
+                                       'state = ? ORDER BY website, phase, scan_index', (run_id, FAILED)).fetchall()
+
+    def unfinished(self, run_id, website=None):
+        """
+            Number of items of the run (or website of the run) which are pending or leased. Leased items of crashed
+            workers count until they are reaped (see reap).
+        """
+        query = 'SELECT COUNT(*) FROM work_items WHERE run_id = ? AND state IN (?, ?)'
+        parameters = [run_id, PENDING, LEASED]
+        if website is not None:
+            query += ' AND website = ?'
+            parameters.append(website)
+        return self.connection.execute(query, parameters).fetchone()[0]
+
+    def counts(self, run_id):
+        """
+        :return: Dictionary state -> number of items of the run
+        """
+        return dict(self.connection.execute('SELECT state, COUNT(*) FROM work_items WHERE run_id = ? GROUP BY state',
+                                            (run_id,)).fetchall())